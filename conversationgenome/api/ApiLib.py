@@ -2,10 +2,12 @@ verbose = False
 
 import json
 import random
-import requests
 
 from conversationgenome.utils.Utils import Utils
+from conversationgenome.utils.AsyncHttp import AsyncHttp
+from conversationgenome.conversation.ConvoStore import get_convo_store
 from conversationgenome.ConfigLib import c
+from conversationgenome.mock.MockBt import MockBt
 
 bt = None
 try:
@@ -21,15 +23,15 @@ class ApiLib:
     async def reserveConversation(self, hotkey):
         # Call Convo server and reserve a conversation
         if c.get('env', 'SYSTEM_MODE') == 'test':
-            path = 'facebook-chat-data.json'
-            f = open(path)
-            body = f.read()
-            f.close()
-            convos = json.loads(body)
-            convoKeys = list(convos.keys())
-            convoTotal = len(convoKeys)
-            selectedConvoKey = random.choice(convoKeys)
-            selectedConvo = convos[selectedConvoKey]
+            # Served from a byte-offset index instead of parsing the whole file
+            store = get_convo_store(c.get('env', 'CGP_TEST_CONVO_PATH', 'facebook-chat-data.json'))
+            if c.get('env', 'CGP_TEST_CONVO_ORDER') == 'sequential':
+                selectedConvo = store.get_next()
+            else:
+                selectedConvo = store.get_random()
+            if not selectedConvo:
+                bt.logging.error(f"reserveConversation error. No conversations in {store.path}")
+                return None
 
             convo = {
                 "guid":Utils.get(selectedConvo, "guid"),
@@ -49,17 +51,13 @@ class ApiLib:
             read_host_port = c.get('env', 'CGP_API_READ_PORT', '443')
             http_timeout = Utils._float(c.get('env', 'HTTP_TIMEOUT', 60))
             url = f"{read_host_url}:{read_host_port}/api/v1/conversation/reserve"
-            response = None
-            try:
-                response = requests.post(url, headers=headers, json=jsonData, data=postData, cert=cert, timeout=http_timeout)
-            except requests.exceptions.Timeout as e:
-                bt.logging.error(f"reserveConversation timeout error: {e}")
+            response = await AsyncHttp.post_url(url, jsonData=jsonData, postData=postData, headers=headers, timeout=http_timeout)
             maxLines = Utils._int(c.get('env', 'MAX_CONVO_LINES', 300))
-            if response and response.status_code == 200:
-                selectedConvo = response.json()
+            if response['success'] and response['json'] is not None:
+                selectedConvo = response['json']
                 #print("selectedConvo", selectedConvo)
             else:
-                bt.logging.error(f"reserveConversation error. Response: {response}")
+                bt.logging.error(f"reserveConversation error. Response: {response['code']} {response['errors']}")
                 return None
 
 
@@ -85,18 +83,40 @@ class ApiLib:
         }
         http_timeout = Utils._float(c.get('env', 'HTTP_TIMEOUT', 60))
         try:
-            response = requests.put(url, headers=headers, json=jsonData, timeout=http_timeout)
-            if response.status_code == 200:
+            response = await AsyncHttp.post_url(url, jsonData=jsonData, headers=headers, isPut=True, timeout=http_timeout)
+            if response['success']:
                 if self.verbose:
-                    print("PUT success", response.json())
+                    print("PUT success", response['json'])
             else:
-                bt.logging.error("ERROR: 7283917: put_conversation_data ERROR", response)
+                bt.logging.error("ERROR: 7283917: put_conversation_data ERROR", response['code'], response['errors'])
                 return False
         except Exception as e:
             bt.logging.error("ERROR: 7283918: put_conversation_data RESPONSE", e)
             return False
         return True
 
+    async def put_conversation_data_bulk(self, records):
+        # records is a list of {"c_guid":..., "data":...} written in one request
+        write_host_url = c.get('env', 'CGP_API_WRITE_HOST', 'https://db.conversations.xyz')
+        write_host_port = c.get('env', 'CGP_API_WRITE_PORT', '443')
+        url = f"{write_host_url}:{write_host_port}/api/v1/conversation/records"
+        if self.verbose:
+            print(f"PUTTING {len(records)} records TO {url}")
+        headers = {
+            "Accept": "application/json",
+            "Accept-Language": "en_US",
+        }
+        http_timeout = Utils._float(c.get('env', 'HTTP_TIMEOUT', 60))
+        try:
+            response = await AsyncHttp.post_url(url, jsonData={"records": records}, headers=headers, isPut=True, timeout=http_timeout)
+            if not response['success']:
+                bt.logging.error("ERROR: 7283919: put_conversation_data_bulk ERROR", response['code'], response['errors'])
+                return False
+        except Exception as e:
+            bt.logging.error("ERROR: 7283920: put_conversation_data_bulk RESPONSE", e)
+            return False
+        return True
+
 if __name__ == "__main__":
     print("Test convo get")
     url = "https://www.google.com"
@@ -17,6 +17,7 @@
 
 
 import copy
+import time
 import torch
 import asyncio
 import argparse
@@ -30,6 +31,8 @@ from traceback import print_exception
 from conversationgenome.base.neuron import BaseNeuron
 from conversationgenome.mock.mock import MockDendrite
 from conversationgenome.utils.config import add_validator_args
+from conversationgenome.utils.CheckpointManager import CheckpointManager
+from conversationgenome.conversation.ConvoUploader import get_convo_uploader
 
 
 class BaseValidatorNeuron(BaseNeuron):
@@ -57,6 +60,17 @@ class BaseValidatorNeuron(BaseNeuron):
             self.dendrite = bt.dendrite(wallet=self.wallet)
         bt.logging.info(f"Dendrite: {self.dendrite}")
 
+        # Cached uid availability, see utils.uids.get_random_uids
+        self.available_uids_mask = None
+
+        # State checkpoints are written in the background, see save_state
+        self.checkpoints = CheckpointManager(
+            self.config.neuron.full_path,
+            keep=self.config.neuron.checkpoint_keep,
+            min_interval=self.config.neuron.checkpoint_interval,
+            min_steps=self.config.neuron.checkpoint_steps,
+        )
+
         # Set up initial scoring weights for validation
         bt.logging.info("Building validation weights.")
         self.scores = torch.zeros(
@@ -159,6 +173,9 @@ class BaseValidatorNeuron(BaseNeuron):
         # If someone intentionally stops the validator, it'll safely terminate operations.
         except KeyboardInterrupt:
             self.axon.stop()
+            self.save_state(force=True)
+            self.checkpoints.flush(timeout=30)
+            self.flush_uploads()
             bt.logging.success("Validator killed by keyboard interrupt.")
             exit()
 
@@ -191,8 +208,16 @@ class BaseValidatorNeuron(BaseNeuron):
             self.should_exit = True
             self.thread.join(5)
             self.is_running = False
+            self.checkpoints.flush(timeout=30)
+            self.flush_uploads()
             bt.logging.debug("Stopped")
 
+    def flush_uploads(self):
+        # Buffered bulk uploads would otherwise be lost on shutdown
+        uploader = get_convo_uploader()
+        if uploader:
+            uploader.close(self.loop, timeout=30)
+
     def __enter__(self):
         self.run_in_background_thread()
         return self
@@ -215,6 +240,8 @@ class BaseValidatorNeuron(BaseNeuron):
             self.should_exit = True
             self.thread.join(5)
             self.is_running = False
+            self.checkpoints.flush(timeout=30)
+            self.flush_uploads()
             bt.logging.debug("Stopped")
 
     def set_weights(self):
@@ -278,103 +305,137 @@ class BaseValidatorNeuron(BaseNeuron):
         else:
             bt.logging.error("set_weights failed", msg)
 
+    @staticmethod
+    def axon_fingerprints(axons) -> torch.LongTensor:
+        """One hash per uid of the axon fields that matter for querying, used to spot metagraph changes without keeping a copy of it."""
+        return torch.tensor(
+            [
+                hash((axon.ip, axon.port, axon.ip_type, axon.version, axon.hotkey, axon.coldkey, getattr(axon, "protocol", None)))
+                for axon in axons
+            ],
+            dtype=torch.int64,
+        )
+
+    @staticmethod
+    def hotkey_fingerprints(hotkeys) -> torch.LongTensor:
+        return torch.tensor([hash(hotkey) for hotkey in hotkeys], dtype=torch.int64)
+
     def resync_metagraph(self):
         """Resyncs the metagraph and updates the hotkeys and moving averages based on the new metagraph."""
         bt.logging.info("resync_metagraph()")
+        start_time = time.time()
 
-        # Copies state of metagraph before syncing.
-        previous_metagraph = copy.deepcopy(self.metagraph)
+        # Fingerprint of the axons before syncing. Kept between resyncs, so it is
+        # only built from the current metagraph the first time.
+        previous_fingerprints = getattr(self, "axon_fingerprint", None)
+        if previous_fingerprints is None:
+            previous_fingerprints = self.axon_fingerprints(self.metagraph.axons)
 
         # Sync the metagraph.
         self.metagraph.sync(subtensor=self.subtensor)
+        # Stakes and axons may have changed, recompute availability on next use
+        self.available_uids_mask = None
+        self.axon_fingerprint = self.axon_fingerprints(self.metagraph.axons)
 
         # Check if the metagraph axon info has changed.
-        if previous_metagraph.axons == self.metagraph.axons:
+        if torch.equal(previous_fingerprints, self.axon_fingerprint):
+            bt.logging.debug(f"Metagraph unchanged. resync_metagraph took {time.time() - start_time:.2f} seconds")
             return
 
         bt.logging.info(
             "Metagraph updated, re-syncing hotkeys, dendrite pool and moving averages"
         )
         # Zero out all hotkeys that have been replaced.
-        for uid, hotkey in enumerate(self.hotkeys):
-            if hotkey != self.metagraph.hotkeys[uid]:
-                self.scores[uid] = 0  # hotkey has been replaced
+        old_hotkeys = self.hotkey_fingerprints(self.hotkeys)
+        new_hotkeys = self.hotkey_fingerprints(self.metagraph.hotkeys)
+        overlap = min(len(old_hotkeys), len(new_hotkeys), len(self.scores))
+        replaced = (old_hotkeys[:overlap] != new_hotkeys[:overlap]).to(self.scores.device)
+        self.scores[:overlap].masked_fill_(replaced, 0)  # hotkey has been replaced
 
         # Check to see if the metagraph has changed size.
         # If so, we need to add new hotkeys and moving averages.
-        if len(self.hotkeys) < len(self.metagraph.hotkeys):
+        if len(self.scores) < len(new_hotkeys):
             # Update the size of the moving average scores.
-            new_moving_average = torch.zeros((self.metagraph.n)).to(
-                self.device
+            new_moving_average = torch.zeros(
+                len(new_hotkeys), dtype=self.scores.dtype, device=self.scores.device
             )
-            min_len = min(len(self.hotkeys), len(self.scores))
-            new_moving_average[:min_len] = self.scores[:min_len]
+            new_moving_average[: len(self.scores)] = self.scores
             self.scores = new_moving_average
 
-        # Update the hotkeys.
-        self.hotkeys = copy.deepcopy(self.metagraph.hotkeys)
+        # Update the hotkeys. The strings are immutable, so a shallow copy is enough.
+        self.hotkeys = list(self.metagraph.hotkeys)
+        bt.logging.info(
+            f"Reset {int(replaced.sum().item())} replaced hotkeys, {len(self.hotkeys)} uids. resync_metagraph took {time.time() - start_time:.2f} seconds"
+        )
 
-    def update_scores(self, rewards: torch.FloatTensor, uids: List[int]):
-        """Performs exponential moving average on the scores based on the rewards received from the miners."""
+    def update_scores(self, rewards, uids=None):
+        """Performs exponential moving average on the scores based on the rewards received from the miners.
 
-        # Check if rewards contains NaN values.
-        if torch.isnan(rewards).any():
-            bt.logging.warning(f"NaN values detected in rewards: {rewards}")
-            # Replace any NaN values in rewards with 0.
-            rewards = torch.nan_to_num(rewards, 0)
-
-        # Check if `uids` is already a tensor and clone it to avoid the warning.
-        if isinstance(uids, torch.Tensor):
-            uids_tensor = uids.clone().detach()
+        Accepts either one set (rewards, uids) or a list of (rewards, uids) sets from several windows as the only argument. Sets are applied in order, in place on self.scores.
+        """
+        if uids is None:
+            reward_sets = rewards
         else:
-            uids_tensor = torch.tensor(uids).to(self.device)
-
-        # Compute forward pass rewards, assumes uids are mutually exclusive.
-        # shape: [ metagraph.n ]
-        #print("SCATTER DEVICE", self.scores.device)
-        uids_tensor = uids_tensor.to(self.scores.device)
-        rewards2 = rewards.to(self.scores.device)
-        rewards2 = torch.ones(len(uids_tensor), device=self.device)
-        for idx, reward in enumerate(rewards):
-            rewards2[idx] = rewards[idx] #random.random() #
-        #print(f"BEFORE SCATTER uids_tensor: {uids_tensor} rewards: {rewards} rewards2: {rewards2}")
+            reward_sets = [(rewards, uids)]
+        if len(reward_sets) == 0:
+            return
 
+        device = self.scores.device
+        uids_list = []
+        rewards_list = []
+        for (set_rewards, set_uids) in reward_sets:
+            uids_list.append(torch.as_tensor(set_uids, dtype=torch.long).to(device))
+            rewards_list.append(torch.as_tensor(set_rewards, dtype=self.scores.dtype).to(device))
+        uids_tensor = torch.cat(uids_list)
+        rewards_tensor = torch.cat(rewards_list)
 
-        scattered_rewards: torch.FloatTensor = self.scores.scatter(
-            0, uids_tensor, rewards
-        ).to(self.device)
+        # Check if rewards contains NaN values.
+        if torch.isnan(rewards_tensor).any():
+            bt.logging.warning(f"NaN values detected in rewards: {rewards_tensor}")
+            # Replace any NaN values in rewards with 0.
+            rewards_tensor = torch.nan_to_num(rewards_tensor, 0)
 
-        bt.logging.debug(f"Scattered rewards: {rewards}")
+        bt.logging.debug(f"Scattered rewards: {rewards_tensor}")
 
-        # Update scores with rewards produced by this step.
-        # shape: [ metagraph.n ]
+        # Uids that weren't rewarded keep their score, so the EMA only has to
+        # touch the rewarded entries: score += alpha * (reward - score).
         alpha: float = self.config.neuron.moving_average_alpha
-        self.scores: torch.FloatTensor = alpha * scattered_rewards + (
-            1 - alpha
-        ) * self.scores.to(self.device)
+        if len(reward_sets) == 1 or len(torch.unique(uids_tensor)) == len(uids_tensor):
+            current = self.scores.index_select(0, uids_tensor)
+            self.scores.index_copy_(0, uids_tensor, current.lerp_(rewards_tensor, alpha))
+        else:
+            # A uid rewarded in several windows gets one EMA step per window
+            offset = 0
+            for set_uids in uids_list:
+                end = offset + len(set_uids)
+                current = self.scores.index_select(0, set_uids)
+                self.scores.index_copy_(0, set_uids, current.lerp_(rewards_tensor[offset:end], alpha))
+                offset = end
 
         bt.logging.debug(f"Updated moving avg scores: {self.scores}")
 
-    def save_state(self):
-        """Saves the state of the validator to a file."""
-        bt.logging.info("Saving validator state.")
-
-        # Save the state of the validator to file.
-        torch.save(
-            {
+    def save_state(self, force=False):
+        """Saves the state of the validator to a checkpoint. Writing happens in a background thread and is throttled unless force is set."""
+        saved = self.checkpoints.maybe_save(
+            self.step,
+            lambda: {
                 "step": self.step,
-                "scores": self.scores,
-                "hotkeys": self.hotkeys,
+                "scores": self.scores.detach().cpu().clone(),
+                "hotkeys": list(self.hotkeys),
             },
-            self.config.neuron.full_path + "/state.pt",
+            force=force,
         )
+        if saved:
+            bt.logging.info("Saving validator state.")
 
     def load_state(self):
-        """Loads the state of the validator from a file."""
+        """Loads the state of the validator from the newest valid checkpoint."""
         bt.logging.info("Loading validator state.")
 
-        # Load the state of the validator from file.
-        state = torch.load(self.config.neuron.full_path + "/state.pt")
+        state = self.checkpoints.load_latest()
+        if state is None:
+            bt.logging.warning("No valid validator state found, starting fresh.")
+            return
         self.step = state["step"]
-        self.scores = state["scores"]
+        self.scores = state["scores"].to(self.device)
         self.hotkeys = state["hotkeys"]
@@ -4,6 +4,7 @@ from conversationgenome.utils.Utils import Utils
 from conversationgenome.ConfigLib import c
 
 from conversationgenome.api.ApiLib import ApiLib
+from conversationgenome.conversation.ConvoUploader import get_convo_uploader
 
 
 class ConvoLib:
@@ -28,6 +29,11 @@ class ConvoLib:
             "netuid": c.get("system", "netuid"),
             "data": data,
         }
+        uploader = get_convo_uploader()
+        if uploader:
+            # Buffered and written in bulk by a background task
+            uploader.add(c_guid, output, batch_num=batch_num)
+            return True
         api = ApiLib()
         result = await api.put_conversation_data(c_guid, output)
         return result
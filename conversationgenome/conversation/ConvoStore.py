@@ -0,0 +1,183 @@
+import json
+import os
+import random
+import threading
+
+from conversationgenome.ConfigLib import c
+
+
+# Read-only conversation source for test mode. The corpus is one large JSON
+# object ({"24": {...conversation...}, "25": {...}}). Instead of parsing it on
+# every reservation, the file is scanned once to record the byte offset and
+# length of each conversation. The index is saved next to the file and keyed
+# by its size and mtime. After that, serving a conversation is one seek plus a
+# json.loads of that conversation only.
+class ConvoStore:
+    verbose = False
+    index_version = 1
+    chunk_size = 1024 * 1024
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".idx"
+        self.keys = []
+        self.offsets = []
+        self.position = 0
+        self.lock = threading.Lock()
+        self.load_index()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def file_signature(self):
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+    def load_index(self):
+        signature = self.file_signature()
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('version') == self.index_version and index.get('size') == signature['size'] and index.get('mtime') == signature['mtime']:
+                self.keys = index['keys']
+                self.offsets = index['offsets']
+                return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"WARNING 5512301: Rebuilding unreadable conversation index {self.index_path}: {e}")
+
+        (self.keys, self.offsets) = self.build_index()
+        index = {"version": self.index_version, "size": signature['size'], "mtime": signature['mtime'], "keys": self.keys, "offsets": self.offsets}
+        tmp_path = self.index_path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            # Read-only data directories still work, the index is just rebuilt next run
+            print(f"WARNING 5512302: Could not save conversation index {self.index_path}: {e}")
+
+    def build_index(self):
+        # Streams the file in chunks and walks the top-level object with
+        # raw_decode, so the whole corpus is never held in memory at once.
+        decoder = json.JSONDecoder()
+        keys = []
+        offsets = []
+        buffer = ""
+        pos = 0
+        # Byte offset in the file of buffer[counted]
+        counted = 0
+        counted_bytes = 0
+        started = False
+        eof = False
+        with open(self.path, "rb") as f:
+            reader = _Utf8Reader(f, self.chunk_size)
+            while True:
+                # Skip whitespace and separators between entries
+                while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                    pos += 1
+                need_more = pos >= len(buffer)
+                if not need_more:
+                    if not started:
+                        if buffer[pos] != "{":
+                            raise ValueError(f"{self.path} is not a JSON object of conversations")
+                        started = True
+                        pos += 1
+                        continue
+                    if buffer[pos] == "}":
+                        break
+
+                    # Parse "key": value. Read more when either is cut off by the chunk boundary.
+                    try:
+                        (key, key_end) = decoder.raw_decode(buffer, pos)
+                        value_start = key_end
+                        while value_start < len(buffer) and buffer[value_start] in " \t\r\n:":
+                            value_start += 1
+                        (value, value_end) = decoder.raw_decode(buffer, value_start)
+                        need_more = value_end >= len(buffer) and not eof
+                    except ValueError:
+                        if eof:
+                            raise
+                        need_more = True
+
+                if need_more:
+                    if eof:
+                        break
+                    # Drop the consumed part of the buffer before reading the next chunk
+                    counted_bytes += len(buffer[counted:pos].encode("utf-8"))
+                    buffer = buffer[pos:]
+                    pos = 0
+                    counted = 0
+                    chunk = reader.read()
+                    eof = chunk == ""
+                    buffer += chunk
+                    continue
+
+                counted_bytes += len(buffer[counted:value_start].encode("utf-8"))
+                byte_length = len(buffer[value_start:value_end].encode("utf-8"))
+                keys.append(key)
+                offsets.append([counted_bytes, byte_length])
+                counted_bytes += byte_length
+                counted = value_end
+                pos = value_end
+        if self.verbose:
+            print(f"Indexed {len(offsets)} conversations in {self.path}")
+        return (keys, offsets)
+
+    def get(self, idx):
+        (start, length) = self.offsets[idx]
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            body = f.read(length)
+        return json.loads(body)
+
+    def get_random(self):
+        if len(self.offsets) == 0:
+            return None
+        return self.get(random.randrange(len(self.offsets)))
+
+    def get_next(self):
+        # Sequential order, wrapping around at the end of the corpus
+        if len(self.offsets) == 0:
+            return None
+        with self.lock:
+            idx = self.position % len(self.offsets)
+            self.position = idx + 1
+        return self.get(idx)
+
+
+class _Utf8Reader:
+    # Reads text in chunks without splitting multi-byte characters
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.pending = b""
+
+    def read(self):
+        data = self.pending + self.f.read(self.chunk_size)
+        if not data:
+            return ""
+        try:
+            text = data.decode("utf-8")
+            self.pending = b""
+        except UnicodeDecodeError as e:
+            if e.start < len(data) - 3:
+                raise
+            text = data[:e.start].decode("utf-8")
+            self.pending = data[e.start:]
+        return text
+
+
+convo_stores = {}
+convo_stores_lock = threading.Lock()
+
+def get_convo_store(path=None):
+    if not path:
+        path = c.get('env', 'CGP_TEST_CONVO_PATH', 'facebook-chat-data.json')
+    with convo_stores_lock:
+        store = convo_stores.get(path)
+        if not store:
+            store = ConvoStore(path)
+            convo_stores[path] = store
+    return store
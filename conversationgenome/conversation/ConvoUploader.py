@@ -0,0 +1,188 @@
+import asyncio
+import atexit
+import json
+import os
+import threading
+import time
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+
+from conversationgenome.api.ApiLib import ApiLib
+
+
+# Buffers conversation records per batch_num and writes each batch to the
+# write API as one bulk request. Batches flush when they reach max_records or
+# when their oldest record is older than flush_interval. Flushing runs in a
+# task on the caller's event loop so scoring never waits on the write API.
+# Batches that fail are appended to a local JSONL journal and replayed later.
+# On shutdown close() flushes what is still buffered, and anything that could
+# not be sent is journaled instead of being dropped.
+class ConvoUploader:
+    verbose = False
+    max_records = 50
+    flush_interval = 5.0
+    journal_path = "upload_journal.jsonl"
+
+    def __init__(self, max_records=None, flush_interval=None, journal_path=None):
+        if max_records:
+            self.max_records = max_records
+        if flush_interval:
+            self.flush_interval = flush_interval
+        if journal_path:
+            self.journal_path = journal_path
+        self.buffers = {}
+        self.pending = set()
+        self.task = None
+        self.journal_lock = threading.Lock()
+        self.counts = {"records":0, "flushes":0, "failed_flushes":0, "journaled":0, "replayed":0}
+
+    def add(self, c_guid, record, batch_num=None):
+        buffer = self.buffers.get(batch_num)
+        if buffer is None:
+            buffer = {"created_at": time.time(), "records": []}
+            self.buffers[batch_num] = buffer
+        buffer['records'].append({"c_guid": c_guid, "data": record})
+        self.counts['records'] += 1
+        self.start()
+        if len(buffer['records']) >= self.max_records:
+            self.schedule_flush(batch_num)
+
+    def start(self):
+        # Background flusher for buffers that never fill up
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.task.done() or self.task.get_loop() is not loop:
+            self.task = loop.create_task(self.run())
+
+    def schedule_flush(self, batch_num):
+        buffer = self.buffers.pop(batch_num, None)
+        if not buffer or len(buffer['records']) == 0:
+            return
+        task = asyncio.get_running_loop().create_task(self.send(batch_num, buffer['records']))
+        # Keep a reference so the task isn't garbage collected before it finishes
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            now = time.time()
+            for batch_num, buffer in list(self.buffers.items()):
+                if now - buffer['created_at'] >= self.flush_interval:
+                    self.schedule_flush(batch_num)
+            await self.replay_journal()
+
+    async def flush(self):
+        # Sends everything that is buffered and waits for in-flight uploads
+        for batch_num in list(self.buffers.keys()):
+            self.schedule_flush(batch_num)
+        if self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+
+    def journal_buffered(self):
+        # Synchronous fallback for shutdown paths without a usable event loop
+        records = []
+        for batch_num in list(self.buffers.keys()):
+            buffer = self.buffers.pop(batch_num, None)
+            if buffer:
+                records.extend(buffer['records'])
+        if records:
+            self.write_journal(records)
+        return len(records)
+
+    def close(self, loop=None, timeout=30):
+        # Called from the validator's shutdown paths, outside the event loop.
+        # Flushes on loop when it is idle, then journals whatever is left.
+        if loop is not None and not loop.is_closed() and not loop.is_running():
+            if self.task:
+                self.task.cancel()
+            try:
+                loop.run_until_complete(asyncio.wait_for(self.flush(), timeout=timeout))
+            except Exception as e:
+                print(f"ERROR 6624313: Could not flush uploads on shutdown: {e}")
+        journaled = self.journal_buffered()
+        if journaled:
+            print(f"Journaled {journaled} unsent records to {self.journal_path} on shutdown")
+
+    async def send(self, batch_num, records):
+        api = ApiLib()
+        success = False
+        try:
+            success = await api.put_conversation_data_bulk(records)
+        except asyncio.CancelledError:
+            # Shutdown gave up waiting, keep the records for the next run
+            self.write_journal(records)
+            raise
+        except Exception as e:
+            print(f"ERROR 6624310: Bulk upload of batch {batch_num} failed: {e}")
+        if success:
+            self.counts['flushes'] += 1
+            if self.verbose:
+                print(f"Uploaded {len(records)} records for batch {batch_num}")
+        else:
+            self.counts['failed_flushes'] += 1
+            await asyncio.to_thread(self.write_journal, records)
+        return success
+
+    def write_journal(self, records):
+        if not self.journal_path:
+            return
+        with self.journal_lock:
+            try:
+                with open(self.journal_path, "a") as f:
+                    for record in records:
+                        f.write(json.dumps(record) + "\n")
+                self.counts['journaled'] += len(records)
+            except Exception as e:
+                print(f"ERROR 6624311: Could not write {len(records)} records to upload journal {self.journal_path}: {e}")
+
+    def take_journal(self):
+        # Moves the journal aside and returns its records. Records that fail
+        # again are appended to a fresh journal by send().
+        if not self.journal_path or not os.path.exists(self.journal_path):
+            return []
+        records = []
+        with self.journal_lock:
+            replay_path = self.journal_path + ".replay"
+            try:
+                os.replace(self.journal_path, replay_path)
+                with open(replay_path) as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            records.append(json.loads(line))
+                os.remove(replay_path)
+            except Exception as e:
+                print(f"ERROR 6624312: Could not read upload journal {self.journal_path}: {e}")
+        return records
+
+    async def replay_journal(self):
+        records = await asyncio.to_thread(self.take_journal)
+        for start in range(0, len(records), self.max_records):
+            chunk = records[start:start + self.max_records]
+            if await self.send("journal", chunk):
+                self.counts['replayed'] += len(chunk)
+
+    def stats(self):
+        out = dict(self.counts)
+        out['buffered'] = sum([len(buffer['records']) for buffer in self.buffers.values()])
+        out['in_flight'] = len(self.pending)
+        return out
+
+
+convo_uploader = None
+
+def get_convo_uploader():
+    # Process-wide uploader. Returns None unless CGP_BULK_UPLOAD=1.
+    global convo_uploader
+    if not Utils._int(c.get('env', 'CGP_BULK_UPLOAD', 0), 0):
+        return None
+    if not convo_uploader:
+        convo_uploader = ConvoUploader(
+            max_records=Utils._int(c.get('env', 'CGP_BULK_UPLOAD_SIZE'), None),
+            flush_interval=Utils._float(c.get('env', 'CGP_BULK_UPLOAD_INTERVAL'), None),
+            journal_path=c.get('env', 'CGP_BULK_UPLOAD_JOURNAL'),
+        )
+        # Last resort if the process exits without the validator's shutdown path
+        atexit.register(convo_uploader.journal_buffered)
+    return convo_uploader
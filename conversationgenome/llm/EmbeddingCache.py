@@ -0,0 +1,164 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+
+
+# Tag embedding cache shared by the validator and miner. Lookups go to an
+# in-process LRU first, then to a local SQLite store (vectors kept as float32
+# blobs) so common tags ("music", "travel", ...) are only embedded once per
+# embeddings model. WAL mode lets a validator and miner on the same box share
+# one store file.
+#
+# Vectors are held as array('f') (4 bytes per value, about 6 KB per 1536-dim
+# tag), so the default LRU stays around 60 MB. Callers get plain lists back.
+# The async methods run SQLite work in a worker thread so the event loop isn't
+# blocked on disk.
+class EmbeddingCache:
+    verbose = False
+    max_items = 10000
+    db_path = None
+
+    sql_create = """CREATE TABLE IF NOT EXISTS embeddings (
+        "model"	TEXT NOT NULL,
+        "tag"	TEXT NOT NULL,
+        "dim"	INTEGER,
+        "vector"	BLOB,
+        "created_at"	TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY("model", "tag")
+    )"""
+
+    def __init__(self, db_path=None, max_items=None):
+        if max_items:
+            self.max_items = max_items
+        self.db_path = db_path
+        self.lru = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.counts = {"memory_hits":0, "disk_hits":0, "misses":0, "stores":0}
+        if self.db_path:
+            try:
+                self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.execute(self.sql_create)
+                self.conn.commit()
+            except Exception as e:
+                print(f"ERROR 8301251: EmbeddingCache could not open {self.db_path}: {e}. Using memory only.")
+                self.conn = None
+
+    @staticmethod
+    def normalize_tag(text):
+        return " ".join(str(text).strip().lower().split())
+
+    def _remember(self, key, vectors):
+        self.lru[key] = vectors
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.max_items:
+            self.lru.popitem(last=False)
+
+    def get_many(self, model, texts):
+        # Returns a list aligned with texts. Misses are None.
+        out = [None] * len(texts)
+        disk_lookups = {}
+        with self.lock:
+            for idx, text in enumerate(texts):
+                key = (model, self.normalize_tag(text))
+                vectors = self.lru.get(key)
+                if vectors is not None:
+                    self.lru.move_to_end(key)
+                    self.counts['memory_hits'] += 1
+                    out[idx] = vectors.tolist()
+                else:
+                    disk_lookups.setdefault(key[1], []).append(idx)
+
+            if disk_lookups and self.conn:
+                tags = list(disk_lookups.keys())
+                # Stay below SQLite's host parameter limit
+                for start in range(0, len(tags), 500):
+                    chunk = tags[start:start+500]
+                    questions = ",".join(["?"] * len(chunk))
+                    try:
+                        rows = self.conn.execute(f"SELECT tag, vector FROM embeddings WHERE model = ? AND tag IN ({questions})", [model] + chunk).fetchall()
+                    except Exception as e:
+                        print(f"ERROR 8301252: EmbeddingCache read failed: {e}")
+                        rows = []
+                    for tag, blob in rows:
+                        vectors = array('f')
+                        vectors.frombytes(blob)
+                        self._remember((model, tag), vectors)
+                        for idx in disk_lookups.pop(tag, []):
+                            self.counts['disk_hits'] += 1
+                            out[idx] = vectors.tolist()
+
+            for idxs in disk_lookups.values():
+                self.counts['misses'] += len(idxs)
+        return out
+
+    def get(self, model, text):
+        return self.get_many(model, [text])[0]
+
+    def set_many(self, model, texts, vectors_list):
+        rows = []
+        with self.lock:
+            for text, vectors in zip(texts, vectors_list):
+                if not vectors:
+                    continue
+                tag = self.normalize_tag(text)
+                vectors = array('f', vectors)
+                self._remember((model, tag), vectors)
+                rows.append((model, tag, len(vectors), vectors.tobytes()))
+            self.counts['stores'] += len(rows)
+            if rows and self.conn:
+                try:
+                    self.conn.executemany("INSERT OR REPLACE INTO embeddings (model, tag, dim, vector) VALUES (?, ?, ?, ?)", rows)
+                    self.conn.commit()
+                except Exception as e:
+                    print(f"ERROR 8301253: EmbeddingCache write failed: {e}")
+
+    def set(self, model, text, vectors):
+        self.set_many(model, [text], [vectors])
+
+    async def get_many_async(self, model, texts):
+        if self.conn:
+            return await asyncio.to_thread(self.get_many, model, texts)
+        return self.get_many(model, texts)
+
+    async def set_many_async(self, model, texts, vectors_list):
+        if self.conn:
+            return await asyncio.to_thread(self.set_many, model, texts, vectors_list)
+        return self.set_many(model, texts, vectors_list)
+
+    def stats(self):
+        hits = self.counts['memory_hits'] + self.counts['disk_hits']
+        lookups = hits + self.counts['misses']
+        out = dict(self.counts)
+        out['hits'] = hits
+        out['lookups'] = lookups
+        out['hit_rate'] = hits / lookups if lookups else 0.0
+        out['memory_items'] = len(self.lru)
+        return out
+
+
+embedding_cache = None
+embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache():
+    # Process-wide cache instance. Returns None when EMBEDDINGS_CACHE=0.
+    # Memory only unless EMBEDDINGS_CACHE_PATH is set.
+    global embedding_cache
+    if not Utils._int(c.get('env', 'EMBEDDINGS_CACHE', 1), 1):
+        return None
+    with embedding_cache_lock:
+        if not embedding_cache:
+            db_path = c.get('env', 'EMBEDDINGS_CACHE_PATH')
+            if db_path:
+                db_path = os.path.expanduser(db_path)
+            max_items = Utils._int(c.get('env', 'EMBEDDINGS_CACHE_SIZE'), None)
+            embedding_cache = EmbeddingCache(db_path=db_path, max_items=max_items)
+    return embedding_cache
@@ -1,10 +1,16 @@
+import asyncio
+import copy
 import json
 import os
+import threading
+import time
+from collections import deque
 
 from dotenv import load_dotenv
 import numpy as np
 
 from conversationgenome.ConfigLib import c
+from conversationgenome.utils.Utils import Utils
 from conversationgenome.mock.MockBt import MockBt
 #from conversationgenome.llm.llm_openai import llm_openai
 
@@ -21,10 +27,25 @@ except:
 class LlmLib:
     verbose = False
     factory_llm = None
-
-    async def generate_llm_instance(self, llm_type=None):
-        if not llm_type:
-            llm_type = c.get("env", "LLM_TYPE")
+    # Process-wide adapters keyed by (LLM_TYPE, model). Adapters hold API
+    # clients, connection pools and local models, so they are built once.
+    instances = {}
+    instances_lock = threading.Lock()
+    # Hedging. Recent call latencies per LLM type feed the delay after which
+    # a slow primary is raced against the next adapter in LLM_HEDGE_TYPES.
+    latency_window = 200
+    hedge_min_samples = 20
+    hedge_default_delay = 5.0
+    hedge_percentile = 0.95
+    latencies = {}
+    hedge_counts = {"calls":0, "hedged":0, "hedge_wins":0, "fallbacks":0}
+
+    @staticmethod
+    def get_instance_key(llm_type):
+        model = c.get("env", llm_type.upper() + "_MODEL")
+        return (llm_type, model)
+
+    def create_llm_instance(self, llm_type):
         llm_class = "llm_"+llm_type
         if self.verbose:
             bt.logging.info("Factory generate LLM class of type %s" % (llm_type))
@@ -47,9 +68,145 @@ class LlmLib:
 
         return out
 
+    def get_llm_instance(self, llm_type=None):
+        if not llm_type:
+            llm_type = c.get("env", "LLM_TYPE")
+        key = LlmLib.get_instance_key(llm_type)
+        instance = LlmLib.instances.get(key)
+        if instance:
+            return instance
+        # Construction is synchronous, so the lock also covers concurrent coroutines
+        with LlmLib.instances_lock:
+            instance = LlmLib.instances.get(key)
+            if not instance:
+                instance = self.create_llm_instance(llm_type)
+                if instance:
+                    LlmLib.instances[key] = instance
+        return instance
+
+    async def generate_llm_instance(self, llm_type=None):
+        return self.get_llm_instance(llm_type)
+
+    def warmup(self, llm_type=None):
+        # Called at neuron startup so the first synapse doesn't pay for imports,
+        # client setup or model loading.
+        start = time.time()
+        try:
+            instance = self.get_llm_instance(llm_type)
+            if instance and hasattr(instance, "warmup"):
+                instance.warmup()
+        except Exception as e:
+            bt.logging.error(f"ERROR 4418270: LLM warmup failed: {e}")
+            return False
+        if not instance:
+            return False
+        bt.logging.info(f"LLM {LlmLib.get_instance_key(llm_type or c.get('env', 'LLM_TYPE'))} ready in {time.time() - start:.2f} seconds")
+        return True
+
+    @staticmethod
+    def record_latency(llm_type, seconds):
+        samples = LlmLib.latencies.get(llm_type)
+        if samples is None:
+            samples = deque(maxlen=LlmLib.latency_window)
+            LlmLib.latencies[llm_type] = samples
+        samples.append(seconds)
+
+    @staticmethod
+    def get_latency_percentile(llm_type, percentile):
+        samples = LlmLib.latencies.get(llm_type)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(percentile * (len(ordered) - 1))]
+
+    def get_hedge_delay(self, llm_type):
+        # p95 of recent calls once there are enough of them, LLM_HEDGE_DELAY before that
+        samples = LlmLib.latencies.get(llm_type)
+        if not samples or len(samples) < self.hedge_min_samples:
+            return Utils._float(c.get('env', 'LLM_HEDGE_DELAY'), self.hedge_default_delay)
+        return self.get_latency_percentile(llm_type, self.hedge_percentile)
+
+    def latency_stats(self):
+        out = dict(LlmLib.hedge_counts)
+        for llm_type, samples in LlmLib.latencies.items():
+            out[llm_type] = {"count": len(samples), "p50": self.get_latency_percentile(llm_type, 0.5), "p95": self.get_latency_percentile(llm_type, 0.95)}
+        return out
+
+    async def timed_conversation_to_metadata(self, llm_type, conversation):
+        instance = self.get_llm_instance(llm_type)
+        if not instance:
+            return None
+        start = time.time()
+        try:
+            result = await instance.conversation_to_metadata(conversation)
+        except asyncio.CancelledError:
+            # A cancelled loser still ran at least this long, keep the tail visible
+            LlmLib.record_latency(llm_type, time.time() - start)
+            raise
+        LlmLib.record_latency(llm_type, time.time() - start)
+        return result
+
+    async def hedged_conversation_to_metadata(self, conversation, llm_types):
+        # Starts the primary adapter. If it hasn't answered within its hedge
+        # delay, or returns nothing usable, the next adapter is started too.
+        # The first result with tags wins and the others are cancelled.
+        LlmLib.hedge_counts['calls'] += 1
+        tasks = {}
+        pending = set()
+        def launch(llm_type):
+            # Each adapter gets its own copy of the lines
+            task = asyncio.ensure_future(self.timed_conversation_to_metadata(llm_type, copy.deepcopy(conversation)))
+            tasks[task] = llm_type
+            pending.add(task)
+
+        launch(llm_types[0])
+        next_idx = 1
+        fallback_result = None
+        try:
+            while pending:
+                timeout = None
+                if next_idx < len(llm_types):
+                    timeout = self.get_hedge_delay(llm_types[next_idx - 1])
+                (done, _) = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        bt.logging.error(f"ERROR 4418271: LLM {tasks[task]} failed: {e}")
+                        result = None
+                    if Utils.get(result, 'tags'):
+                        if tasks[task] != llm_types[0]:
+                            LlmLib.hedge_counts['hedge_wins'] += 1
+                        return result
+                    if fallback_result is None:
+                        fallback_result = result
+
+                # Either the wait timed out, or everything that finished came
+                # back without tags (a result with tags returned above)
+                if next_idx < len(llm_types):
+                    if not done:
+                        LlmLib.hedge_counts['hedged'] += 1
+                        bt.logging.debug(f"LLM {llm_types[next_idx - 1]} slow, hedging with {llm_types[next_idx]}")
+                    else:
+                        LlmLib.hedge_counts['fallbacks'] += 1
+                        bt.logging.debug(f"LLM {llm_types[next_idx - 1]} returned no tags, falling back to {llm_types[next_idx]}")
+                    launch(llm_types[next_idx])
+                    next_idx += 1
+        finally:
+            for task in pending:
+                task.cancel()
+        return fallback_result
+
     async def conversation_to_metadata(self,  conversation):
+        hedge_types = [llm_type.strip() for llm_type in (c.get('env', 'LLM_HEDGE_TYPES') or '').split(',') if llm_type.strip()]
+        if hedge_types:
+            primary = c.get("env", "LLM_TYPE")
+            llm_types = [primary] + [llm_type for llm_type in hedge_types if llm_type != primary]
+            return await self.hedged_conversation_to_metadata(conversation, llm_types)
+
         if not self.factory_llm:
-            self.factory_llm = await self.generate_llm_instance()
+            self.factory_llm = self.get_llm_instance()
             if not self.factory_llm:
                 bt.logging.error("LLM not found. Aborting conversation_to_metadata.")
                 return
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+
+
+# Continuous-refill bucket holding up to one minute of quota. acquire() waits
+# until enough capacity has refilled instead of failing.
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        if not self.per_minute:
+            return 0.0
+        # Requests larger than the whole bucket would never fit, let them drain it
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            self.refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return waited
+            delay = (amount - self.tokens) * 60.0 / self.per_minute
+            waited += delay
+            await asyncio.sleep(delay)
+
+    def debit(self, amount):
+        # Corrects an estimate once actual usage is known. Can go negative,
+        # but never owes (or is credited) more than one full bucket.
+        if self.per_minute:
+            self.refill()
+            self.tokens = max(-self.capacity, min(self.capacity, self.tokens - amount))
+
+
+# Per-provider limiter for LLM API calls. Each call takes one request token
+# and an estimate of its LLM tokens from the RPM/TPM buckets and holds one of
+# max_concurrent slots. 429 (and Anthropic's 529 overloaded) responses are
+# retried with exponential backoff and jitter. A Retry-After header is
+# honored and pauses every caller of the provider, not just the one that got
+# the 429, so the whole process backs off together instead of hammering the
+# quota in waves.
+class RateLimiter:
+    verbose = False
+    max_concurrent = 8
+    max_retries = 3
+    backoff_base = 1.0
+    backoff_max = 30.0
+    # AsyncHttp and the SDKs already retry 5xx, so only quota and overload
+    # responses are retried here
+    retry_codes = [429, 529]
+
+    def __init__(self, provider, rpm=0, tpm=0, max_concurrent=None, max_retries=None):
+        self.provider = provider
+        if max_concurrent:
+            self.max_concurrent = max_concurrent
+        if max_retries is not None:
+            self.max_retries = max_retries
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.semaphores = {}
+        self.paused_until = 0
+        self.counts = {"calls":0, "retries":0, "rate_limited":0, "failed":0, "throttle_wait":0.0}
+
+    def get_semaphore(self):
+        # asyncio primitives are bound to one loop
+        loop = asyncio.get_running_loop()
+        semaphore = self.semaphores.get(id(loop))
+        if not semaphore or semaphore[0] is not loop:
+            semaphore = (loop, asyncio.Semaphore(self.max_concurrent))
+            self.semaphores[id(loop)] = semaphore
+        return semaphore[1]
+
+    @staticmethod
+    def estimate_tokens(data):
+        # Roughly 4 characters per token for the prompt, plus the reply budget
+        if not data:
+            return 1
+        body = data.get('messages') or data.get('input') or data
+        return int(len(json.dumps(body, default=str)) / 4) + Utils._int(data.get('max_tokens'), 0)
+
+    @staticmethod
+    def response_status(response):
+        # Works for AsyncHttp result dicts and for SDK exceptions
+        if isinstance(response, dict):
+            return (response.get('code'), response.get('headers') or {})
+        status = getattr(response, 'status_code', None)
+        headers = getattr(getattr(response, 'response', None), 'headers', None) or {}
+        return (status, headers)
+
+    @staticmethod
+    def usage_tokens(response):
+        if not isinstance(response, dict):
+            return None
+        usage = Utils.get(response, 'json.usage')
+        if not usage:
+            return None
+        total = Utils._int(usage.get('total_tokens'), None)
+        if total is None:
+            total = Utils._int(usage.get('input_tokens'), 0) + Utils._int(usage.get('output_tokens'), 0)
+        return total
+
+    @staticmethod
+    def parse_retry_after(value):
+        # Seconds, or an HTTP-date
+        seconds = Utils._float(value, None)
+        if seconds is not None:
+            return seconds
+        try:
+            return parsedate_to_datetime(str(value)).timestamp() - time.time()
+        except Exception:
+            return None
+
+    def retry_delay(self, attempt, headers):
+        retry_after = None
+        for key in headers:
+            if key.lower() == 'retry-after':
+                retry_after = self.parse_retry_after(headers[key])
+        if retry_after is not None:
+            # The pause applies to every caller of the provider, so a bogus
+            # header must not stall all LLM traffic
+            return min(self.backoff_max, max(0, retry_after))
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random())
+
+    async def call(self, fn, tokens=1):
+        # fn returns a new awaitable per attempt. Returns the last response,
+        # or raises the last exception once retries are used up.
+        attempt = 0
+        while True:
+            pause = self.paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            waited = await self.requests.acquire(1)
+            waited += await self.tokens.acquire(tokens)
+            self.counts['throttle_wait'] += waited
+            self.counts['calls'] += 1
+
+            response = None
+            error = None
+            async with self.get_semaphore():
+                try:
+                    response = await fn()
+                except Exception as e:
+                    error = e
+            (status, headers) = self.response_status(error if error is not None else response)
+
+            if status not in self.retry_codes:
+                if error is not None:
+                    self.counts['failed'] += 1
+                    raise error
+                used = self.usage_tokens(response)
+                if used is not None:
+                    self.tokens.debit(used - tokens)
+                return response
+
+            if status == 429:
+                self.counts['rate_limited'] += 1
+            if attempt >= self.max_retries:
+                self.counts['failed'] += 1
+                print(f"ERROR 7720301: {self.provider} API still returning {status} after {attempt + 1} attempts")
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.retry_delay(attempt, headers)
+            if status == 429:
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            if self.verbose:
+                print(f"{self.provider} API returned {status}. Retrying in {delay:.2f} seconds")
+            self.counts['retries'] += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        out = dict(self.counts)
+        out['paused'] = max(0.0, self.paused_until - time.monotonic())
+        return out
+
+
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(provider):
+    # One limiter per provider for the process, configured with e.g.
+    # OPENAI_RPM, OPENAI_TPM and OPENAI_MAX_CONCURRENT. 0 means no limit.
+    limiter = rate_limiters.get(provider)
+    if limiter:
+        return limiter
+    with rate_limiters_lock:
+        limiter = rate_limiters.get(provider)
+        if not limiter:
+            prefix = provider.upper()
+            limiter = RateLimiter(
+                provider,
+                rpm=Utils._float(c.get('env', prefix + '_RPM'), 0),
+                tpm=Utils._float(c.get('env', prefix + '_TPM'), 0),
+                max_concurrent=Utils._int(c.get('env', prefix + '_MAX_CONCURRENT'), None),
+                max_retries=Utils._int(c.get('env', 'LLM_MAX_RETRIES'), None),
+            )
+            rate_limiters[provider] = limiter
+    return limiter
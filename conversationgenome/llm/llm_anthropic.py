@@ -3,8 +3,10 @@ import json
 import asyncio
 
 from conversationgenome.utils.Utils import Utils
+from conversationgenome.utils.AsyncHttp import AsyncHttp
 from conversationgenome.ConfigLib import c
 from conversationgenome.llm.llm_openai import llm_openai
+from conversationgenome.llm.RateLimiter import RateLimiter, get_rate_limiter
 
 
 class llm_anthropic:
@@ -13,6 +15,7 @@ class llm_anthropic:
     direct_call = 0
     embeddings_model = "text-embedding-ada-002"
     client = None
+    embeddings_llm = None
     root_url = "https://api.anthropic.com"
     # Test endpoint
     #root_url = "http://127.0.0.1:8000"
@@ -34,7 +37,7 @@ class llm_anthropic:
 
         self.api_key = api_key
 
-    def do_direct_call(self, data, url_path = "/v1/messages"):
+    async def do_direct_call(self, data, url_path = "/v1/messages"):
         url = self.root_url + url_path
         headers = {
             "content-type": "application/json",
@@ -45,7 +48,10 @@ class llm_anthropic:
         http_timeout = Utils._float(c.get('env', 'HTTP_TIMEOUT', 60))
         #print("URL", url, headers, data)
         try:
-            response = Utils.post_url(url, jsonData=data, headers=headers, timeout=http_timeout)
+            limiter = get_rate_limiter("anthropic")
+            response = await limiter.call(lambda: AsyncHttp.post_url(url, jsonData=data, headers=headers, timeout=http_timeout), tokens=RateLimiter.estimate_tokens(data))
+            if not Utils.get(response, "success"):
+                print(f"Anthropic API Error. Status: {Utils.get(response, 'code')} Errors: {Utils.get(response, 'errors')}")
         except Exception as e:
             print("Anthropic API Error", e)
             print("response", response)
@@ -66,7 +72,7 @@ class llm_anthropic:
                 ]
             }
 
-            http_response = self.do_direct_call(data)
+            http_response = await self.do_direct_call(data)
             #print("________CSV LLM completion", http_response)
             out['content'] = Utils.get(http_response, 'json.content.0.text')
 
@@ -84,8 +90,15 @@ class llm_anthropic:
 
         return out
 
+    def get_embeddings_llm(self):
+        # Embeddings come from OpenAI. Keep one adapter so its settings and
+        # clients are reused across calls.
+        if not self.embeddings_llm:
+            self.embeddings_llm = llm_openai()
+        return self.embeddings_llm
+
     async def conversation_to_metadata(self,  convo):
-        llm_embeddings = llm_openai()
+        llm_embeddings = self.get_embeddings_llm()
         (xml, participants) = llm_embeddings.generate_convo_xml(convo)
         tags = None
         out = {"tags":{}}
@@ -121,18 +134,7 @@ class llm_anthropic:
             if self.verbose:
                 print(f"------- Found tags: {tags}. Getting vectors for tags...")
             out['tags'] = tags
-            out['vectors'] = {}
-            tag_logs = []
-            for tag in tags:
-                vectors = await llm_embeddings.get_vector_embeddings(tag)
-                if not vectors:
-                    print(f"ERROR -- no vectors for tag: {tag} vector response: {vectors}")
-                else:
-                    tag_logs.append(f"{tag}={len(vectors)}vs")
-                out['vectors'][tag] = {"vectors":vectors}
-            if self.verbose:
-                print("        Embeddings received: " + ", ".join(tag_logs))
-                print("VECTORS", tag, vectors)
+            out['vectors'] = await llm_embeddings.get_vector_embeddings_set(tags)
             out['success'] = 1
         else:
             print("No tags returned by OpenAI for Anthropic", response)
@@ -3,8 +3,10 @@ import json
 import asyncio
 
 from conversationgenome.utils.Utils import Utils
+from conversationgenome.utils.AsyncHttp import AsyncHttp
 from conversationgenome.ConfigLib import c
 from conversationgenome.llm.llm_openai import llm_openai
+from conversationgenome.llm.RateLimiter import RateLimiter, get_rate_limiter
 
 
 Groq = None
@@ -20,6 +22,7 @@ class llm_groq:
     direct_call = 0
     embeddings_model = "text-embedding-ada-002"
     client = None
+    embeddings_llm = None
     root_url = "https://api.groq.com/openai"
     # Test endpoint
     #root_url = "http://127.0.0.1:8000"
@@ -52,7 +55,7 @@ class llm_groq:
 
     # Groq Python library dependencies can conflict with other packages. Allow
     # direct call to API to bypass issues.
-    def do_direct_call(self, data, url_path = "/v1/chat/completions"):
+    async def do_direct_call(self, data, url_path = "/v1/chat/completions"):
         url = self.root_url + url_path
         headers = {
             "Content-Type": "application/json",
@@ -61,7 +64,10 @@ class llm_groq:
         response = {"success":0}
         http_timeout = Utils._float(c.get('env', 'HTTP_TIMEOUT', 60))
         try:
-            response = Utils.post_url(url, jsonData=data, headers=headers, timeout=http_timeout)
+            limiter = get_rate_limiter("groq")
+            response = await limiter.call(lambda: AsyncHttp.post_url(url, jsonData=data, headers=headers, timeout=http_timeout), tokens=RateLimiter.estimate_tokens(data))
+            if not Utils.get(response, "success"):
+                print(f"Groq API Error. Status: {Utils.get(response, 'code')} Errors: {Utils.get(response, 'errors')}")
         except Exception as e:
             print("Groq API Error", e)
             print("response", response)
@@ -79,14 +85,19 @@ class llm_groq:
 
         try:
             if not self.direct_call:
-                completion = self.client.chat.completions.create(
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": prompt,
-                        }
-                    ],
-                    model=self.model,
+                messages = [
+                    {
+                        "role": "user",
+                        "content": prompt,
+                    }
+                ]
+                completion = await get_rate_limiter("groq").call(
+                    lambda: asyncio.to_thread(
+                        self.client.chat.completions.create,
+                        messages=messages,
+                        model=self.model,
+                    ),
+                    tokens=RateLimiter.estimate_tokens({"messages": messages}),
                 )
                 raw_content = completion.choices[0].message.content
                 out['content'] = raw_content
@@ -95,7 +106,7 @@ class llm_groq:
                   "model": self.model,
                   "messages": [{"role": "user", "content": prompt}],
                 }
-                http_response = self.do_direct_call(data)
+                http_response = await self.do_direct_call(data)
                 #print("________CSV LLM completion", completion)
                 out['content'] = Utils.get(http_response, 'json.choices.0.message.content')
 
@@ -114,8 +125,15 @@ class llm_groq:
 
         return out
 
+    def get_embeddings_llm(self):
+        # Embeddings come from OpenAI. Keep one adapter so its settings and
+        # clients are reused across calls.
+        if not self.embeddings_llm:
+            self.embeddings_llm = llm_openai()
+        return self.embeddings_llm
+
     async def conversation_to_metadata(self,  convo):
-        llm_embeddings = llm_openai()
+        llm_embeddings = self.get_embeddings_llm()
         (xml, participants) = llm_embeddings.generate_convo_xml(convo)
         tags = None
         out = {"tags":{}}
@@ -151,18 +169,7 @@ class llm_groq:
             if self.verbose:
                 print(f"------- Found tags: {tags}. Getting vectors for tags...")
             out['tags'] = tags
-            out['vectors'] = {}
-            tag_logs = []
-            for tag in tags:
-                vectors = await llm_embeddings.get_vector_embeddings(tag)
-                if not vectors:
-                    print(f"ERROR -- no vectors for tag: {tag} vector response: {vectors}")
-                else:
-                    tag_logs.append(f"{tag}={len(vectors)}vs")
-                out['vectors'][tag] = {"vectors":vectors}
-            if self.verbose:
-                print("        Embeddings received: " + ", ".join(tag_logs))
-                print("VECTORS", tag, vectors)
+            out['vectors'] = await llm_embeddings.get_vector_embeddings_set(tags)
             out['success'] = 1
         else:
             print("No tags returned by OpenAI for Groq", response)
@@ -1,8 +1,12 @@
 import os
 import json
+import asyncio
 
 from conversationgenome.utils.Utils import Utils
+from conversationgenome.utils.AsyncHttp import AsyncHttp
 from conversationgenome.ConfigLib import c
+from conversationgenome.llm.EmbeddingCache import get_embedding_cache
+from conversationgenome.llm.RateLimiter import RateLimiter, get_rate_limiter
 
 
 openai = None
@@ -23,11 +27,14 @@ class llm_openai:
     return_json = False
     model = "gpt-4"
     embeddings_model = "text-embedding-ada-002"
+    # OpenAI accepts up to 2048 inputs per embeddings request
+    embeddings_batch_size = 2048
     direct_call = 0
     root_url = "https://api.openai.com"
     # Test endpoint
     #root_url = "http://127.0.0.1:8000"
     api_key = None
+    async_client = None
 
     def __init__(self):
         self.direct_call = Utils._int(c.get('env', "OPENAI_DIRECT_CALL"), 0)
@@ -50,9 +57,17 @@ class llm_openai:
         if embeddings_model:
             self.embeddings_model = embeddings_model
 
+    def get_async_client(self):
+        # AsyncOpenAI holds a connection pool bound to the event loop it was
+        # first used on. Reuse it for every call on the same loop.
+        loop = asyncio.get_running_loop()
+        if not self.async_client or self.async_client[0] is not loop:
+            self.async_client = (loop, AsyncOpenAI())
+        return self.async_client[1]
+
     # OpenAI Python library dependencies can conflict with other packages. Allow
     # direct call to API to bypass issues.
-    def do_direct_call(self, data, url_path = "/v1/chat/completions"):
+    async def do_direct_call(self, data, url_path = "/v1/chat/completions"):
         url = self.root_url + url_path
         headers = {
             "Content-Type": "application/json",
@@ -61,7 +76,10 @@ class llm_openai:
         response = {"success":0}
         http_timeout = Utils._float(c.get('env', 'HTTP_TIMEOUT', 60))
         try:
-            response = Utils.post_url(url, jsonData=data, headers=headers, timeout=http_timeout)
+            limiter = get_rate_limiter("openai")
+            response = await limiter.call(lambda: AsyncHttp.post_url(url, jsonData=data, headers=headers, timeout=http_timeout), tokens=RateLimiter.estimate_tokens(data))
+            if not Utils.get(response, "success"):
+                print(f"OPEN AI API Error. Status: {Utils.get(response, 'code')} Errors: {Utils.get(response, 'errors')}")
         except Exception as e:
             print("OPEN AI API Error", e)
             print("response", response)
@@ -143,18 +161,7 @@ class llm_openai:
             if self.verbose:
                 print(f"------- Found tags: {tags}. Getting vectors for tags...")
             out['tags'] = tags
-            out['vectors'] = {}
-            tag_logs = []
-            for tag in tags:
-                vectors = await self.get_vector_embeddings(tag)
-                if not vectors:
-                    print(f"ERROR -- no vectors for tag: {tag} vector response: {vectors}")
-                else:
-                    tag_logs.append(f"{tag}={len(vectors)}vs")
-                out['vectors'][tag] = {"vectors":vectors}
-            if self.verbose:
-                print("        Embeddings received: " + ", ".join(tag_logs))
-                print("VECTORS", tag, vectors)
+            out['vectors'] = await self.get_vector_embeddings_set(tags)
             out['success'] = 1
         else:
             print("No tags returned by OpenAI", response)
@@ -274,10 +281,14 @@ class llm_openai:
             prompt += self.getExampleFunctionConv()
 
         if not direct_call:
-            client = AsyncOpenAI()
-            completion = await client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt} ],
+            client = self.get_async_client()
+            messages = [{"role": "user", "content": prompt}]
+            completion = await get_rate_limiter("openai").call(
+                lambda: client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                ),
+                tokens=RateLimiter.estimate_tokens({"messages": messages}),
             )
             reply_content = completion.choices[0].message
             try:
@@ -289,7 +300,7 @@ class llm_openai:
               "model": self.model,
               "messages": [{"role": "user", "content": prompt}],
             }
-            completion = self.do_direct_call(data)
+            completion = await self.do_direct_call(data)
             #print("________CSV LLM completion", completion)
             out = completion['json']['choices'][0]['message']['content']
         return out
@@ -305,10 +316,14 @@ class llm_openai:
             prompt += self.getExampleFunctionConv()
 
         if not direct_call:
-            client = AsyncOpenAI()
-            completion = await client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt} ],
+            client = self.get_async_client()
+            messages = [{"role": "user", "content": prompt}]
+            completion = await get_rate_limiter("openai").call(
+                lambda: client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                ),
+                tokens=RateLimiter.estimate_tokens({"messages": messages}),
             )
             out = completion.choices[0].message
         else:
@@ -316,7 +331,7 @@ class llm_openai:
               "model": self.model,
               "messages": [{"role": "user", "content": prompt}],
             }
-            completion = self.do_direct_call(data)
+            completion = await self.do_direct_call(data)
             errors = Utils.get(completion, "errors", [])
             if Utils.get(completion, "success"):
                 out = completion
@@ -396,10 +411,19 @@ class llm_openai:
     async def get_vector_embeddings(self, text):
         embedding = None
         text =  text.replace("\n"," ")
+        cache = get_embedding_cache()
+        if cache:
+            embedding = (await cache.get_many_async(self.embeddings_model, [text]))[0]
+            if embedding:
+                return embedding
         if not self.direct_call:
-           response = client.embeddings.create(
-               model=self.embeddings_model,
-               input = text
+           response = await get_rate_limiter("openai").call(
+               lambda: asyncio.to_thread(
+                   client.embeddings.create,
+                   model=self.embeddings_model,
+                   input = text
+               ),
+               tokens=RateLimiter.estimate_tokens({"input": text}),
            )
            embedding = response.data[0].embedding
         else:
@@ -408,8 +432,8 @@ class llm_openai:
                "model": self.embeddings_model,
            }
            url_path = "/v1/embeddings"
-           response = self.do_direct_call(data, url_path=url_path)
-           if response['code'] == 200:
+           response = await self.do_direct_call(data, url_path=url_path)
+           if Utils.get(response, 'code') == 200:
                responseData = Utils.get(response, 'json.data')
                #print("responseData", responseData)
                embedding = responseData[0]['embedding']
@@ -418,8 +442,80 @@ class llm_openai:
         if self.verbose:
             print("OpenAI embeddings USAGE", response.usage)
             print("OpenAI embeddings generated", len(embedding))
+        if cache and embedding:
+            await cache.set_many_async(self.embeddings_model, [text], [embedding])
         return embedding
 
+    async def get_vector_embeddings_batch(self, texts):
+        # Embed a list of texts with one /v1/embeddings request per chunk of
+        # embeddings_batch_size inputs. Returned list is aligned with texts.
+        # Failed entries are None.
+        cache = get_embedding_cache()
+        if cache:
+            out = await cache.get_many_async(self.embeddings_model, texts)
+        else:
+            out = [None] * len(texts)
+        # Only request the texts the cache couldn't answer
+        missing = [idx for idx, vectors in enumerate(out) if not vectors]
+        batch_size = max(1, Utils._int(c.get('env', "OPENAI_EMBEDDINGS_BATCH_SIZE"), self.embeddings_batch_size))
+        for start in range(0, len(missing), batch_size):
+            chunk_idxs = missing[start:start+batch_size]
+            chunk = [texts[idx].replace("\n"," ") for idx in chunk_idxs]
+            items = []
+            if not self.direct_call:
+                try:
+                    response = await get_rate_limiter("openai").call(
+                        lambda: asyncio.to_thread(
+                            client.embeddings.create,
+                            model=self.embeddings_model,
+                            input = chunk
+                        ),
+                        tokens=RateLimiter.estimate_tokens({"input": chunk}),
+                    )
+                    items = [{"index":item.index, "embedding":item.embedding} for item in response.data]
+                except Exception as e:
+                    print("ERROR getting batch embeddings", e)
+            else:
+                data = {
+                    "input": chunk,
+                    "model": self.embeddings_model,
+                }
+                url_path = "/v1/embeddings"
+                response = await self.do_direct_call(data, url_path=url_path)
+                if Utils.get(response, 'code') == 200:
+                    items = Utils.get(response, 'json.data', [])
+                else:
+                    print("ERROR getting batch embeddings", response)
+            # Results are not guaranteed to come back in input order, so map by index
+            fetched = []
+            for item in items:
+                idx = Utils.get(item, 'index')
+                if idx is None or not 0 <= idx < len(chunk):
+                    continue
+                out[chunk_idxs[idx]] = Utils.get(item, 'embedding')
+                fetched.append(chunk_idxs[idx])
+            if cache and fetched:
+                await cache.set_many_async(self.embeddings_model, [texts[idx] for idx in fetched], [out[idx] for idx in fetched])
+        if self.verbose:
+            print(f"OpenAI batch embeddings generated {len([o for o in out if o])} of {len(texts)}")
+        return out
+
+    async def get_vector_embeddings_set(self, tags):
+        # Returns the {tag: {"vectors": [...]}} structure used by conversation metadata
+        # for every tag, fetched with a single batched embeddings call.
+        vectors_list = await self.get_vector_embeddings_batch(tags)
+        out = {}
+        tag_logs = []
+        for tag, vectors in zip(tags, vectors_list):
+            if not vectors:
+                print(f"ERROR -- no vectors for tag: {tag} vector response: {vectors}")
+            else:
+                tag_logs.append(f"{tag}={len(vectors)}vs")
+            out[tag] = {"vectors":vectors}
+        if self.verbose:
+            print("        Embeddings received: " + ", ".join(tag_logs))
+        return out
+
 
 
 if __name__ == "__main__":
@@ -1,4 +1,15 @@
 import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+from conversationgenome.mock.MockBt import MockBt
+
+verbose = False
 
 spacy = None
 Matcher = None
@@ -20,7 +31,23 @@ except:
 
 class llm_spacy:
     nlp = None
+    matcher = None
     verbose = False
+    # nlp.pipe settings. n_process > 1 parses in worker processes.
+    batch_size = 32
+    n_process = 1
+    # Parsing runs on one dedicated thread so the event loop (and the miner's
+    # axon) stays responsive. CPU parallelism comes from n_process.
+    executor = None
+    executor_lock = threading.Lock()
+
+    def __init__(self):
+        self.batch_size = Utils._int(c.get('env', 'SPACY_BATCH_SIZE'), self.batch_size)
+        self.n_process = Utils._int(c.get('env', 'SPACY_N_PROCESS'), self.n_process)
+
+    def warmup(self):
+        self.get_nlp()
+        self.get_matcher()
 
     def get_nlp(self):
         nlp = self.nlp
@@ -45,21 +72,31 @@ class llm_spacy:
             self.nlp = nlp
         return nlp
 
-    async def simple_text_to_tags(self, body, min_tokens=5):
-        nlp = self.get_nlp()
-
-        # Define patterns
-        adj_noun_pattern = [{"POS": "ADJ"}, {"POS": "NOUN"}]
-        pronoun_pattern = [{"POS": "PRON"}]
-        unique_word_pattern = [{"POS": {"IN": ["NOUN", "VERB", "ADJ"]}, "IS_STOP": False}]
-
-        # Initialize the Matcher with the shared vocabulary
-        matcher = Matcher(nlp.vocab)
-        matcher.add("ADJ_NOUN_PATTERN", [adj_noun_pattern])
-        matcher.add("PRONOUN_PATTERN", [pronoun_pattern])
-        matcher.add("UNIQUE_WORD_PATTERN", [unique_word_pattern])
-
-        doc = nlp( body )
+    def get_matcher(self):
+        if not self.matcher:
+            nlp = self.get_nlp()
+
+            # Define patterns
+            adj_noun_pattern = [{"POS": "ADJ"}, {"POS": "NOUN"}]
+            pronoun_pattern = [{"POS": "PRON"}]
+            unique_word_pattern = [{"POS": {"IN": ["NOUN", "VERB", "ADJ"]}, "IS_STOP": False}]
+
+            # Initialize the Matcher with the shared vocabulary
+            matcher = Matcher(nlp.vocab)
+            matcher.add("ADJ_NOUN_PATTERN", [adj_noun_pattern])
+            matcher.add("PRONOUN_PATTERN", [pronoun_pattern])
+            matcher.add("UNIQUE_WORD_PATTERN", [unique_word_pattern])
+            self.matcher = matcher
+        return self.matcher
+
+    def get_executor(self):
+        with llm_spacy.executor_lock:
+            if not llm_spacy.executor:
+                llm_spacy.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spacy")
+        return llm_spacy.executor
+
+    def doc_to_tags(self, doc, min_tokens=5):
+        matcher = self.get_matcher()
         if self.verbose:
             bt.logging.info("DOC", doc)
         matches = matcher(doc)
@@ -78,6 +115,28 @@ class llm_spacy:
 
         return matches_dict
 
+    def texts_to_tags(self, bodies, min_tokens=5, batch_size=None, n_process=None):
+        # Blocking. Parses all bodies with one nlp.pipe call and returns a
+        # matches dict per body, in order.
+        nlp = self.get_nlp()
+        batch_size = batch_size or self.batch_size
+        n_process = n_process or self.n_process
+        if n_process > 1 and len(bodies) < 2:
+            # Not worth starting worker processes for a single text
+            n_process = 1
+        out = []
+        for doc in nlp.pipe(bodies, batch_size=batch_size, n_process=n_process):
+            out.append(self.doc_to_tags(doc, min_tokens=min_tokens))
+        return out
+
+    async def batch_text_to_tags(self, bodies, min_tokens=5, batch_size=None, n_process=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.get_executor(), self.texts_to_tags, bodies, min_tokens, batch_size, n_process)
+
+    async def simple_text_to_tags(self, body, min_tokens=5):
+        results = await self.batch_text_to_tags([body], min_tokens=min_tokens)
+        return results[0]
+
     async def get_neighborhood(self, response, tag_count_ceiling=None):
         all_vectors = []
         count = 0
@@ -107,11 +166,19 @@ class llm_spacy:
 
 
 
-    async def conversation_to_metadata(self,  convo):
+    async def conversations_to_metadata(self, convos):
+        # Batch version of conversation_to_metadata. All conversations or
+        # windows go through nlp.pipe together.
         # For this simple matcher, just munge all of the lines together
-        body = json.dumps(convo['lines'])
-        matches_dict = await self.simple_text_to_tags(body)
-        tags = list(matches_dict.keys())
+        bodies = [json.dumps(convo['lines']) for convo in convos]
+        results = await self.batch_text_to_tags(bodies)
+        out = []
+        for matches_dict in results:
+            tags = list(matches_dict.keys())
+            out.append({"tags": tags, "vectors":matches_dict})
+        return out
 
-        return {"tags": tags, "vectors":matches_dict}
+    async def conversation_to_metadata(self,  convo):
+        results = await self.conversations_to_metadata([convo])
+        return results[0]
 
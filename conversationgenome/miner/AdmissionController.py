@@ -0,0 +1,128 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+# Bounded worker pool with a stake-priority queue in front of do_mining.
+# At most max_concurrent windows are mined at once; the rest wait in a heap
+# ordered by priority (the caller's stake), first come first served within
+# equal priority. A request is shed up front when the queue is full or when
+# its expected wait plus the average mining time would exceed the synapse
+# timeout, and it gives up waiting once that point is reached. Shedding early
+# answers the validator right away instead of running an LLM call whose result
+# would arrive after the validator stopped listening.
+class AdmissionController:
+    verbose = False
+    max_concurrent = 4
+    max_queue = 64
+    # Weight of the newest sample in the moving average of mining time
+    service_alpha = 0.2
+    wait_buckets = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self, max_concurrent=None, max_queue=None):
+        if max_concurrent:
+            self.max_concurrent = max_concurrent
+        if max_queue:
+            self.max_queue = max_queue
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.avg_service = None
+        self.counts = {"admitted":0, "completed":0, "shed_queue_full":0, "shed_wait":0, "gave_up":0, "max_depth":0}
+        self.wait_histogram = [0] * (len(self.wait_buckets) + 1)
+        self.service_histogram = [0] * (len(self.wait_buckets) + 1)
+
+    def depth(self):
+        return len([entry for entry in self.waiters if not entry[2].done()])
+
+    def expected_wait(self, priority):
+        # Requests ahead of this one drain max_concurrent at a time
+        if self.active < self.max_concurrent or not self.avg_service:
+            return 0.0
+        ahead = len([entry for entry in self.waiters if -entry[0] >= priority and not entry[2].done()])
+        return (ahead // self.max_concurrent + 1) * self.avg_service
+
+    def observe(self, histogram, value):
+        for idx, bucket in enumerate(self.wait_buckets):
+            if value <= bucket:
+                histogram[idx] += 1
+                return
+        histogram[-1] += 1
+
+    async def acquire(self, priority, timeout=None):
+        # Returns True once a slot is held, False if the request was shed
+        if self.active < self.max_concurrent and self.depth() == 0:
+            self.active += 1
+            self.observe(self.wait_histogram, 0)
+            return True
+        if self.depth() >= self.max_queue:
+            self.counts['shed_queue_full'] += 1
+            return False
+
+        budget = None
+        if timeout:
+            budget = timeout - (self.avg_service or 0)
+            if budget <= 0 or self.expected_wait(priority) > budget:
+                self.counts['shed_wait'] += 1
+                return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (-priority, next(self.sequence), future))
+        self.counts['max_depth'] = max(self.counts['max_depth'], self.depth())
+        start = time.time()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=budget)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self.counts['gave_up'] += 1
+                return False
+            # Granted just as the wait timed out, keep the slot
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over already, pass it on
+                self.release()
+            else:
+                future.cancel()
+            raise
+        self.observe(self.wait_histogram, time.time() - start)
+        return True
+
+    def release(self):
+        self.active -= 1
+        while self.waiters:
+            (neg_priority, seq, future) = heapq.heappop(self.waiters)
+            if not future.done():
+                self.active += 1
+                future.set_result(True)
+                break
+
+    async def run(self, priority, timeout, fn):
+        # Runs the coroutine returned by fn under admission control. Returns
+        # (admitted, result); result is None when the request was shed.
+        if not await self.acquire(priority, timeout):
+            return (False, None)
+        self.counts['admitted'] += 1
+        start = time.time()
+        try:
+            return (True, await fn())
+        finally:
+            elapsed = time.time() - start
+            self.counts['completed'] += 1
+            self.observe(self.service_histogram, elapsed)
+            if self.avg_service is None:
+                self.avg_service = elapsed
+            else:
+                self.avg_service = self.service_alpha * elapsed + (1 - self.service_alpha) * self.avg_service
+            self.release()
+
+    def stats(self):
+        out = dict(self.counts)
+        out['active'] = self.active
+        out['depth'] = self.depth()
+        out['avg_service'] = self.avg_service
+        labels = [f"<={bucket}" for bucket in self.wait_buckets] + [f">{self.wait_buckets[-1]}"]
+        out['wait_histogram'] = dict(zip(labels, self.wait_histogram))
+        out['service_histogram'] = dict(zip(labels, self.service_histogram))
+        return out
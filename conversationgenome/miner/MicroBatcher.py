@@ -0,0 +1,113 @@
+import asyncio
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+from conversationgenome.mock.MockBt import MockBt
+
+verbose = False
+bt = None
+try:
+    import bittensor as bt
+except:
+    if verbose:
+        print("bittensor not installed")
+    bt = MockBt()
+
+from conversationgenome.llm.LlmLib import LlmLib
+
+
+# Collects the windows that arrive within a short time window (or until
+# max_batch is reached) and tags them together. Adapters with a batch method
+# (llm_spacy.conversations_to_metadata) get one batched inference for the
+# whole group. Other adapters get the windows dispatched in parallel through
+# the shared adapter instance and its client. Each caller awaits its own
+# window's result.
+class MicroBatcher:
+    verbose = False
+    window = 0.05
+    max_batch = 16
+
+    def __init__(self, window=None, max_batch=None, llm_type=None):
+        if window:
+            self.window = window
+        if max_batch:
+            self.max_batch = max_batch
+        self.llm_type = llm_type
+        self.pending = []
+        self.timer = None
+        self.tasks = set()
+        self.counts = {"windows":0, "batches":0, "largest_batch":0, "failed_batches":0}
+
+    async def conversation_to_metadata(self, convo):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((convo, future))
+        self.counts['windows'] += 1
+        if len(self.pending) >= self.max_batch:
+            self.dispatch()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.dispatch)
+        return await future
+
+    def dispatch(self):
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+        batch = self.pending
+        self.pending = []
+        if not batch:
+            return
+        task = asyncio.get_running_loop().create_task(self.run_batch(batch))
+        # Keep a reference so the task isn't garbage collected before it finishes
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, batch):
+        convos = [convo for (convo, future) in batch]
+        self.counts['batches'] += 1
+        self.counts['largest_batch'] = max(self.counts['largest_batch'], len(batch))
+        try:
+            llm = LlmLib().get_llm_instance(self.llm_type)
+            if not llm:
+                results = [None] * len(batch)
+            elif hasattr(llm, "conversations_to_metadata"):
+                results = await llm.conversations_to_metadata(convos)
+            else:
+                results = await asyncio.gather(*[llm.conversation_to_metadata(convo) for convo in convos], return_exceptions=True)
+        except Exception as e:
+            bt.logging.error(f"ERROR 5530121: Batch of {len(batch)} windows failed: {e}")
+            self.counts['failed_batches'] += 1
+            results = [e] * len(batch)
+        if self.verbose:
+            bt.logging.info(f"Tagged batch of {len(batch)} windows")
+
+        for ((convo, future), result) in zip(batch, results):
+            # Callers that were cancelled (e.g. the synapse timed out) are skipped
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        out = dict(self.counts)
+        out['avg_batch'] = out['windows'] / out['batches'] if out['batches'] else 0.0
+        out['pending'] = len(self.pending)
+        return out
+
+
+micro_batcher = None
+
+def get_micro_batcher():
+    # Process-wide batcher. Returns None unless MINER_BATCH_WINDOW_MS > 0.
+    global micro_batcher
+    window_ms = Utils._float(c.get('env', 'MINER_BATCH_WINDOW_MS', 0), 0)
+    if not window_ms or window_ms <= 0:
+        return None
+    if not micro_batcher:
+        micro_batcher = MicroBatcher(
+            window=window_ms / 1000.0,
+            max_batch=Utils._int(c.get('env', 'MINER_BATCH_SIZE'), None),
+        )
+    return micro_batcher
@@ -0,0 +1,278 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+
+
+# Mining results keyed by a hash of the window lines plus the LLM type and
+# model. Validators often send the same window to the same miner, so repeats
+# are answered from an in-process LRU (or the optional SQLite file) instead of
+# calling the LLM again. Entries expire after ttl seconds. Concurrent requests
+# for the same key share one computation through the in-flight map.
+#
+# Vectors are held as float32 arrays, about 6 KB per 1536-dim tag, and the LRU
+# is bounded by max_bytes as well as max_items, so the default cache stays
+# under 64 MB. SQLite reads and writes run in a worker thread when called
+# from get_or_compute so they don't block the event loop.
+class MinerCache:
+    verbose = False
+    max_items = 1000
+    max_bytes = 64 * 1024 * 1024
+    ttl = 3600
+    db_path = None
+
+    sql_create = """CREATE TABLE IF NOT EXISTS results (
+        "key"	TEXT NOT NULL PRIMARY KEY,
+        "result"	TEXT,
+        "vectors"	BLOB,
+        "created_at"	REAL
+    )"""
+
+    def __init__(self, db_path=None, max_items=None, ttl=None, max_bytes=None):
+        if max_items:
+            self.max_items = max_items
+        if max_bytes:
+            self.max_bytes = max_bytes
+        if ttl:
+            self.ttl = ttl
+        self.db_path = db_path
+        self.lru = OrderedDict()
+        self.lru_bytes = 0
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.db_lock = threading.Lock()
+        self.conn = None
+        self.counts = {"memory_hits":0, "disk_hits":0, "shared":0, "misses":0, "expired":0, "stores":0}
+        if self.db_path:
+            try:
+                self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.execute(self.sql_create)
+                self.conn.commit()
+            except Exception as e:
+                print(f"ERROR 8302401: MinerCache could not open {self.db_path}: {e}. Using memory only.")
+                self.conn = None
+
+    @staticmethod
+    def make_key(lines, llm_type, model):
+        body = json.dumps({"lines": lines, "llm_type": llm_type, "model": model}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def compact(result):
+        # Splits a result into its JSON part and a list of (tag, float32 array)
+        # rows. Tags without a usable vector stay in the JSON part.
+        rest = dict(result)
+        vectors = rest.pop('vectors', None) or {}
+        rows = []
+        for tag, item in vectors.items():
+            row = item.get('vectors') if isinstance(item, dict) else None
+            if row is not None and len(row) > 0:
+                rows.append((tag, np.asarray(row, dtype=np.float32)))
+            else:
+                rows.append((tag, item))
+        return (rest, rows)
+
+    @staticmethod
+    def expand(rest, rows):
+        # Rebuilds the result with plain float lists, the form the miner returns
+        out = dict(rest)
+        if rows:
+            out['vectors'] = {tag: {"vectors": row.tolist()} if isinstance(row, np.ndarray) else row for (tag, row) in rows}
+        return out
+
+    @staticmethod
+    def entry_size(rest, rows):
+        size = len(json.dumps(rest, default=str))
+        for (tag, row) in rows:
+            size += len(tag) + (row.nbytes if isinstance(row, np.ndarray) else len(json.dumps(row, default=str)))
+        return size
+
+    def _remember(self, key, rest, rows, created_at):
+        size = self.entry_size(rest, rows)
+        if size > self.max_bytes:
+            return
+        old = self.lru.pop(key, None)
+        if old is not None:
+            self.lru_bytes -= old[3]
+        self.lru[key] = (created_at, rest, rows, size)
+        self.lru_bytes += size
+        while len(self.lru) > self.max_items or self.lru_bytes > self.max_bytes:
+            (_, evicted) = self.lru.popitem(last=False)
+            self.lru_bytes -= evicted[3]
+
+    def _forget(self, key):
+        entry = self.lru.pop(key, None)
+        if entry is not None:
+            self.lru_bytes -= entry[3]
+
+    def get_memory(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.lru.get(key)
+            if entry is None:
+                return None
+            if now - entry[0] <= self.ttl:
+                self.lru.move_to_end(key)
+                self.counts['memory_hits'] += 1
+                return self.expand(entry[1], entry[2])
+            self._forget(key)
+            self.counts['expired'] += 1
+        return None
+
+    def get_disk(self, key):
+        if not self.conn:
+            return None
+        now = time.time()
+        try:
+            with self.db_lock:
+                row = self.conn.execute("SELECT result, vectors, created_at FROM results WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            print(f"ERROR 8302402: MinerCache read failed: {e}")
+            row = None
+        if not row or now - row[2] > self.ttl:
+            return None
+        try:
+            meta = json.loads(row[0])
+            matrix = np.frombuffer(row[1] or b"", dtype=np.float32)
+            rows = []
+            offset = 0
+            for (tag, dim, item) in meta['vectors']:
+                if dim is None:
+                    rows.append((tag, item))
+                else:
+                    rows.append((tag, matrix[offset:offset + dim].copy()))
+                    offset += dim
+        except Exception as e:
+            print(f"ERROR 8302404: MinerCache entry {key} could not be decoded: {e}")
+            return None
+        with self.lock:
+            self._remember(key, meta['result'], rows, row[2])
+            self.counts['disk_hits'] += 1
+        return self.expand(meta['result'], rows)
+
+    def get(self, key):
+        result = self.get_memory(key)
+        if result is None:
+            result = self.get_disk(key)
+        if result is None:
+            self.counts['misses'] += 1
+        return result
+
+    async def get_async(self, key):
+        result = self.get_memory(key)
+        if result is None and self.conn:
+            result = await asyncio.to_thread(self.get_disk, key)
+        if result is None:
+            self.counts['misses'] += 1
+        return result
+
+    def remember(self, key, result):
+        # Memory part of set(). Returns what write_disk needs.
+        created_at = time.time()
+        (rest, rows) = self.compact(result)
+        with self.lock:
+            self._remember(key, rest, rows, created_at)
+            self.counts['stores'] += 1
+        return (rest, rows, created_at)
+
+    def write_disk(self, key, rest, rows, created_at):
+        if not self.conn:
+            return
+        meta = {"result": rest, "vectors": []}
+        blobs = []
+        for (tag, row) in rows:
+            if isinstance(row, np.ndarray):
+                meta['vectors'].append([tag, len(row), None])
+                blobs.append(row.tobytes())
+            else:
+                meta['vectors'].append([tag, None, row])
+        try:
+            with self.db_lock:
+                self.conn.execute("INSERT OR REPLACE INTO results (key, result, vectors, created_at) VALUES (?, ?, ?, ?)", (key, json.dumps(meta), sqlite3.Binary(b"".join(blobs)), created_at))
+                self.conn.execute("DELETE FROM results WHERE created_at < ?", (created_at - self.ttl,))
+                self.conn.commit()
+        except Exception as e:
+            print(f"ERROR 8302403: MinerCache write failed: {e}")
+
+    def set(self, key, result):
+        self.write_disk(key, *self.remember(key, result))
+
+    async def set_async(self, key, result):
+        entry = self.remember(key, result)
+        if self.conn:
+            await asyncio.to_thread(self.write_disk, key, *entry)
+
+    async def get_or_compute(self, key, compute, should_store=None):
+        # compute is an async callable. Concurrent callers with the same key
+        # await the first caller's result instead of starting their own.
+        result = await self.get_async(key)
+        if result is not None:
+            return result
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.counts['shared'] += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await compute()
+            future.set_result(result)
+            if should_store is None or should_store(result):
+                await self.set_async(key, result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+
+    def stats(self):
+        hits = self.counts['memory_hits'] + self.counts['disk_hits'] + self.counts['shared']
+        # Shared lookups were also counted as misses by get()
+        lookups = self.counts['memory_hits'] + self.counts['disk_hits'] + self.counts['misses']
+        out = dict(self.counts)
+        out['hits'] = hits
+        out['hit_rate'] = hits / lookups if lookups else 0.0
+        out['memory_items'] = len(self.lru)
+        out['memory_bytes'] = self.lru_bytes
+        out['in_flight'] = len(self.in_flight)
+        return out
+
+
+miner_cache = None
+miner_cache_lock = threading.Lock()
+
+def get_miner_cache():
+    # Process-wide cache instance. Returns None when MINER_CACHE=0.
+    global miner_cache
+    if not Utils._int(c.get('env', 'MINER_CACHE', 1), 1):
+        return None
+    with miner_cache_lock:
+        if not miner_cache:
+            db_path = c.get('env', 'MINER_CACHE_PATH')
+            if db_path:
+                db_path = os.path.expanduser(db_path)
+            miner_cache = MinerCache(
+                db_path=db_path,
+                max_items=Utils._int(c.get('env', 'MINER_CACHE_SIZE'), None),
+                ttl=Utils._float(c.get('env', 'MINER_CACHE_TTL'), None),
+                max_bytes=Utils._int(Utils._float(c.get('env', 'MINER_CACHE_MAX_MB'), 0) * 1024 * 1024, None),
+            )
+    return miner_cache
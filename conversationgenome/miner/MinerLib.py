@@ -19,6 +19,9 @@ except:
     bt = MockBt()
 
 from conversationgenome.llm.LlmLib import LlmLib
+from conversationgenome.llm.EmbeddingCache import get_embedding_cache
+from conversationgenome.miner.MinerCache import get_miner_cache
+from conversationgenome.miner.MicroBatcher import get_micro_batcher
 
 if c.get('env', 'FORCE_LOG') == 'debug':
     bt.logging.enable_debug(True)
@@ -35,13 +38,32 @@ class MinerLib:
 
         if not dryrun:
             llml = LlmLib()
-            lines = copy.deepcopy(conversation_window)
-            result = await llml.conversation_to_metadata({"lines":lines})
+            async def mine():
+                lines = copy.deepcopy(conversation_window)
+                batcher = get_micro_batcher()
+                if batcher:
+                    # Tagged together with other windows arriving at the same time
+                    return await batcher.conversation_to_metadata({"lines":lines})
+                return await llml.conversation_to_metadata({"lines":lines})
+
+            result_cache = get_miner_cache()
+            if result_cache:
+                llm_type = c.get("env", "LLM_TYPE")
+                model = c.get("env", str(llm_type).upper() + "_MODEL")
+                key = result_cache.make_key(conversation_window, llm_type, model)
+                # Empty results are usually LLM failures, so they aren't cached
+                result = await result_cache.get_or_compute(key, mine, should_store=lambda result: bool(Utils.get(result, 'tags')))
+                bt.logging.debug(f"Miner: Result cache stats: {result_cache.stats()}")
+            else:
+                result = await mine()
             tags = Utils.get(result, 'tags')
             out["tags"] = tags
             out["vectors"] = Utils.get(result, 'vectors', {})
             num_tags = len(Utils.get(out, 'tags', []))
             bt.logging.info(f"Miner: Mined {num_tags} vectors and tags")
+            cache = get_embedding_cache()
+            if cache:
+                bt.logging.debug(f"Miner: Embedding cache stats: {cache.stats()}")
 
             if self.verbose:
                 bt.logging.debug(f"MINED TAGS: {out['tags']}")
@@ -11,6 +11,9 @@ class logging:
     def info(*args, **kwargs):
         now = datetime.now(timezone.utc)
         print(now.strftime(logging.time_format), "INFO", " | ", *args[1:], sep="  ")
+    def warning(*args, **kwargs):
+        now = datetime.now(timezone.utc)
+        print(now.strftime(logging.time_format), "WARNING", " | ", *args[1:], sep="  ")
     def error(*args, **kwargs):
         now = datetime.now(timezone.utc)
         print(now.strftime(logging.time_format), "ERROR", " | ", *args[1:], sep="  ")
@@ -16,10 +16,133 @@
 # DEALINGS IN THE SOFTWARE.
 
 
+import base64
+import zlib
+
+import numpy as np
 import bittensor as bt
 from typing import Optional, List
 import typing
 
+# Version 2 adds the packed vector encoding. Validators send their version in
+# the window packet and miners only pack vectors for validators that read them.
+PROTOCOL_VERSION = 2
+PACKED_VECTORS_VERSION = 2
+PACKED_VECTOR_DTYPES = ["float32", "float16"]
+# Packed vectors come from untrusted miners. These caps bound how much memory
+# one response can make the validator allocate when it is decoded.
+MAX_PACKED_TAGS = 1000
+MAX_VECTOR_DIM = 4096
+
+
+def pack_vectors(vectors, dtype="float32", compress=False):
+    """
+    Packs a {tag: {"vectors": [...]}} dict into a base64 encoded matrix plus the tag list.
+
+    Returns None when the vectors can't be packed (empty or mixed dimensions).
+    """
+    if dtype not in PACKED_VECTOR_DTYPES:
+        dtype = "float32"
+    tags = []
+    rows = []
+    for tag, item in vectors.items():
+        row = item.get('vectors') if isinstance(item, dict) else None
+        if row is None or len(row) == 0:
+            continue
+        tags.append(tag)
+        rows.append(row)
+    if len(rows) == 0 or len(set([len(row) for row in rows])) != 1:
+        return None
+    matrix = np.asarray(rows, dtype=dtype)
+    data = matrix.tobytes()
+    if compress:
+        data = zlib.compress(data)
+    return {
+        "tags": tags,
+        "dtype": dtype,
+        "shape": list(matrix.shape),
+        "compression": "zlib" if compress else None,
+        "data": base64.b64encode(data).decode("ascii"),
+    }
+
+def unpack_vectors(packed, expected_dim=None):
+    """
+    Decodes the output of pack_vectors into a {tag: {"vectors": row}} dict. Rows are read-only views into one np.frombuffer matrix, so no per-float Python objects are created.
+
+    Raises ValueError when the shape doesn't match the tags, the row width is not expected_dim (or over MAX_VECTOR_DIM), or the data doesn't decompress to exactly the declared size.
+    """
+    dtype = packed.get('dtype')
+    if dtype not in PACKED_VECTOR_DTYPES:
+        raise ValueError(f"Unsupported packed vector dtype: {dtype}")
+    tags = packed.get('tags')
+    if not isinstance(tags, list) or len(tags) > MAX_PACKED_TAGS:
+        raise ValueError(f"Packed vector tags must be a list of at most {MAX_PACKED_TAGS} tags")
+    shape = packed.get('shape')
+    if not isinstance(shape, (list, tuple)) or len(shape) != 2 or not all([type(dim) is int for dim in shape]):
+        raise ValueError(f"Packed vector shape must be [rows, dim]: {shape}")
+    if shape[0] != len(tags):
+        raise ValueError(f"Packed vector rows ({shape[0]}) don't match tags ({len(tags)})")
+    if expected_dim and shape[1] != expected_dim:
+        raise ValueError(f"Packed vector dim ({shape[1]}) doesn't match expected dim ({expected_dim})")
+    if shape[1] <= 0 or shape[1] > MAX_VECTOR_DIM:
+        raise ValueError(f"Packed vector dim ({shape[1]}) out of range (max {MAX_VECTOR_DIM})")
+    expected_bytes = shape[0] * shape[1] * np.dtype(dtype).itemsize
+
+    data = base64.b64decode(packed['data'])
+    if packed.get('compression') == "zlib":
+        # Never inflate more than the declared matrix size
+        decompressor = zlib.decompressobj()
+        data = decompressor.decompress(data, expected_bytes)
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError(f"Packed vector data doesn't decompress to {expected_bytes} bytes")
+    elif packed.get('compression'):
+        raise ValueError(f"Unsupported packed vector compression: {packed.get('compression')}")
+    if len(data) != expected_bytes:
+        raise ValueError(f"Packed vector data is {len(data)} bytes, shape {shape} needs {expected_bytes}")
+    matrix = np.frombuffer(data, dtype=dtype).reshape(shape)
+    return {tag: {"vectors": matrix[idx]} for idx, tag in enumerate(tags)}
+
+def encode_output(result, protocol_version=None, dtype="float32", compress=False):
+    # Miner side. Replaces result['vectors'] with the packed form when the
+    # validator supports it. Older validators get the JSON float lists.
+    if not protocol_version or protocol_version < PACKED_VECTORS_VERSION:
+        return result
+    vectors = result.get('vectors')
+    if not vectors:
+        return result
+    packed = pack_vectors(vectors, dtype=dtype, compress=compress)
+    if not packed:
+        return result
+    out = dict(result)
+    del out['vectors']
+    out['vectors_packed'] = packed
+    return out
+
+def decode_output(result, expected_dim=None):
+    # Validator side. Expands a packed result back into result['vectors'].
+    # Results that were never packed are returned unchanged.
+    if not isinstance(result, dict) or not result.get('vectors_packed'):
+        return result
+    out = dict(result)
+    out['vectors'] = unpack_vectors(out.pop('vectors_packed'), expected_dim=expected_dim)
+    return out
+
+def vectors_to_lists(result):
+    # Copy of a decoded result with plain float lists, for JSON uploads
+    vectors = result.get('vectors') if isinstance(result, dict) else None
+    if not vectors:
+        return result
+    out = dict(result)
+    out['vectors'] = {}
+    for tag, item in vectors.items():
+        row = item.get('vectors') if isinstance(item, dict) else None
+        if isinstance(row, np.ndarray):
+            item = dict(item)
+            item['vectors'] = row.tolist()
+        out['vectors'][tag] = item
+    return out
+
+
 class CgSynapse(bt.Synapse):
     time_elapsed = 0
 
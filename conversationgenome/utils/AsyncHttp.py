@@ -0,0 +1,124 @@
+import asyncio
+import json
+import random
+from urllib.parse import urlsplit
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+
+aiohttp = None
+try:
+    import aiohttp
+except:
+    print("No aiohttp package. Async HTTP calls will run in worker threads.")
+
+
+# Non-blocking replacement for Utils.post_url/get_url inside coroutines.
+# Keeps one keep-alive aiohttp session per (event loop, host) so repeated calls
+# to the same API reuse pooled connections. Results use the same dict shape as
+# Utils.post_url so callers can switch over without changing their parsing.
+class AsyncHttp:
+    verbose = False
+    limit_per_host = 20
+    retries = 2
+    backoff_base = 0.5
+    # Status codes worth retrying. 429 is left to callers so they can honor Retry-After.
+    retry_codes = [500, 502, 503, 504]
+    sessions = {}
+
+    @staticmethod
+    def _host_key(url):
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    @staticmethod
+    async def get_session(url):
+        loop = asyncio.get_running_loop()
+        key = (id(loop), AsyncHttp._host_key(url))
+        entry = AsyncHttp.sessions.get(key)
+        if entry and entry[0] is loop and not entry[1].closed:
+            return entry[1]
+
+        # Drop sessions whose loop is gone so the dict doesn't grow across restarts
+        for old_key, (old_loop, old_session) in list(AsyncHttp.sessions.items()):
+            if old_session.closed or old_loop.is_closed():
+                AsyncHttp.sessions.pop(old_key, None)
+
+        limit_per_host = Utils._int(c.get('env', 'HTTP_MAX_PER_HOST'), AsyncHttp.limit_per_host)
+        connector = aiohttp.TCPConnector(limit_per_host=limit_per_host, keepalive_timeout=30)
+        session = aiohttp.ClientSession(connector=connector)
+        AsyncHttp.sessions[key] = (loop, session)
+        return session
+
+    @staticmethod
+    async def close():
+        # Close the sessions that belong to the running loop
+        loop = asyncio.get_running_loop()
+        for key, (session_loop, session) in list(AsyncHttp.sessions.items()):
+            if session_loop is loop:
+                AsyncHttp.sessions.pop(key, None)
+                if not session.closed:
+                    await session.close()
+
+    @staticmethod
+    async def request(method, url, postData=None, jsonData=None, headers=None, timeout=None, retries=None, verbose=False):
+        out = {"success":False, "body":None, "json": None, "code":-1, "headers":{}, "errors":[]}
+        if not headers:
+            headers = {
+                "Accept": "application/json",
+                "Accept-Language": "en_US",
+            }
+        if retries is None:
+            retries = Utils._int(c.get('env', 'HTTP_RETRIES'), AsyncHttp.retries)
+        if verbose or AsyncHttp.verbose:
+            print("url", url, "headers", headers, "jsonData", jsonData)
+
+        if not aiohttp:
+            # Fall back to blocking requests, but off the event loop
+            if method == "GET":
+                return await asyncio.to_thread(Utils.get_url, url, headers=headers, timeout=timeout)
+            return await asyncio.to_thread(Utils.post_url, url, postData=postData, jsonData=jsonData, headers=headers, isPut=(method == "PUT"), timeout=timeout)
+
+        client_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        for attempt in range(retries + 1):
+            retry = False
+            try:
+                session = await AsyncHttp.get_session(url)
+                async with session.request(method, url, headers=headers, json=jsonData, data=postData, timeout=client_timeout) as response:
+                    out["code"] = response.status
+                    out["headers"] = dict(response.headers)
+                    body = await response.text()
+                    if response.status == 200:
+                        out["success"] = True
+                        out["body"] = body
+                        try:
+                            out["json"] = json.loads(body)
+                        except:
+                            pass
+                    else:
+                        out['errors'].append({"id":19839010, "msg":f"HTTP FAIL: {url} Status:{response.status} Response:{body[0:500]}"})
+                        retry = response.status in AsyncHttp.retry_codes
+            except asyncio.TimeoutError as e:
+                out['errors'].append({"id":8329472, "msg":"TIMEOUT error"})
+                out['code'] = 500
+                retry = True
+            except aiohttp.ClientError as e:
+                out['errors'].append({"id":8329473, "msg":f"Connection error: {e}"})
+                out['code'] = 500
+                retry = True
+
+            if not retry or attempt >= retries:
+                break
+            # Exponential backoff with jitter before the next attempt
+            await asyncio.sleep(AsyncHttp.backoff_base * (2 ** attempt) * (0.5 + random.random()))
+
+        return out
+
+    @staticmethod
+    async def get_url(url, headers=None, verbose=False, timeout=None, retries=None):
+        return await AsyncHttp.request("GET", url, headers=headers, timeout=timeout, retries=retries, verbose=verbose)
+
+    @staticmethod
+    async def post_url(url, postData=None, jsonData=None, headers=None, isPut=False, verbose=False, timeout=None, retries=None):
+        method = "PUT" if isPut else "POST"
+        return await AsyncHttp.request(method, url, postData=postData, jsonData=jsonData, headers=headers, timeout=timeout, retries=retries, verbose=verbose)
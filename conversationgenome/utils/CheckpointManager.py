@@ -0,0 +1,222 @@
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import time
+
+import torch
+
+from conversationgenome.mock.MockBt import MockBt
+
+verbose = False
+bt = None
+try:
+    import bittensor as bt
+except:
+    if verbose:
+        print("bittensor not installed")
+    bt = MockBt()
+
+
+# Writes neuron state checkpoints from a background thread. The caller hands
+# over a snapshot of the state; serialization and disk IO happen off the
+# forward loop. Saves are throttled by elapsed time and steps, and only the
+# newest pending snapshot is written if several arrive while a write is busy.
+# Each checkpoint is written to a temp file and renamed into place, with a
+# sidecar holding its sha256, so a crash mid-write never leaves a truncated
+# file that looks valid. The newest `keep` checkpoints (by write time, not
+# step, since a validator that starts fresh counts steps from 0 again) are
+# retained and load_latest() falls back through them, then to the legacy
+# state.pt. Checkpoints that fail verification are renamed to *.corrupt so
+# they are neither loaded nor counted again.
+class CheckpointManager:
+    verbose = False
+    keep = 3
+    min_interval = 60
+    min_steps = 10
+    prefix = "state"
+    legacy_name = "state.pt"
+
+    def __init__(self, directory, keep=None, min_interval=None, min_steps=None, dump=None, load=None):
+        self.directory = directory
+        if keep:
+            self.keep = keep
+        if min_interval is not None:
+            self.min_interval = min_interval
+        if min_steps is not None:
+            self.min_steps = min_steps
+        self.dump = dump or torch.save
+        self.load = load or torch.load
+        self.name_re = re.compile(r"^" + re.escape(self.prefix) + r"-(\d+)\.pt$")
+        self.last_time = 0
+        self.last_step = None
+        self.pending = None
+        self.busy = False
+        self.condition = threading.Condition()
+        self.thread = None
+        self.counts = {"saved":0, "skipped":0, "coalesced":0, "failed":0}
+
+    def should_save(self, step):
+        if self.last_step is None:
+            return True
+        if step - self.last_step >= self.min_steps:
+            return True
+        return time.time() - self.last_time >= self.min_interval
+
+    def maybe_save(self, step, snapshot_fn, force=False):
+        # snapshot_fn runs on the caller's thread and must return a copy of
+        # the state that later steps won't mutate. It is only called when a
+        # save is actually due.
+        if not force and not self.should_save(step):
+            self.counts['skipped'] += 1
+            return False
+        self.last_step = step
+        self.last_time = time.time()
+        self.submit(step, snapshot_fn())
+        return True
+
+    def submit(self, step, state):
+        with self.condition:
+            if self.pending is not None:
+                self.counts['coalesced'] += 1
+            self.pending = (step, state)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    self.condition.wait()
+                (step, state) = self.pending
+                self.pending = None
+                self.busy = True
+            try:
+                self.write(step, state)
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        # Blocks until pending snapshots are written. Returns False on timeout.
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending is None and not self.busy, timeout=timeout)
+
+    def path_for(self, step):
+        return os.path.join(self.directory, f"{self.prefix}-{step}.pt")
+
+    def write(self, step, state):
+        path = self.path_for(step)
+        try:
+            buffer = io.BytesIO()
+            self.dump(state, buffer)
+            data = buffer.getvalue()
+            meta = {"step": step, "sha256": hashlib.sha256(data).hexdigest(), "size": len(data), "created_at": time.time()}
+            self.write_atomic(path, data)
+            self.write_atomic(path + ".json", json.dumps(meta).encode("utf-8"))
+            self.counts['saved'] += 1
+            if self.verbose:
+                bt.logging.info(f"Saved checkpoint {path} ({len(data)} bytes)")
+        except Exception as e:
+            self.counts['failed'] += 1
+            bt.logging.error(f"ERROR 4418201: Could not save checkpoint {path}: {e}")
+            return False
+        self.prune()
+        return True
+
+    def write_atomic(self, path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def created_at(self, path):
+        # Write time from the sidecar, falling back to the file's mtime
+        try:
+            with open(path + ".json") as f:
+                return float(json.load(f)['created_at'])
+        except Exception:
+            pass
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+
+    def list_checkpoints(self):
+        # (step, path) pairs, most recently written first
+        out = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return out
+        for name in names:
+            match = self.name_re.match(name)
+            if match:
+                path = os.path.join(self.directory, name)
+                out.append((self.created_at(path), int(match.group(1)), path))
+        out.sort(reverse=True)
+        return [(step, path) for (created_at, step, path) in out]
+
+    def prune(self):
+        for (step, path) in self.list_checkpoints()[self.keep:]:
+            for remove_path in [path, path + ".json"]:
+                try:
+                    os.remove(remove_path)
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    bt.logging.warning(f"WARNING 4418202: Could not remove old checkpoint {remove_path}: {e}")
+
+    def quarantine(self, path):
+        for move_path in [path, path + ".json"]:
+            try:
+                os.replace(move_path, move_path + ".corrupt")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                bt.logging.warning(f"WARNING 4418205: Could not quarantine invalid checkpoint {move_path}: {e}")
+
+    def read_verified(self, path):
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        with open(path, "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != meta.get('sha256'):
+            raise ValueError("sha256 mismatch")
+        return self.load(io.BytesIO(data))
+
+    def load_latest(self):
+        # Returns the newest checkpoint that passes its integrity check, or None
+        for (step, path) in self.list_checkpoints():
+            try:
+                state = self.read_verified(path)
+                self.last_step = step
+                self.last_time = time.time()
+                bt.logging.info(f"Loaded checkpoint {path}")
+                return state
+            except Exception as e:
+                bt.logging.warning(f"WARNING 4418203: Skipping invalid checkpoint {path}: {e}")
+                self.quarantine(path)
+
+        legacy_path = os.path.join(self.directory, self.legacy_name)
+        if os.path.exists(legacy_path):
+            try:
+                with open(legacy_path, "rb") as f:
+                    state = self.load(f)
+                bt.logging.info(f"Loaded legacy state {legacy_path}")
+                return state
+            except Exception as e:
+                bt.logging.warning(f"WARNING 4418204: Could not load legacy state {legacy_path}: {e}")
+        return None
+
+    def stats(self):
+        out = dict(self.counts)
+        out['pending'] = self.pending is not None
+        return out
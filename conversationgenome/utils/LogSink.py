@@ -0,0 +1,137 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from conversationgenome.utils.Utils import Utils
+from conversationgenome.ConfigLib import c
+
+
+# Buffered file logger behind Utils.append_log. write() only appends to an
+# in-memory list; a background thread formats the lines and writes them with
+# one open/write per flush. Files can be rotated by size (path.1, path.2, ...)
+# and written as JSONL instead of the plain "time | text" lines.
+class LogSink:
+    verbose = False
+    flush_interval = 0.5
+    max_buffered = 5000
+    max_bytes = 0
+    backups = 3
+    jsonl = False
+    time_format = "%Y-%m-%d %H:%M:%S"
+
+    def __init__(self, path, flush_interval=None, max_bytes=None, backups=None, jsonl=None):
+        self.path = path
+        if flush_interval:
+            self.flush_interval = flush_interval
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if backups is not None:
+            self.backups = backups
+        if jsonl is not None:
+            self.jsonl = jsonl
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.counts = {"lines":0, "flushes":0, "dropped":0, "rotations":0}
+
+    def write(self, text, **fields):
+        with self.lock:
+            if len(self.buffer) >= self.max_buffered * 2:
+                # The disk can't keep up, drop instead of growing without bound
+                self.counts['dropped'] += 1
+                return
+            self.buffer.append((time.time(), text, fields))
+            count = len(self.buffer)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        if count >= self.max_buffered:
+            self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def format(self, entry):
+        (ts, text, fields) = entry
+        time_str = time.strftime(self.time_format, time.localtime(ts))
+        if self.jsonl:
+            record = {"time": time_str, "ts": ts, "msg": text}
+            record.update(fields)
+            return json.dumps(record, default=str) + "\n"
+        return time_str + " | " + text + "\n"
+
+    def flush(self):
+        with self.lock:
+            entries = self.buffer
+            self.buffer = []
+        if not entries:
+            return
+        data = "".join([self.format(entry) for entry in entries])
+        with self.write_lock:
+            try:
+                self.rotate(len(data))
+                with open(self.path, "a") as f:
+                    f.write(data)
+                self.counts['lines'] += len(entries)
+                self.counts['flushes'] += 1
+            except Exception as e:
+                print(f"ERROR append_log :{e}")
+
+    def rotate(self, incoming):
+        if not self.max_bytes:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming <= self.max_bytes:
+            return
+        for idx in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{idx}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{idx + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.counts['rotations'] += 1
+
+    def stats(self):
+        out = dict(self.counts)
+        out['buffered'] = len(self.buffer)
+        return out
+
+
+log_sinks = {}
+log_sinks_lock = threading.Lock()
+
+def get_log_sink(path):
+    # One sink per path for the process, configured from the environment
+    sink = log_sinks.get(path)
+    if sink:
+        return sink
+    with log_sinks_lock:
+        sink = log_sinks.get(path)
+        if not sink:
+            sink = LogSink(
+                path,
+                flush_interval=Utils._float(c.get('env', 'SCORING_DEBUG_LOG_FLUSH_INTERVAL'), None),
+                max_bytes=Utils._int(c.get('env', 'SCORING_DEBUG_LOG_MAX_BYTES'), None),
+                backups=Utils._int(c.get('env', 'SCORING_DEBUG_LOG_BACKUPS'), None),
+                jsonl=c.get('env', 'SCORING_DEBUG_LOG_FORMAT', 'text') == 'jsonl',
+            )
+            log_sinks[path] = sink
+    return sink
+
+def flush_log_sinks():
+    for sink in list(log_sinks.values()):
+        sink.flush()
+
+atexit.register(flush_log_sinks)
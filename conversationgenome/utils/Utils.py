@@ -221,12 +221,11 @@ class Utils:
 
 
     @staticmethod
-    def append_log(file_path, text_string):
+    def append_log(file_path, text_string, **fields):
+        # Buffered, written by a background thread. Extra fields only show up in JSONL logs.
+        from conversationgenome.utils.LogSink import get_log_sink
         try:
-            if not os.path.exists(file_path):
-                open(file_path, 'w').close()
-            with open(file_path, 'a') as f:
-                f.write(Utils.datetime_str() + " | " + text_string + "\n")
+            get_log_sink(file_path).write(text_string, **fields)
         except Exception as e:
             print(f"ERROR append_log :{e}")
 
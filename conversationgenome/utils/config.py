@@ -160,6 +160,20 @@ def add_miner_args(cls, parser):
         default=False,
     )
 
+    parser.add_argument(
+        "--neuron.max_concurrent_mining",
+        type=int,
+        help="Number of conversation windows mined at the same time. Other windows wait in a stake-priority queue.",
+        default=4,
+    )
+
+    parser.add_argument(
+        "--neuron.max_mining_queue",
+        type=int,
+        help="Windows allowed to wait for a mining slot. Requests beyond this are answered empty right away.",
+        default=64,
+    )
+
     parser.add_argument(
         "--wandb.project_name",
         type=str,
@@ -206,6 +220,62 @@ def add_validator_args(cls, parser):
         default=3,
     )
 
+    parser.add_argument(
+        "--neuron.max_inflight_windows",
+        type=int,
+        help="Number of conversation windows dispatched to disjoint miner sets concurrently. 1 sends windows sequentially.",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--neuron.prefetch_depth",
+        type=int,
+        help="Number of conversations reserved and tagged ahead of time in the background. 0 (the default) disables prefetching.",
+        default=0,
+    )
+
+    parser.add_argument(
+        "--neuron.prefetch_max_age",
+        type=float,
+        help="Seconds after which a prefetched conversation reservation is dropped as stale. Must stay below the API's reservation timeout (600 seconds).",
+        default=480,
+    )
+
+    parser.add_argument(
+        "--neuron.window_quorum",
+        type=float,
+        help="Fraction of the queried miners that must answer before a window is scored. Miners still running are scored as timeouts.",
+        default=1.0,
+    )
+
+    parser.add_argument(
+        "--neuron.window_deadline",
+        type=float,
+        help="Seconds to wait for miner responses to a window before scoring it. 0 uses neuron.timeout.",
+        default=0,
+    )
+
+    parser.add_argument(
+        "--neuron.checkpoint_keep",
+        type=int,
+        help="Number of validator state checkpoints kept on disk.",
+        default=3,
+    )
+
+    parser.add_argument(
+        "--neuron.checkpoint_interval",
+        type=float,
+        help="Minimum seconds between validator state checkpoints.",
+        default=60,
+    )
+
+    parser.add_argument(
+        "--neuron.checkpoint_steps",
+        type=int,
+        help="Steps after which a validator state checkpoint is written even if checkpoint_interval hasn't elapsed.",
+        default=10,
+    )
+
     parser.add_argument(
         "--neuron.disable_set_weights",
         action="store_true",
@@ -36,6 +36,34 @@ def check_uid_availability(
     return True
 
 
+def get_available_uids_mask(
+    metagraph: "bt.metagraph.Metagraph", vpermit_tao_limit: int
+) -> torch.BoolTensor:
+    """Availability of every uid as one boolean mask. Same rules as check_uid_availability.
+    Args:
+        metagraph (:obj: bt.metagraph.Metagraph): Metagraph object
+        vpermit_tao_limit (int): Validator permit tao limit
+    Returns:
+        mask (torch.BoolTensor): True where the uid is available.
+    """
+    # Serving status only exists on the axon objects, everything else is already an array
+    serving = torch.tensor([axon.is_serving for axon in metagraph.axons], dtype=torch.bool)
+    validator_permit = torch.as_tensor(metagraph.validator_permit).to(torch.bool).cpu()
+    stake = torch.as_tensor(metagraph.S).to(torch.float32).cpu()
+    return serving & ~(validator_permit & (stake > vpermit_tao_limit))
+
+
+def get_cached_available_uids_mask(self) -> torch.BoolTensor:
+    """Returns the availability mask, computing it once per metagraph sync. resync_metagraph clears self.available_uids_mask."""
+    mask = getattr(self, "available_uids_mask", None)
+    if mask is None or len(mask) != self.metagraph.n.item():
+        mask = get_available_uids_mask(
+            self.metagraph, self.config.neuron.vpermit_tao_limit
+        )
+        self.available_uids_mask = mask
+    return mask
+
+
 def get_random_uids(
     self, k: int, exclude: List[int] = None
 ) -> torch.LongTensor:
@@ -48,27 +76,21 @@ def get_random_uids(
     Notes:
         If `k` is larger than the number of available `uids`, set `k` to the number of available `uids`.
     """
-    candidate_uids = []
-    avail_uids = []
+    avail_mask = get_cached_available_uids_mask(self)
+    excluded_mask = torch.zeros_like(avail_mask)
+    if exclude:
+        exclude_tensor = torch.as_tensor(list(exclude), dtype=torch.long)
+        exclude_tensor = exclude_tensor[(exclude_tensor >= 0) & (exclude_tensor < len(avail_mask))]
+        excluded_mask[exclude_tensor] = True
+    candidate_uids = torch.nonzero(avail_mask & ~excluded_mask, as_tuple=True)[0]
 
-    for uid in range(self.metagraph.n.item()):
-        uid_is_available = check_uid_availability(
-            self.metagraph, uid, self.config.neuron.vpermit_tao_limit
-        )
-        uid_is_not_excluded = exclude is None or uid not in exclude
-
-        if uid_is_available:
-            avail_uids.append(uid)
-            if uid_is_not_excluded:
-                candidate_uids.append(uid)
     # If k is larger than the number of available uids, set k to the number of available uids.
-    k = min(k, len(avail_uids))
+    k = min(k, int(avail_mask.sum().item()))
     # Check if candidate_uids contain enough for querying, if not grab all avaliable uids
     available_uids = candidate_uids
     if len(candidate_uids) < k:
-        available_uids += random.sample(
-            [uid for uid in avail_uids if uid not in candidate_uids],
-            k - len(candidate_uids),
-        )
-    uids = torch.tensor(random.sample(available_uids, k))
+        excluded_uids = torch.nonzero(avail_mask & excluded_mask, as_tuple=True)[0]
+        extra_uids = excluded_uids[torch.randperm(len(excluded_uids))[: k - len(candidate_uids)]]
+        available_uids = torch.cat([candidate_uids, extra_uids])
+    uids = available_uids[torch.randperm(len(available_uids))[:k]]
     return uids
@@ -0,0 +1,97 @@
+verbose = False
+
+import asyncio
+import random
+import time
+
+from conversationgenome.validator.ValidatorLib import ValidatorLib
+from conversationgenome.mock.MockBt import MockBt
+
+bt = None
+try:
+    import bittensor as bt
+except:
+    if verbose:
+        print("bittensor not installed")
+    bt = MockBt()
+
+
+# Keeps a small queue of conversations that are already reserved and enriched
+# with full conversation metadata and windows. A background task on the
+# validator's event loop refills the queue, so the LLM and embedding latency of
+# the ground truth step overlaps with the miner round trips of the previous
+# conversation instead of starting every forward pass cold.
+class ConvoPrefetcher:
+    verbose = False
+    depth = 1
+    # Seconds after which a prefetched reservation is considered stale and
+    # dropped. Must stay below the API's reservation timeout
+    # (CGP_RESERVATION_TIMEOUT, 600 by default), or the conversation can be
+    # handed to another validator while it still waits in this queue.
+    max_age = 480
+    retry_delay = 5
+
+    def __init__(self, depth=None, max_age=None):
+        if depth:
+            self.depth = depth
+        if max_age:
+            self.max_age = max_age
+        self.vl = ValidatorLib()
+        self.queue = None
+        self.task = None
+        self.counts = {"hits":0, "misses":0, "expired":0, "reserved":0, "failed":0}
+
+    def start(self):
+        # Must be called from the event loop that runs forward()
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.depth)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.fill())
+
+    async def reserve(self):
+        batch_num = random.randint(100000, 9999999)
+        result = None
+        try:
+            result = await self.vl.reserve_conversation(batch_num=batch_num)
+        except Exception as e:
+            bt.logging.error(f"ERROR 7731520: Prefetch reservation failed: {e}")
+        return (batch_num, result)
+
+    async def fill(self):
+        while True:
+            (batch_num, result) = await self.reserve()
+            if not result:
+                self.counts['failed'] += 1
+                await asyncio.sleep(self.retry_delay)
+                continue
+            # Blocks while the queue is full
+            await self.queue.put({"reserved_at": time.time(), "batch_num": batch_num, "result": result})
+            self.counts['reserved'] += 1
+            if self.verbose:
+                bt.logging.info(f"Prefetched conversation batch {batch_num}. Queue depth: {self.queue.qsize()}")
+
+    async def get(self):
+        # Returns (batch_num, result) like an inline reserve. Falls back to reserving
+        # inline when nothing fresh is queued yet.
+        self.start()
+        now = time.time()
+        while not self.queue.empty():
+            entry = self.queue.get_nowait()
+            age = now - entry['reserved_at']
+            if age > self.max_age:
+                self.counts['expired'] += 1
+                bt.logging.info(f"Dropping prefetched conversation batch {entry['batch_num']} reserved {int(age)} seconds ago.")
+                continue
+            self.counts['hits'] += 1
+            return (entry['batch_num'], entry['result'])
+
+        self.counts['misses'] += 1
+        return await self.reserve()
+
+    def stats(self):
+        out = dict(self.counts)
+        lookups = out['hits'] + out['misses']
+        out['depth'] = self.queue.qsize() if self.queue else 0
+        out['max_depth'] = self.depth
+        out['hit_rate'] = out['hits'] / lookups if lookups else 0.0
+        return out
@@ -14,6 +14,7 @@ from conversationgenome.ConfigLib import c
 from conversationgenome.miner.MinerLib import MinerLib
 from conversationgenome.conversation.ConvoLib import ConvoLib
 from conversationgenome.llm.LlmLib import LlmLib
+from conversationgenome.llm.EmbeddingCache import get_embedding_cache
 from conversationgenome.mock.MockBt import MockBt
 
 bt = None
@@ -143,6 +144,9 @@ class ValidatorLib:
 
         tags = result['tags']
         vectors = Utils.get(result, 'vectors', {})
+        cache = get_embedding_cache()
+        if cache:
+            bt.logging.debug(f"Validator: Embedding cache stats: {cache.stats()}")
         data = {
             "participantProfiles": convo['participants'],
             "tags": tags,
@@ -17,6 +17,7 @@ import numpy as np
 
 from conversationgenome.utils.Utils import Utils
 from conversationgenome.ConfigLib import c
+from conversationgenome.protocol import decode_output
 
 from conversationgenome.mock.MockBt import MockBt
 
@@ -34,6 +35,8 @@ class Evaluator:
     min_tags = 3
     max_scored_tags = 20
     verbose = False
+    # Score all miners of a window with one matmul. Set False to use the per-tag path.
+    batch_scoring = True
     scoring_factors = {
         "top_3_mean": 0.55,
         "median_score": 0.1,
@@ -78,7 +81,7 @@ class Evaluator:
 
         log_path = c.get('env', 'SCORING_DEBUG_LOG')
         if not Utils.empty(log_path):
-            Utils.append_log(log_path, f"Evaluator Tag '{tag}' similarity score: {similarity_score}")
+            Utils.append_log(log_path, f"Evaluator Tag '{tag}' similarity score: {similarity_score}", tag=tag, similarity_score=similarity_score)
         return similarity_score
 
     async def calculate_penalty(self, uid, score, num_tags, num_unique_tags, min_score, max_score):
@@ -114,7 +117,34 @@ class Evaluator:
         return final_score
 
 
+    def calculate_penalties(self, scores, num_tags, num_unique_tags, max_scores):
+        # Vectorized calculate_penalty over all miners of a window. Factors are
+        # applied in the same order so results match the per-miner version.
+        final_scores = np.array(scores, dtype=np.float64)
+        num_tags = np.asarray(num_tags)
+        num_unique_tags = np.asarray(num_unique_tags)
+        max_scores = np.asarray(max_scores, dtype=np.float64)
+        num_both_tags = num_tags - num_unique_tags
+
+        # No both tags. Penalize.
+        final_scores = np.where(num_both_tags == 0, final_scores * 0.75, final_scores)
+        # All junk tags. Penalize
+        final_scores = np.where(max_scores < .2, final_scores * 0.5, final_scores)
+        # Very few tags. Penalize.
+        final_scores = np.where(num_tags < 2, final_scores * 0.2, final_scores)
+        # Few or no unique tags. Penalize
+        final_scores = np.where(num_unique_tags < 1, final_scores * 0.85,
+                       np.where(num_unique_tags < 2, final_scores * 0.9,
+                       np.where(num_unique_tags < 3, final_scores * 0.95, final_scores)))
+        bt.logging.debug(f"Penalties -- no BOTH tags: {int(np.sum(num_both_tags == 0))} junk tags: {int(np.sum(max_scores < .2))} < 2 TOTAL tags: {int(np.sum(num_tags < 2))} < 3 unique tags: {int(np.sum(num_unique_tags < 3))}")
+        return final_scores
+
     async def evaluate(self, full_convo_metadata=None, miner_responses=None, body=None, exampleList=None, verbose=None, scoring_factors=None):
+        if self.batch_scoring:
+            return await self.evaluate_batch(full_convo_metadata=full_convo_metadata, miner_responses=miner_responses, verbose=verbose, scoring_factors=scoring_factors)
+        return await self.evaluate_serial(full_convo_metadata=full_convo_metadata, miner_responses=miner_responses, verbose=verbose, scoring_factors=scoring_factors)
+
+    async def evaluate_serial(self, full_convo_metadata=None, miner_responses=None, body=None, exampleList=None, verbose=None, scoring_factors=None):
         if verbose == None:
             verbose = self.verbose
         final_scores = []
@@ -147,6 +177,7 @@ class Evaluator:
                 miner_response = response.cgp_output
             except:
                 miner_response = response
+            miner_response = self.decode_miner_response(miner_response, idx)
             uuid = "uuid-"+str(idx)
             hotkey = "hk-uuid"
             try:
@@ -213,6 +244,20 @@ class Evaluator:
                 bt.logging.debug(f"_______ ADJ SCORE: {adjusted_score} ___Num Tags: {len(miner_result['tags'])} Unique Tag Scores: {scores_unique} Median score: {median_score} Mean score: {mean_score} Top 3 Mean: {top_3_mean} Min: {min_score} Max: {max_score}" )
 
         bt.logging.debug(f"Complete evaluation. Final scores:\n{pprint.pformat(final_scores, indent=2)}")
+        return (final_scores, self.build_rank_scores(final_scores, num_responses))
+
+    def decode_miner_response(self, miner_response, idx):
+        # Expands packed vectors (protocol v2). Responses that can't be decoded are scored as bad responses.
+        if not miner_response:
+            return miner_response
+        try:
+            return [decode_output(miner_response[0])] + list(miner_response[1:])
+        except Exception as e:
+            bt.logging.error(f"ERROR 8830121: Could not decode packed vectors of {idx}-th response: {e}, 0 score")
+            return None
+
+    def build_rank_scores(self, final_scores, num_responses):
+        rank_scores = torch.zeros(num_responses)
         # Force to use cuda if available -- otherwise, causes device mismatch
         try:
             rank_scores = rank_scores.to('cuda')
@@ -221,7 +266,222 @@ class Evaluator:
         # Convert to tensors
         for idx, final_score in enumerate(final_scores):
             rank_scores[idx] = final_scores[idx]['adjustedScore']
-        return (final_scores, rank_scores)
+        return rank_scores
+
+    async def evaluate_batch(self, full_convo_metadata=None, miner_responses=None, verbose=None, scoring_factors=None):
+        if verbose == None:
+            verbose = self.verbose
+        if not scoring_factors:
+            scoring_factors = self.scoring_factors
+
+        full_conversation_neighborhood = await self.calculate_semantic_neighborhood(full_convo_metadata)
+        if verbose:
+            bt.logging.info("full_conversation_neighborhood vector count: ", len(full_conversation_neighborhood))
+
+        num_responses = len(miner_responses)
+        # Keep final_scores in response order. Slots hold either a finished score
+        # dict or the index of the miner result in the batch to be scored.
+        slots = []
+        batch = []
+        for idx, response in enumerate(miner_responses):
+            # TODO: Testing framework returns just response. Make it return cgp_output
+            try:
+                miner_response = response.cgp_output
+            except:
+                miner_response = response
+            miner_response = self.decode_miner_response(miner_response, idx)
+            uuid = "uuid-"+str(idx)
+            hotkey = "hk-uuid"
+            try:
+                uuid = response.axon.uuid
+                hotkey = response.axon.hotkey
+            except:
+                pass
+            if not miner_response:
+                if verbose:
+                    bt.logging.error(f"BAD RESPONSE EVAL: miner index: {idx} HOTKEY: {response.axon.hotkey}")
+                slots.append({"uuid": uuid, "hotkey": hotkey, "adjustedScore":0.0, "final_miner_score":0.0})
+                continue
+            miner_result = miner_response[0]
+            try:
+                # Make sure there are enough tags to make processing worthwhile
+                if miner_result is None or not miner_result or len(miner_result['tags']) < self.min_tags:
+                    bt.logging.info(f"Only {len(miner_result['tags'])} tag(s) found for miner {miner_result['uid']}. Skipping.")
+                    continue
+            except Exception as e:
+                bt.logging.error(f"Error while intitial checking {idx}-th response: {e}, 0 score")
+                bt.logging.debug(print_exception(type(e), e, e.__traceback__))
+            slots.append(len(batch))
+            batch.append((idx, uuid, hotkey, miner_result))
+
+        final_scores = []
+        if len(batch) > 0:
+            results = await self.calc_scores_batch(full_convo_metadata, full_conversation_neighborhood, [item[3] for item in batch])
+            adjusted_scores = (
+                (scoring_factors['top_3_mean'] * results['top_3_mean'])+
+                (scoring_factors['median_score'] * results['median']) +
+                (scoring_factors['mean_score'] * results['mean']) +
+                (scoring_factors['max_score'] * results['max'])
+            )
+            final_miner_scores = self.calculate_penalties(adjusted_scores, results['num_tags'], results['num_unique_tags'], results['max'])
+            for slot in slots:
+                if isinstance(slot, dict):
+                    final_scores.append(slot)
+                    continue
+                (idx, uuid, hotkey, miner_result) = batch[slot]
+                adjusted_score = adjusted_scores[slot]
+                final_scores.append({"uid": idx+1, "uuid": uuid, "hotkey": hotkey, "adjustedScore":adjusted_score, "final_miner_score":final_miner_scores[slot]})
+                bt.logging.debug(f"_______ ADJ SCORE: {adjusted_score} ___Num Tags: {len(miner_result['tags'])} Unique Tag Scores: {results['scores_unique'][slot]} Median score: {results['median'][slot]} Mean score: {results['mean'][slot]} Top 3 Mean: {results['top_3_mean'][slot]} Min: {results['min'][slot]} Max: {results['max'][slot]}" )
+        else:
+            final_scores = slots
+
+        bt.logging.debug(f"Complete evaluation. Final scores:\n{pprint.pformat(final_scores, indent=2)}")
+        return (final_scores, self.build_rank_scores(final_scores, num_responses))
+
+    def tag_vectors_row(self, individual_vectors, dim, tag=None):
+        # Returns the tag's vectors as a float64 row for the batch matrix, or None
+        # where score_vector_similarity would have scored the tag 0.
+        if isinstance(individual_vectors, np.ndarray) and np.all(individual_vectors==0):
+            bt.logging.error("All empty vectors")
+            return None
+        try:
+            row = np.asarray(individual_vectors, dtype=np.float64)
+        except:
+            row = None
+        if dim is None or row is None or row.ndim != 1 or row.shape[0] != dim:
+            bt.logging.error("Error generating similarity_score. Setting to zero.")
+            return None
+        return row
+
+    async def calc_scores_batch(self, full_convo_metadata, full_conversation_neighborhood, miner_results):
+        """
+        Scores the tags of every miner result in one pass. All tag vectors are stacked into a single matrix and compared to the pre-normalized neighborhood with one matmul. Per-miner statistics are segment reductions over the flat score array.
+
+        Returns a dict of per-miner arrays (mean, median, min, max, top_3_mean, num_tags, num_unique_tags) plus the per-miner score lists for logging.
+        """
+        full_convo_tags = full_convo_metadata['tags']
+        num_miners = len(miner_results)
+        log_path = c.get('env', 'SCORING_DEBUG_LOG')
+
+        neighborhood = None
+        dim = None
+        if full_conversation_neighborhood is not None:
+            try:
+                neighborhood = np.asarray(full_conversation_neighborhood, dtype=np.float64)
+                dim = neighborhood.shape[0] if neighborhood.ndim == 1 else None
+            except:
+                neighborhood = None
+
+        counts = np.zeros(num_miners, dtype=np.int64)
+        num_tags = np.zeros(num_miners, dtype=np.int64)
+        num_unique_tags = np.zeros(num_miners, dtype=np.int64)
+        unique_flags = []
+        rows = []
+        row_positions = []
+        scored_tags = []
+        for miner_idx, miner_result in enumerate(miner_results):
+            tags = miner_result['tags']
+            tag_vector_dict = miner_result['vectors']
+
+            # Remove duplicate tags
+            tag_set = list(set(tags))
+            diff = Utils.compare_arrays(full_convo_tags, tag_set)
+            unique_tags = set(diff['unique_2'])
+            if not Utils.empty(log_path):
+                Utils.append_log(log_path, f"Evaluator calculating scores for tag_set: {tag_set}")
+                Utils.append_log(log_path, f"Evaluator diff between ground truth and window -- both: {diff['both']} unique window: {diff['unique_2']}")
+            if len(tag_set) > self.max_scored_tags + 1:
+                bt.logging.debug(f"WARNING 638871: Total tag count ({len(tag_set)}) is greater than max_scored_tags. Only {self.max_scored_tags} will be scored")
+                tag_set = tag_set[0:self.max_scored_tags + 1]
+
+            for tag in tag_set:
+                is_unique = tag in unique_tags
+                if not tag in tag_vector_dict:
+                    bt.logging.error(f"No vectors found for tag '{tag}'. Score of 0. Unique: {is_unique}")
+                else:
+                    row = self.tag_vectors_row(tag_vector_dict[tag]['vectors'], dim, tag)
+                    if row is not None:
+                        row_positions.append(len(unique_flags))
+                        rows.append(row)
+                unique_flags.append(is_unique)
+                scored_tags.append(tag)
+            counts[miner_idx] = len(tag_set)
+            num_tags[miner_idx] = len(diff['both']) + len(diff['unique_2'])
+            num_unique_tags[miner_idx] = len(diff['unique_2'])
+
+        # One matmul for every tag of every miner in the window
+        scores = np.zeros(len(unique_flags), dtype=np.float64)
+        if len(rows) > 0 and neighborhood is not None:
+            matrix = np.vstack(rows)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                neighborhood_unit = neighborhood / np.linalg.norm(neighborhood)
+                scores[row_positions] = (matrix @ neighborhood_unit) / np.linalg.norm(matrix, axis=1)
+        unique_flags = np.array(unique_flags, dtype=bool)
+
+        if not Utils.empty(log_path):
+            for tag, score, is_unique in zip(scored_tags, scores, unique_flags):
+                Utils.append_log(log_path, f"Evaluator Score for '{tag}': {score} -- Unique: {is_unique}", tag=tag, score=score, unique=is_unique)
+
+        # Segment reductions over the flat score array, one segment per miner
+        out = {
+            "num_tags": num_tags,
+            "num_unique_tags": num_unique_tags,
+            "scores": [],
+            "scores_unique": [],
+        }
+        empty = counts == 0
+        safe_counts = np.maximum(counts, 1)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        offsets = np.minimum(offsets, len(scores))
+        # reduceat misreads empty segments, so reduce over the non-empty ones
+        # only. Empty segments are masked afterwards.
+        segment_offsets = offsets[~empty]
+        def segment_reduce(ufunc, values, fill):
+            reduced = np.full(num_miners, fill, dtype=values.dtype)
+            if len(segment_offsets) > 0:
+                reduced[~empty] = ufunc.reduceat(values, segment_offsets)
+            return reduced
+        with np.errstate(invalid='ignore'):
+            out['mean'] = segment_reduce(np.add, scores, 0.0) / safe_counts
+            out['max'] = segment_reduce(np.maximum, scores, 0.0)
+            out['min'] = segment_reduce(np.minimum, scores, 0.0)
+        has_nan = segment_reduce(np.logical_or, np.isnan(scores), False)
+
+        miner_rows = np.repeat(np.arange(num_miners), counts)
+        columns = np.arange(len(scores)) - np.repeat(offsets, counts)
+        width = max(int(counts.max()) if num_miners else 0, 1)
+        grid = np.full((num_miners, width), np.inf)
+        grid[miner_rows, columns] = scores
+        grid.sort(axis=1)
+        low = grid[np.arange(num_miners), (safe_counts - 1) // 2]
+        high = grid[np.arange(num_miners), safe_counts // 2]
+        out['median'] = np.where(has_nan, np.nan, (low + high) / 2)
+
+        # Top 3 unique scores, padded with zeros when a miner has fewer than 3
+        unique_ints = unique_flags.astype(np.int64)
+        unique_counts = segment_reduce(np.add, unique_ints, 0)
+        unique_before = np.cumsum(unique_ints) - unique_ints
+        unique_columns = unique_before - np.repeat(np.append(unique_before, 0)[offsets], counts)
+        unique_width = max(int(unique_counts.max()) if num_miners else 0, 3)
+        unique_grid = np.full((num_miners, unique_width), -np.inf)
+        unique_grid[miner_rows[unique_flags], unique_columns[unique_flags]] = scores[unique_flags]
+        unique_grid.sort(axis=1)
+        top_3 = unique_grid[:, -3:]
+        top_3 = np.where(np.isneginf(top_3), 0.0, top_3)
+        out['top_3_mean'] = np.where(unique_counts == 0, np.nan, top_3.sum(axis=1) / 3)
+
+        for key in ['mean', 'max', 'min', 'median', 'top_3_mean']:
+            out[key] = np.where(empty, np.nan, out[key])
+
+        for miner_idx in range(num_miners):
+            start = offsets[miner_idx]
+            miner_scores = scores[start:start + counts[miner_idx]]
+            miner_unique = unique_flags[start:start + counts[miner_idx]]
+            out['scores'].append(miner_scores)
+            out['scores_unique'].append(miner_scores[miner_unique])
+            bt.logging.info(f"Scores num: {counts[miner_idx]} num of Unique tags: {int(unique_counts[miner_idx])} num of full convo tags: {len(full_convo_tags)}")
+
+        return out
 
     async def calc_scores(self, full_convo_metadata, full_conversation_neighborhood, miner_result):
         full_convo_tags = full_convo_metadata['tags']
@@ -265,7 +525,7 @@ class Evaluator:
             else:
                 scores_both.append(score)
             if not Utils.empty(log_path):
-                Utils.append_log(log_path, f"Evaluator Score for '{tag}': {score} -- Unique: {is_unique}")
+                Utils.append_log(log_path, f"Evaluator Score for '{tag}': {score} -- Unique: {is_unique}", tag=tag, score=score, unique=is_unique)
         bt.logging.info(f"Scores num: {len(scores)} num of Unique tags: {len(scores_unique)} num of full convo tags: {len(full_convo_tags)}")
 
         return (scores, scores_both, scores_unique, diff)
@@ -32,7 +32,9 @@ from conversationgenome.utils.Utils import Utils
 from conversationgenome.base.miner import BaseMinerNeuron
 
 from conversationgenome.miner.MinerLib import MinerLib
-from conversationgenome.protocol import CgSynapse
+from conversationgenome.miner.AdmissionController import AdmissionController
+from conversationgenome.llm.LlmLib import LlmLib
+from conversationgenome.protocol import CgSynapse, encode_output
 
 
 class Miner(BaseMinerNeuron):
@@ -42,6 +44,15 @@ class Miner(BaseMinerNeuron):
         super(Miner, self).__init__(config=config)
         c.set("system", "netuid", self.config.netuid)
 
+        # Load the LLM adapter now instead of on the first synapse
+        LlmLib().warmup()
+
+        # Bounds concurrent do_mining calls and orders waiting windows by stake
+        self.admission = AdmissionController(
+            max_concurrent=self.config.neuron.max_concurrent_mining,
+            max_queue=self.config.neuron.max_mining_queue,
+        )
+
     async def forward(
         self, synapse: CgSynapse
     ) -> CgSynapse:
@@ -66,12 +77,29 @@ class Miner(BaseMinerNeuron):
 
         bt.logging.info(f"Miner received {conversation_guid} / {window_idx} with {len(lines)} conversation lines")
 
+        try:
+            priority = await self.priority(synapse)
+        except Exception as e:
+            priority = 0.0
+        timeout = Utils._float(synapse.timeout, None)
+
         ml = MinerLib()
-        result = await ml.do_mining(conversation_guid, window_idx, lines, 17)
+        (admitted, result) = await self.admission.run(priority, timeout, lambda: ml.do_mining(conversation_guid, window_idx, lines, 17))
+        bt.logging.debug(f"Miner admission stats: {self.admission.stats()}")
+        if not admitted:
+            # Answer right away rather than after the validator stopped waiting
+            bt.logging.warning(f"Shedding {conversation_guid} / {window_idx}: mining queue can't finish within {timeout} seconds. Queue depth: {self.admission.depth()}")
+            return synapse
 
         if not Utils.empty(log_path):
             Utils.append_log(log_path, f"Mined vectors and tags: {result['tags']}")
 
+        # Validators on protocol version 2+ get vectors as one packed matrix
+        protocol_version = Utils._int(Utils.get(window, "protocol_version"), 1)
+        vectors_dtype = c.get('env', 'CGP_VECTORS_DTYPE', 'float32')
+        vectors_compress = Utils._int(c.get('env', 'CGP_VECTORS_COMPRESS', 0), 0)
+        result = encode_output(result, protocol_version, dtype=vectors_dtype, compress=vectors_compress)
+
         synapse.cgp_output = [result]
         return synapse
 
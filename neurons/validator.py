@@ -18,9 +18,12 @@
 
 import time
 import os
+import math
 import hashlib
 import random
+import asyncio
 
+import torch
 import bittensor as bt
 
 from conversationgenome.base.validator import BaseValidatorNeuron
@@ -32,11 +35,14 @@ from conversationgenome.ConfigLib import c
 from conversationgenome.utils.Utils import Utils
 
 from conversationgenome.analytics.WandbLib import WandbLib
+from conversationgenome.llm.EmbeddingCache import get_embedding_cache
+from conversationgenome.llm.LlmLib import LlmLib
 
 from conversationgenome.validator.ValidatorLib import ValidatorLib
+from conversationgenome.validator.ConvoPrefetcher import ConvoPrefetcher
 from conversationgenome.validator.evaluator import Evaluator
 
-from conversationgenome.protocol import CgSynapse
+from conversationgenome.protocol import CgSynapse, PROTOCOL_VERSION, decode_output, vectors_to_lists
 
 class Validator(BaseValidatorNeuron):
     verbose = False
@@ -51,6 +57,13 @@ class Validator(BaseValidatorNeuron):
         bt.logging.info("load_state()")
         self.load_state()
 
+        # Load the LLM adapter now instead of on the first forward pass
+        LlmLib().warmup()
+
+        self.prefetcher = None
+        if self.config.neuron.prefetch_depth > 0:
+            self.prefetcher = ConvoPrefetcher(depth=self.config.neuron.prefetch_depth, max_age=self.config.neuron.prefetch_max_age)
+
     async def forward(self, test_mode=False):
         try:
             wl = WandbLib()
@@ -58,7 +71,6 @@ class Validator(BaseValidatorNeuron):
             miners_per_window = c.get("validator", "miners_per_window", 3)
             miner_sample_size = min(self.config.neuron.sample_size, self.metagraph.n.item())
             bt.logging.debug(f"miner_sample_size: {miner_sample_size}, {self.config.neuron.sample_size}, {self.metagraph.n.item()}")
-            batch_num = random.randint(100000, 9999999)
 
             # Get hotkeys to watch for debugging
             hot_keys = c.get("env", "HIGHLIGHT_HOTKEYS", "")
@@ -68,8 +80,16 @@ class Validator(BaseValidatorNeuron):
             vl = ValidatorLib()
             el = Evaluator()
 
-            # Reserve a conversation from the conversation API
-            result = await vl.reserve_conversation(batch_num=batch_num)
+            # Reserve a conversation from the conversation API. The prefetcher
+            # hands out one that was reserved and tagged in the background.
+            prefetch_stats = {}
+            if self.prefetcher and not test_mode:
+                (batch_num, result) = await self.prefetcher.get()
+                prefetch_stats = self.prefetcher.stats()
+                bt.logging.debug(f"Prefetch queue stats: {prefetch_stats}")
+            else:
+                batch_num = random.randint(100000, 9999999)
+                result = await vl.reserve_conversation(batch_num=batch_num)
 
             if result:
                 (full_conversation, full_conversation_metadata, conversation_windows) = result
@@ -101,6 +121,8 @@ class Validator(BaseValidatorNeuron):
                     pass
 
                 await vl.put_convo(validatorHotkey, conversation_guid, full_conversation_metadata, type="validator",  batch_num=batch_num, window=999)
+                embedding_cache = get_embedding_cache()
+                embedding_cache_stats = embedding_cache.stats() if embedding_cache else {}
                 try:
                     wl.log({
                        "llm_type": llm_type,
@@ -113,6 +135,11 @@ class Validator(BaseValidatorNeuron):
                        "convo_windows_min_lines": min_lines,
                        "convo_windows_max_lines": max_lines,
                        "convo_windows_overlap_lines": overlap_lines,
+                       "embedding_cache_hit_rate": Utils.get(embedding_cache_stats, "hit_rate", 0),
+                       "embedding_cache_lookups": Utils.get(embedding_cache_stats, "lookups", 0),
+                       "prefetch_queue_depth": Utils.get(prefetch_stats, "depth", 0),
+                       "prefetch_hit_rate": Utils.get(prefetch_stats, "hit_rate", 0),
+                       "prefetch_expired": Utils.get(prefetch_stats, "expired", 0),
                        "netuid": self.config.netuid
                     })
                 except:
@@ -120,81 +147,191 @@ class Validator(BaseValidatorNeuron):
 
 
                 # Loop through conversation windows. Send each window to multiple miners
-                bt.logging.info(f"Found {len(conversation_windows)} conversation windows. Sequentially sending to batches of miners")
-                for window_idx, conversation_window in enumerate(conversation_windows):
-                    miner_uids = conversationgenome.utils.uids.get_random_uids(
-                        self,
-                        k= miner_sample_size
-                    )
-                    if self.verbose:
-                        print("miner_uid pool", miner_uids)
-                    if len(miner_uids) == 0:
-                        bt.logging.error("No miners found.")
-                        time.sleep(30)
-                        return
-                    bt.logging.info("miner_uid pool", miner_uids)
-                    # Create a synapse to distribute to miners
-                    bt.logging.info(f"Sending convo {conversation_guid} window {window_idx} of {len(conversation_window)} lines to miners...")
-                    window_packet = {"guid":conversation_guid, "window_idx":window_idx, "lines":conversation_window}
-
-                    synapse = conversationgenome.protocol.CgSynapse(cgp_input = [window_packet])
-
-                    rewards = None
-
-                    responses = self.dendrite.query(
-                        axons=[self.metagraph.axons[uid] for uid in miner_uids],
-                        synapse=synapse,
-                        deserialize=False,
-                    )
-                    if self.verbose:
-                        print("RAW RESPONSES", len(responses))
-
-                    for window_idx, response in enumerate(responses):
-                        if not response.cgp_output:
-                            #bt.logging.error(f"BAD RESPONSE: hotkey: {response.axon.hotkey} output: {response.cgp_output}")
-                            bt.logging.debug(f"BAD RESPONSE: hotkey: {response.axon.hotkey}")
-                            if response.axon.hotkey in hot_key_watchlist:
-                                print(f"!!!!!!!!!!! BAD WATCH: {response.axon.hotkey} !!!!!!!!!!!!!")
-                            continue
-                        #bt.logging.debug(f"GOOD RESPONSE: {response.axon.uuid}, {response.axon.hotkey}, {response.axon}, " )
-                        bt.logging.debug(f"GOOD RESPONSE: hotkey: {response.axon.hotkey}" )
-                        if response.axon.hotkey in hot_key_watchlist:
-                            print(f"!!!!!!!!!!! GOOD WATCH: {response.axon.hotkey} !!!!!!!!!!!!!")
-                        log_path = c.get('env', 'SCORING_DEBUG_LOG')
-                        if not Utils.empty(log_path):
-                            Utils.append_log(log_path, f"CGP Received tags: {response.cgp_output[0]['tags']} -- PUTTING OUTPUT")
-                        await vl.put_convo(response.axon.hotkey, conversation_guid, response.cgp_output[0], type="miner",  batch_num=batch_num, window=window_idx)
-
-                    (final_scores, rank_scores) = await el.evaluate(full_convo_metadata=full_conversation_metadata, miner_responses=responses)
-
-                    
-
-                    for idx, score in enumerate(final_scores):
-                        if self.verbose:
-                            bt.logging.info(f"score {score}")
-
-                        uid=-1
-                        try:
-                            uid = str(self.metagraph.hotkeys.index(Utils.get(score, "hotkey")))
-                        except Exception as e:
-                            print(f"ERROR 1162494 -- WandB logging error: {e}") 
-                        wl.log({
-                            "conversation_guid."+uid: conversation_guid,
-                            "window_id."+uid: window_idx,
-                            "hotkey."+uid: Utils.get(score, "hotkey"),
-                            "adjusted_score."+uid: Utils.get(score, "adjustedScore"),
-                            "final_miner_score."+uid: Utils.get(score, "final_miner_score"),
-                        })
-                        if self.verbose:
-                            print("^^^^^^RANK", final_scores, rank_scores, len(final_scores), miner_uids)
-
-                    # Update the scores based on the rewards.
-                    self.update_scores(rank_scores, miner_uids)
+                max_inflight_windows = max(1, self.config.neuron.max_inflight_windows)
+                if max_inflight_windows == 1:
+                    bt.logging.info(f"Found {len(conversation_windows)} conversation windows. Sequentially sending to batches of miners")
+                    for window_idx, conversation_window in enumerate(conversation_windows):
+                        window_result = await self.process_window(vl, el, wl, conversation_guid, full_conversation_metadata, window_idx, conversation_window, batch_num, miner_sample_size, hot_key_watchlist)
+                        if window_result is False:
+                            await asyncio.sleep(30)
+                            return
+                else:
+                    bt.logging.info(f"Found {len(conversation_windows)} conversation windows. Sending up to {max_inflight_windows} windows concurrently to disjoint batches of miners")
+                    window_semaphore = asyncio.Semaphore(max_inflight_windows)
+                    busy_uids = set()
+
+                    async def run_window(window_idx, conversation_window):
+                        async with window_semaphore:
+                            return await self.process_window(vl, el, wl, conversation_guid, full_conversation_metadata, window_idx, conversation_window, batch_num, miner_sample_size, hot_key_watchlist, busy_uids=busy_uids)
+
+                    window_results = await asyncio.gather(*[run_window(window_idx, conversation_window) for window_idx, conversation_window in enumerate(conversation_windows)], return_exceptions=True)
+                    for window_idx, window_result in enumerate(window_results):
+                        if isinstance(window_result, Exception):
+                            bt.logging.error(f"ERROR 2294376 -- Window {window_idx} failed: {window_result}")
             else:
                 bt.logging.error(f"No conversation received from endpoint")
         except Exception as e:
             bt.logging.error(f"ERROR 2294374 -- Top Level Validator Error: {e}")
 
+    async def query_miners(self, uids, synapse, on_response=None):
+        """
+        Queries each miner separately and hands every response to on_response as soon as it arrives.
+
+        Stops waiting once window_quorum of the miners answered with output or window_deadline seconds passed. Miners that haven't answered by then are cancelled and returned as 408 timeouts, so they score like any other empty response. Responses are returned in the order of uids.
+        """
+        axons = [self.metagraph.axons[uid] for uid in uids]
+        timeout = self.config.neuron.timeout
+        if self.config.mock:
+            responses = await self.dendrite.forward(axons=axons, synapse=synapse, timeout=timeout, deserialize=False)
+            if on_response:
+                for response in responses:
+                    on_response(response)
+            return responses
+
+        deadline = self.config.neuron.window_deadline or timeout
+        quorum = max(1, math.ceil(len(axons) * self.config.neuron.window_quorum))
+        start_time = time.time()
+        # Deep copies, so each request has its own axon and dendrite terminal info
+        requests = [synapse.copy(deep=True) for axon in axons]
+        tasks = {}
+        for idx, axon in enumerate(axons):
+            task = asyncio.ensure_future(self.dendrite.call(target_axon=axon, synapse=requests[idx], timeout=timeout, deserialize=False))
+            tasks[task] = idx
+
+        responses = [None] * len(axons)
+        answered = 0
+        pending = set(tasks.keys())
+        try:
+            while pending and answered < quorum:
+                remaining = deadline - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                (done, pending) = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    idx = tasks[task]
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        bt.logging.error(f"ERROR 3381940: Query to uid {uids[idx]} failed: {e}")
+                        continue
+                    responses[idx] = response
+                    if on_response:
+                        on_response(response)
+                    if response.cgp_output:
+                        answered += 1
+        finally:
+            for task in pending:
+                task.cancel()
+
+        late = 0
+        for idx, response in enumerate(responses):
+            if response is None:
+                late += 1
+                response = requests[idx]
+                response.axon.hotkey = axons[idx].hotkey
+                response.dendrite.status_code = 408
+                response.dendrite.status_message = "Timeout"
+                response.cgp_output = None
+                responses[idx] = response
+        bt.logging.info(f"{answered} of {len(axons)} miners answered in {time.time() - start_time:.2f} seconds. {late} late.")
+        return responses
+
+    async def process_window(self, vl, el, wl, conversation_guid, full_conversation_metadata, window_idx, conversation_window, batch_num, miner_sample_size, hot_key_watchlist, busy_uids=None):
+        """
+        Sends one conversation window to a sample of miners, uploads their responses, scores them and updates the moving averages.
+
+        When busy_uids is passed, miners already working on another in-flight window are excluded so concurrent windows use disjoint miner sets. Returns False if no miners were available.
+        """
+        exclude = list(busy_uids) if busy_uids else None
+        miner_uids = conversationgenome.utils.uids.get_random_uids(
+            self,
+            k= miner_sample_size,
+            exclude=exclude,
+        )
+        if busy_uids is not None:
+            # get_random_uids tops up from excluded uids when there aren't enough candidates
+            disjoint_uids = [uid for uid in miner_uids.tolist() if uid not in busy_uids]
+            if len(disjoint_uids) > 0:
+                miner_uids = torch.tensor(disjoint_uids)
+        if self.verbose:
+            print("miner_uid pool", miner_uids)
+        if len(miner_uids) == 0:
+            bt.logging.error("No miners found.")
+            return False
+        bt.logging.info("miner_uid pool", miner_uids)
+        window_uids = miner_uids.tolist()
+        if busy_uids is not None:
+            busy_uids.update(window_uids)
+
+        uploads = []
+        def handle_response(response):
+            # Runs as each miner answers, so decoding and uploads overlap with slower miners
+            if not response.cgp_output:
+                return
+            # Decode packed vectors once for both the upload and scoring
+            try:
+                response.cgp_output = [decode_output(response.cgp_output[0])]
+            except Exception as e:
+                bt.logging.error(f"ERROR 8830122: Bad packed vectors from hotkey: {response.axon.hotkey}: {e}")
+                response.cgp_output = None
+                return
+            #bt.logging.debug(f"GOOD RESPONSE: {response.axon.uuid}, {response.axon.hotkey}, {response.axon}, " )
+            bt.logging.debug(f"GOOD RESPONSE: hotkey: {response.axon.hotkey}" )
+            if response.axon.hotkey in hot_key_watchlist:
+                print(f"!!!!!!!!!!! GOOD WATCH: {response.axon.hotkey} !!!!!!!!!!!!!")
+            log_path = c.get('env', 'SCORING_DEBUG_LOG')
+            if not Utils.empty(log_path):
+                Utils.append_log(log_path, f"CGP Received tags: {response.cgp_output[0]['tags']} -- PUTTING OUTPUT")
+            uploads.append(asyncio.ensure_future(vl.put_convo(response.axon.hotkey, conversation_guid, vectors_to_lists(response.cgp_output[0]), type="miner",  batch_num=batch_num, window=window_idx)))
+
+        try:
+            # Create a synapse to distribute to miners
+            bt.logging.info(f"Sending convo {conversation_guid} window {window_idx} of {len(conversation_window)} lines to miners...")
+            window_packet = {"guid":conversation_guid, "window_idx":window_idx, "lines":conversation_window, "protocol_version":PROTOCOL_VERSION}
+
+            synapse = conversationgenome.protocol.CgSynapse(cgp_input = [window_packet])
+
+            responses = await self.query_miners(window_uids, synapse, on_response=handle_response)
+        finally:
+            if busy_uids is not None:
+                busy_uids.difference_update(window_uids)
+        if self.verbose:
+            print("RAW RESPONSES", len(responses))
+
+        for response in responses:
+            if not response.cgp_output:
+                #bt.logging.error(f"BAD RESPONSE: hotkey: {response.axon.hotkey} output: {response.cgp_output}")
+                bt.logging.debug(f"BAD RESPONSE: hotkey: {response.axon.hotkey}")
+                if response.axon.hotkey in hot_key_watchlist:
+                    print(f"!!!!!!!!!!! BAD WATCH: {response.axon.hotkey} !!!!!!!!!!!!!")
+        if uploads:
+            await asyncio.gather(*uploads)
+
+        (final_scores, rank_scores) = await el.evaluate(full_convo_metadata=full_conversation_metadata, miner_responses=responses)
+
+        for idx, score in enumerate(final_scores):
+            if self.verbose:
+                bt.logging.info(f"score {score}")
+
+            uid=-1
+            try:
+                uid = str(self.metagraph.hotkeys.index(Utils.get(score, "hotkey")))
+            except Exception as e:
+                print(f"ERROR 1162494 -- WandB logging error: {e}")
+            wl.log({
+                "conversation_guid."+uid: conversation_guid,
+                "window_id."+uid: window_idx,
+                "hotkey."+uid: Utils.get(score, "hotkey"),
+                "adjusted_score."+uid: Utils.get(score, "adjustedScore"),
+                "final_miner_score."+uid: Utils.get(score, "final_miner_score"),
+            })
+            if self.verbose:
+                print("^^^^^^RANK", final_scores, rank_scores, len(final_scores), miner_uids)
+
+        # Update the scores based on the rewards.
+        self.update_scores(rank_scores, miner_uids)
+        return True
+
 # The main function parses the configuration and runs the validator.
 if __name__ == "__main__":
     
@@ -0,0 +1,55 @@
+import pytest
+import asyncio
+
+from conversationgenome.miner.AdmissionController import AdmissionController
+
+
+@pytest.mark.asyncio
+async def test_admission_bounds_concurrency_and_orders_by_stake():
+    ac = AdmissionController(max_concurrent=1, max_queue=10)
+    running = []
+    order = []
+
+    async def work(name):
+        running.append(name)
+        assert len(running) == 1
+        await asyncio.sleep(0.02)
+        order.append(name)
+        running.remove(name)
+        return name
+
+    first = asyncio.ensure_future(ac.run(1.0, None, lambda: work("first")))
+    await asyncio.sleep(0)
+    low = asyncio.ensure_future(ac.run(10.0, None, lambda: work("low")))
+    high = asyncio.ensure_future(ac.run(5000.0, None, lambda: work("high")))
+    await asyncio.sleep(0)
+    assert ac.stats()['depth'] == 2
+    results = await asyncio.gather(first, low, high)
+    assert order == ["first", "high", "low"]
+    assert results[1] == (True, "low")
+    assert ac.stats()['completed'] == 3
+
+@pytest.mark.asyncio
+async def test_admission_sheds_when_wait_exceeds_timeout():
+    ac = AdmissionController(max_concurrent=1, max_queue=2)
+    ac.avg_service = 0.2
+
+    async def work():
+        await asyncio.sleep(0.2)
+        return True
+
+    busy = asyncio.ensure_future(ac.run(1.0, 1.0, work))
+    await asyncio.sleep(0)
+    # Expected wait 0.2 plus 0.2 of mining fits in 1 second, but not in 0.3
+    queued = asyncio.ensure_future(ac.run(1.0, 1.0, work))
+    await asyncio.sleep(0)
+    assert await ac.run(1.0, 0.3, work) == (False, None)
+    assert ac.stats()['shed_wait'] == 1
+    queued2 = asyncio.ensure_future(ac.run(1.0, 10.0, work))
+    await asyncio.sleep(0)
+    # Both queue slots are taken
+    assert await ac.run(1.0, 10.0, work) == (False, None)
+    assert ac.stats()['shed_queue_full'] == 1
+    assert (await queued)[0] is True
+    assert (await queued2)[0] is True
+    await busy
@@ -0,0 +1,96 @@
+import pytest
+from types import SimpleNamespace
+
+import torch
+
+from neurons.validator import Validator
+
+
+def make_validator(num_uids=8, alpha=0.1):
+    validator = Validator.__new__(Validator)
+    validator.config = SimpleNamespace(neuron=SimpleNamespace(moving_average_alpha=alpha))
+    validator.device = "cpu"
+    validator.scores = torch.rand(num_uids)
+    return validator
+
+
+def baseline_update(scores, rewards, uids, alpha):
+    # The original update_scores step
+    rewards = torch.nan_to_num(torch.as_tensor(rewards, dtype=scores.dtype), 0)
+    scattered = scores.scatter(0, torch.as_tensor(uids, dtype=torch.long), rewards)
+    return alpha * scattered + (1 - alpha) * scores
+
+
+def test_update_scores_matches_baseline():
+    torch.manual_seed(7)
+    validator = make_validator()
+    expected = validator.scores.clone()
+
+    cases = [
+        (torch.tensor([0.5, 0.9, 0.1]), [1, 4, 6]),
+        # NaN rewards count as 0
+        (torch.tensor([float("nan"), 0.7]), torch.tensor([2, 3])),
+        # Duplicate uid within one set, the last reward wins as with scatter
+        (torch.tensor([0.2, 0.8, 0.4]), [5, 7, 5]),
+    ]
+    for (rewards, uids) in cases:
+        validator.update_scores(rewards, uids)
+        expected = baseline_update(expected, rewards, uids, 0.1)
+        assert torch.allclose(validator.scores, expected)
+
+
+def test_update_scores_list_form_matches_sequential_baseline():
+    torch.manual_seed(11)
+    validator = make_validator(alpha=0.3)
+    expected = validator.scores.clone()
+
+    # Disjoint sets take the fused path, overlapping sets one step per set
+    for reward_sets in [
+        [(torch.tensor([0.5, 0.9]), [0, 1]), (torch.tensor([0.3, float("nan")]), [2, 3])],
+        [(torch.tensor([0.5, 0.9]), [0, 1]), (torch.tensor([0.3, 0.6]), [1, 0]), (torch.tensor([1.0]), [1])],
+    ]:
+        validator.update_scores(reward_sets)
+        for (rewards, uids) in reward_sets:
+            expected = baseline_update(expected, rewards, uids, 0.3)
+        assert torch.allclose(validator.scores, expected)
+
+    before = validator.scores.clone()
+    validator.update_scores([])
+    assert torch.equal(validator.scores, before)
+
+
+class MockMetagraph:
+    def __init__(self, hotkeys):
+        self.set_hotkeys(hotkeys)
+        self.next_hotkeys = None
+
+    def set_hotkeys(self, hotkeys):
+        self.hotkeys = list(hotkeys)
+        self.axons = [SimpleNamespace(ip="1.2.3.4", port=8091, ip_type=4, version=1, hotkey=hotkey, coldkey="coldkey") for hotkey in hotkeys]
+
+    def sync(self, subtensor=None):
+        if self.next_hotkeys is not None:
+            self.set_hotkeys(self.next_hotkeys)
+
+
+def test_resync_metagraph_resets_replaced_hotkeys():
+    hotkeys = [f"hotkey-{uid}" for uid in range(5)]
+    validator = make_validator(num_uids=5)
+    validator.subtensor = None
+    validator.metagraph = MockMetagraph(hotkeys)
+    validator.hotkeys = list(hotkeys)
+    validator.scores = torch.ones(5)
+    validator.available_uids_mask = torch.ones(5, dtype=torch.bool)
+
+    # Nothing changed, scores are kept
+    validator.resync_metagraph()
+    assert torch.equal(validator.scores, torch.ones(5))
+    assert validator.available_uids_mask is None
+
+    # uid 2 is taken over by a new hotkey and two uids are added
+    validator.available_uids_mask = torch.ones(5, dtype=torch.bool)
+    validator.metagraph.next_hotkeys = hotkeys[:2] + ["hotkey-new"] + hotkeys[3:] + ["hotkey-5", "hotkey-6"]
+    validator.resync_metagraph()
+    assert validator.scores.tolist() == [1, 1, 0, 1, 1, 0, 0]
+    assert validator.hotkeys == validator.metagraph.hotkeys
+    assert validator.available_uids_mask is None
@@ -0,0 +1,54 @@
+import os
+import pickle
+
+from conversationgenome.utils.CheckpointManager import CheckpointManager
+
+
+def make_manager(path, **kwargs):
+    return CheckpointManager(str(path), dump=pickle.dump, load=pickle.load, **kwargs)
+
+
+def test_checkpoint_throttle_and_keep(tmp_path):
+    cm = make_manager(tmp_path, keep=2, min_interval=3600, min_steps=5)
+    for step in range(0, 20):
+        cm.maybe_save(step, lambda: {"step": step})
+        cm.flush(timeout=5)
+    # Saved at steps 0, 5, 10, 15 and only the last two are kept
+    assert [step for (step, path) in cm.list_checkpoints()] == [15, 10]
+    assert cm.stats()['skipped'] == 16
+    assert make_manager(tmp_path).load_latest() == {"step": 15}
+
+
+def test_checkpoint_falls_back_past_corrupt_file(tmp_path):
+    cm = make_manager(tmp_path, keep=3, min_steps=1)
+    for step in [1, 2]:
+        cm.maybe_save(step, lambda: {"step": step})
+        cm.flush(timeout=5)
+    with open(cm.path_for(2), "ab") as f:
+        f.write(b"garbage")
+    assert make_manager(tmp_path).load_latest() == {"step": 1}
+
+
+def test_checkpoint_legacy_state(tmp_path):
+    with open(os.path.join(tmp_path, "state.pt"), "wb") as f:
+        pickle.dump({"step": 7}, f)
+    assert make_manager(tmp_path).load_latest() == {"step": 7}
+
+
+def test_checkpoint_fresh_start_keeps_new_checkpoints(tmp_path):
+    cm = make_manager(tmp_path, keep=2, min_steps=1)
+    for step in [100, 101]:
+        cm.maybe_save(step, lambda: {"step": step})
+        cm.flush(timeout=5)
+        with open(cm.path_for(step), "ab") as f:
+            f.write(b"garbage")
+
+    # Every checkpoint is corrupt, so the validator starts over at step 0
+    cm = make_manager(tmp_path, keep=2, min_steps=1)
+    assert cm.load_latest() is None
+    assert os.path.exists(cm.path_for(101) + ".corrupt")
+    for step in [0, 1, 2]:
+        cm.maybe_save(step, lambda: {"step": step})
+        cm.flush(timeout=5)
+    assert [step for (step, path) in cm.list_checkpoints()] == [2, 1]
+    assert make_manager(tmp_path).load_latest() == {"step": 2}
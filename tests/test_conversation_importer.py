@@ -0,0 +1,76 @@
+import pytest
+import csv
+import json
+import os
+import sqlite3
+import sys
+import uuid
+
+pytest.importorskip("faker")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web"))
+from conversation_data_importer import ConversationDbProcessor
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = str(tmp_path / "chat.csv")
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["id", "Persona", "chat"])
+        for idx in range(7):
+            chat = "\n".join([f"line {idx}-{line_idx}, with a comma " for line_idx in range(idx % 3 + 1)])
+            writer.writerow([idx, f" persona {idx} ", chat])
+    return path
+
+
+def import_rows(tmp_path, csv_path, name, bulk=False, workers=1):
+    db_path = str(tmp_path / f"{name}.sqlite")
+    cdp = ConversationDbProcessor(db_name=db_path)
+    cdp.raw_data_path = csv_path
+    if bulk:
+        cdp.chunk_size = 3
+        cdp.workers = workers
+        cdp.process_conversation_csv_bulk()
+    else:
+        cdp.max_rows = 100
+        cdp.process_conversation_csv()
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT source_id, idx, topic, guid, json FROM conversations ORDER BY id").fetchall()
+    conn.close()
+    return rows
+
+
+def comparable(rows):
+    # Everything except the generated GUIDs and fake participant names
+    out = []
+    for (source_id, idx, topic, guid, data) in rows:
+        data = json.loads(data)
+        assert str(data['guid']) == guid
+        participants = {key: val['idx'] for key, val in data['participant'].items()}
+        out.append((source_id, idx, topic, data['id'], data['topic'], data['lines'], participants))
+    return out
+
+
+def all_guids(rows):
+    guids = []
+    for row in rows:
+        data = json.loads(row[4])
+        guids.append(data['guid'])
+        guids.extend(participant['guid'] for participant in data['participant'].values())
+    return guids
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bulk_import_matches_row_by_row(tmp_path, csv_path, workers):
+    expected = import_rows(tmp_path, csv_path, "serial")
+    rows = import_rows(tmp_path, csv_path, f"bulk_{workers}", bulk=True, workers=workers)
+    assert len(rows) == 7
+    assert comparable(rows) == comparable(expected)
+
+    # GUIDs come from Utils.guid(), as with the row-by-row importer
+    guids = all_guids(rows)
+    assert len(set(guids)) == len(guids)
+    for guid in guids:
+        assert isinstance(guid, int)
+        assert uuid.UUID(int=guid).version == 1
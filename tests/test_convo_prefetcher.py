@@ -0,0 +1,42 @@
+import pytest
+import asyncio
+
+from conversationgenome.validator.ConvoPrefetcher import ConvoPrefetcher
+
+
+class MockValidatorLib:
+    calls = 0
+
+    async def reserve_conversation(self, minConvWindows = 1, batch_num=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return ({"guid": self.calls}, {"tags":[]}, [["line"]])
+
+
+@pytest.mark.asyncio
+async def test_prefetch_hit_after_fill():
+    pf = ConvoPrefetcher(depth=2)
+    pf.vl = MockValidatorLib()
+    # Cold start reserves inline
+    (batch_num, result) = await pf.get()
+    assert result is not None
+    assert pf.stats()['misses'] == 1
+
+    await asyncio.sleep(0.1)
+    stats = pf.stats()
+    assert stats['depth'] == 2
+    (batch_num, result) = await pf.get()
+    assert pf.stats()['hits'] == 1
+    pf.task.cancel()
+
+@pytest.mark.asyncio
+async def test_prefetch_expires_stale():
+    pf = ConvoPrefetcher(depth=1, max_age=0.05)
+    pf.vl = MockValidatorLib()
+    pf.start()
+    await asyncio.sleep(0.1)
+    (batch_num, result) = await pf.get()
+    stats = pf.stats()
+    assert stats['expired'] == 1
+    assert stats['misses'] == 1
+    pf.task.cancel()
@@ -0,0 +1,42 @@
+import json
+import os
+
+from conversationgenome.conversation.ConvoStore import ConvoStore
+
+
+def write_corpus(path, num_convos):
+    convos = {}
+    for i in range(num_convos):
+        convos[str(i + 24)] = {
+            "guid": 1000 + i,
+            "participant": {"0": {"idx": 0, "title": "Zoë"}},
+            "lines": [[0, f"line {i} café ☕"], [1, 'answer , with "quotes" and {braces}']],
+        }
+    with open(path, "w") as f:
+        json.dump(convos, f, ensure_ascii=False)
+    return convos
+
+def test_convo_store_offsets_match_json(tmp_path, monkeypatch):
+    path = str(tmp_path / "convos.json")
+    convos = write_corpus(path, 50)
+    # Small chunks so entries and multi-byte characters straddle chunk boundaries
+    monkeypatch.setattr(ConvoStore, "chunk_size", 97)
+    store = ConvoStore(path)
+    assert len(store) == 50
+    assert store.keys == list(convos.keys())
+    for idx, key in enumerate(store.keys):
+        assert store.get(idx) == convos[key]
+    assert store.get_next()['guid'] == 1000
+    assert store.get_next()['guid'] == 1001
+    assert store.get_random()['guid'] >= 1000
+
+def test_convo_store_index_reused(tmp_path, monkeypatch):
+    path = str(tmp_path / "convos.json")
+    write_corpus(path, 3)
+    store = ConvoStore(path)
+    assert os.path.exists(path + ".idx")
+
+    # A matching index is loaded instead of rescanning the corpus
+    monkeypatch.setattr(ConvoStore, "build_index", None)
+    store2 = ConvoStore(path)
+    assert store2.offsets == store.offsets
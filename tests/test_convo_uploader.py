@@ -0,0 +1,85 @@
+import pytest
+import asyncio
+
+from conversationgenome.api.ApiLib import ApiLib
+from conversationgenome.conversation.ConvoUploader import ConvoUploader
+
+
+@pytest.mark.asyncio
+async def test_bulk_upload_flush_on_size(monkeypatch):
+    sent = []
+    async def mock_put_bulk(self, records):
+        sent.append(records)
+        return True
+    monkeypatch.setattr(ApiLib, "put_conversation_data_bulk", mock_put_bulk)
+
+    uploader = ConvoUploader(max_records=3, flush_interval=60, journal_path=None)
+    for i in range(4):
+        uploader.add(f"guid-{i}", {"hotkey": i}, batch_num=1)
+    uploader.add("guid-x", {"hotkey": "x"}, batch_num=2)
+    await asyncio.sleep(0.01)
+    # Batch 1 reached max_records and went out as one request
+    assert len(sent) == 1
+    assert [record['c_guid'] for record in sent[0]] == ["guid-0", "guid-1", "guid-2"]
+    assert uploader.stats()['buffered'] == 2
+
+    await uploader.flush()
+    assert len(sent) == 3
+    assert uploader.stats()['buffered'] == 0
+    uploader.task.cancel()
+
+@pytest.mark.asyncio
+async def test_bulk_upload_journal_replay(monkeypatch, tmp_path):
+    sent = []
+    api_up = False
+    async def mock_put_bulk(self, records):
+        if not api_up:
+            return False
+        sent.append(records)
+        return True
+    monkeypatch.setattr(ApiLib, "put_conversation_data_bulk", mock_put_bulk)
+
+    uploader = ConvoUploader(max_records=10, flush_interval=60, journal_path=str(tmp_path / "journal.jsonl"))
+    uploader.add("guid-1", {"hotkey": 1}, batch_num=1)
+    uploader.add("guid-2", {"hotkey": 2}, batch_num=1)
+    await uploader.flush()
+    assert uploader.stats()['journaled'] == 2
+    assert len(sent) == 0
+
+    api_up = True
+    await uploader.replay_journal()
+    assert len(sent) == 1
+    assert [record['data']['hotkey'] for record in sent[0]] == [1, 2]
+    assert uploader.stats()['replayed'] == 2
+    assert not (tmp_path / "journal.jsonl").exists()
+    uploader.task.cancel()
+
+def test_bulk_upload_close_flushes_or_journals(monkeypatch, tmp_path):
+    sent = []
+    async def mock_put_bulk(self, records):
+        sent.append(records)
+        return True
+    monkeypatch.setattr(ApiLib, "put_conversation_data_bulk", mock_put_bulk)
+
+    async def add_records(uploader):
+        uploader.add("guid-1", {"hotkey": 1}, batch_num=1)
+        uploader.add("guid-2", {"hotkey": 2}, batch_num=2)
+
+    # Shutdown with an idle event loop sends what is still buffered
+    loop = asyncio.new_event_loop()
+    uploader = ConvoUploader(max_records=10, flush_interval=60, journal_path=str(tmp_path / "journal.jsonl"))
+    loop.run_until_complete(add_records(uploader))
+    uploader.close(loop)
+    assert len(sent) == 2
+    assert uploader.stats()['buffered'] == 0
+
+    # Without a usable loop the buffered records go to the journal
+    uploader = ConvoUploader(max_records=10, flush_interval=60, journal_path=str(tmp_path / "journal.jsonl"))
+    loop.run_until_complete(add_records(uploader))
+    uploader.task.cancel()
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.close()
+    uploader.close(loop)
+    assert len(sent) == 2
+    assert uploader.stats()['journaled'] == 2
+    assert len((tmp_path / "journal.jsonl").read_text().splitlines()) == 2
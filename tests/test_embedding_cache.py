@@ -0,0 +1,45 @@
+import pytest
+
+from conversationgenome.llm.EmbeddingCache import EmbeddingCache
+
+
+def test_embedding_cache_memory_hit():
+    cache = EmbeddingCache(max_items=2)
+    cache.set("ada", "Music", [0.5, 0.25])
+    assert cache.get("ada", " music ") == [0.5, 0.25]
+    assert cache.get("other-model", "music") is None
+    stats = cache.stats()
+    assert stats['memory_hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+
+def test_embedding_cache_lru_eviction():
+    cache = EmbeddingCache(max_items=2)
+    cache.set_many("ada", ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+    assert cache.get("ada", "a") is None
+    assert cache.get("ada", "c") == [3.0]
+
+def test_embedding_cache_persistent(tmp_path):
+    db_path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(db_path=db_path)
+    cache.set_many("ada", ["travel", "cooking"], [[0.5, -0.5], [0.25, 1.0]])
+
+    # New instance has an empty LRU, so values must come from SQLite
+    cache2 = EmbeddingCache(db_path=db_path)
+    result = cache2.get_many("ada", ["cooking", "hiking", "travel"])
+    assert result == [[0.25, 1.0], None, [0.5, -0.5]]
+    stats = cache2.stats()
+    assert stats['disk_hits'] == 2
+    assert stats['misses'] == 1
+
+@pytest.mark.asyncio
+async def test_embedding_cache_async_keeps_float32(tmp_path):
+    db_path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(db_path=db_path)
+    await cache.set_many_async("ada", ["travel\nplans"], [[0.5] * 1536])
+    # Stored compactly, handed back as plain lists
+    assert cache.lru[("ada", "travel plans")].itemsize == 4
+    assert (await cache.get_many_async("ada", ["travel plans"]))[0] == [0.5] * 1536
+
+    cache2 = EmbeddingCache(db_path=db_path)
+    assert (await cache2.get_many_async("ada", ["Travel plans"]))[0] == [0.5] * 1536
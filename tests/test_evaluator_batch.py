@@ -0,0 +1,175 @@
+import base64
+import pytest
+import random
+import zlib
+
+import numpy as np
+
+from conversationgenome.validator.evaluator import Evaluator
+from conversationgenome.protocol import PROTOCOL_VERSION, pack_vectors, unpack_vectors, encode_output, decode_output
+
+
+class MockAxon:
+    hotkey = "123"
+    uuid = "345"
+
+class MockMinerResponse:
+    cgp_output = []
+    axon = None
+
+    def __init__(self, uid, num_tags=None):
+        self.axon = MockAxon()
+        possible_tags = {
+            "hello":{"vectors":[0.1, 0.5]},
+            "goodbye":{"vectors":[-0.1, -0.5]},
+            "world":{"vectors":[0.9, 0.81]},
+            "basketball":{"vectors":[0.5, 0.51]},
+            "pizza":{"vectors":[0.4, 0.41]},
+            "egg":{"vectors":[0.0, 9.41]},
+            "bacon":{"vectors":[2.0, 6.41]},
+            "bread":{"vectors":[3.3, 3.41]},
+            "candycane":{"vectors":[-1.0, -1.41]},
+            "empty":{"vectors":np.zeros(2)},
+            "wrongsize":{"vectors":[1.0, 2.0, 3.0]},
+        }
+        possible_tag_keys = list(possible_tags.keys())
+        tags = []
+        vectors = {}
+        if num_tags is None:
+            num_tags = random.randint(0, len(possible_tags)) + 1
+        for i in range(num_tags):
+            tag = random.choice(possible_tag_keys)
+            tags.append(tag)
+            vectors[tag] = possible_tags[tag]
+        # Some tags come back without vectors
+        tags.append("novector")
+
+        self.cgp_output = [
+            {
+                "tags":tags,
+                "vectors": vectors,
+                "uid":uid,
+            },
+        ]
+
+
+full_convo_metadata = {
+    "tags": ["hello", "world", "baseball", "hotdog",],
+    "vectors": {
+        "hello":{"vectors":[0.1, 0.5]},
+        "world":{"vectors":[0.9, 0.81]},
+        "baseball":{"vectors":[0.7, 0.71]},
+        "hotdog":{"vectors":[0.6, 0.61]},
+    }
+}
+
+@pytest.mark.asyncio
+async def test_batch_matches_serial():
+    random.seed(1234)
+    el = Evaluator()
+    miner_responses = [MockMinerResponse(i) for i in range(40)]
+    # Bad response and short response keep their slots the same way in both paths
+    miner_responses.append(MockMinerResponse(40, num_tags=0))
+    miner_responses[3].cgp_output = []
+
+    (serial_scores, serial_rank) = await el.evaluate_serial(full_convo_metadata, miner_responses)
+    (batch_scores, batch_rank) = await el.evaluate_batch(full_convo_metadata, miner_responses)
+
+    assert len(serial_scores) == len(batch_scores)
+    for serial, batch in zip(serial_scores, batch_scores):
+        assert serial.get('uid') == batch.get('uid')
+        assert np.allclose(serial['adjustedScore'], batch['adjustedScore'], equal_nan=True)
+        assert np.allclose(serial['final_miner_score'], batch['final_miner_score'], equal_nan=True)
+    assert np.allclose(serial_rank.cpu().numpy(), batch_rank.cpu().numpy(), equal_nan=True)
+
+@pytest.mark.asyncio
+async def test_penalties_match_serial():
+    el = Evaluator()
+    cases = [(0.8, 5, 0, 0.1), (0.5, 1, 1, 0.5), (0.3, 4, 2, 0.9), (0.9, 6, 4, 0.3)]
+    batch = el.calculate_penalties([x[0] for x in cases], [x[1] for x in cases], [x[2] for x in cases], [x[3] for x in cases])
+    for idx, (score, num_tags, num_unique_tags, max_score) in enumerate(cases):
+        assert batch[idx] == await el.calculate_penalty(idx, score, num_tags, num_unique_tags, 0, max_score)
+
+@pytest.mark.asyncio
+async def test_packed_vectors_match_lists():
+    random.seed(99)
+    el = Evaluator()
+    miner_responses = [MockMinerResponse(i) for i in range(10)]
+    packed_responses = []
+    for response in miner_responses:
+        packed_response = MockMinerResponse(0)
+        vectors = {tag: item for tag, item in response.cgp_output[0]['vectors'].items() if tag not in ["empty", "wrongsize"]}
+        result = dict(response.cgp_output[0], vectors=vectors)
+        response.cgp_output = [result]
+        packed_response.cgp_output = [encode_output(result, PROTOCOL_VERSION, dtype="float32", compress=True)]
+        packed_responses.append(packed_response)
+    assert "vectors_packed" in packed_responses[0].cgp_output[0]
+
+    (list_scores, list_rank) = await el.evaluate(full_convo_metadata, miner_responses)
+    (packed_scores, packed_rank) = await el.evaluate(full_convo_metadata, packed_responses)
+    for list_score, packed_score in zip(list_scores, packed_scores):
+        assert np.allclose(list_score['adjustedScore'], packed_score['adjustedScore'], equal_nan=True, atol=1e-6)
+
+def test_pack_vectors_round_trip():
+    vectors = {"music":{"vectors":[0.5, -0.25, 1.0]}, "travel":{"vectors":[0.125, 0.0, -1.0]}}
+    for dtype in ["float32", "float16"]:
+        packed = pack_vectors(vectors, dtype=dtype, compress=(dtype == "float16"))
+        unpacked = unpack_vectors(packed)
+        assert list(unpacked.keys()) == ["music", "travel"]
+        assert unpacked["travel"]["vectors"].tolist() == [0.125, 0.0, -1.0]
+    # Old validators keep getting JSON float lists
+    result = {"tags":["music", "travel"], "vectors":vectors}
+    assert encode_output(result, 1) == result
+    assert decode_output(result) == result
+
+def test_unpack_vectors_rejects_bomb_and_bad_shape():
+    vectors = {"music":{"vectors":[0.5, -0.25, 1.0]}, "travel":{"vectors":[0.125, 0.0, -1.0]}}
+    packed = pack_vectors(vectors, dtype="float32", compress=True)
+    # 2 tags x 3 dims, but the payload inflates to 64 MB of zeros
+    bomb = dict(packed, data=base64.b64encode(zlib.compress(bytes(64 * 1024 * 1024))).decode("ascii"))
+    bad_shapes = [[1, 3], [2, 3, 1], [2, 2], [2, 100000], [2, -3], "2,3", None]
+    for bad in [bomb] + [dict(packed, shape=shape) for shape in bad_shapes]:
+        with pytest.raises(ValueError):
+            unpack_vectors(bad)
+    with pytest.raises(ValueError):
+        unpack_vectors(packed, expected_dim=1536)
+    assert unpack_vectors(packed, expected_dim=3)["music"]["vectors"].tolist() == [0.5, -0.25, 1.0]
+
+    # The evaluator scores undecodable responses as bad responses instead of crashing
+    el = Evaluator()
+    result = {"tags":["music", "travel"], "vectors_packed":bomb}
+    assert el.decode_miner_response([result], 0) is None
+
+@pytest.mark.asyncio
+async def test_batch_matches_serial_negative_last_miner():
+    el = Evaluator()
+    tag_sets = [
+        # All positively similar, so the min must not be pulled down to 0
+        ["hello", "world", "pizza"],
+        [],
+        # All negatively similar, so the max must not be pulled up to 0
+        ["goodbye", "candycane"],
+    ]
+    possible = {"hello":[0.1, 0.5], "world":[0.9, 0.81], "pizza":[0.4, 0.41], "goodbye":[-0.1, -0.5], "candycane":[-1.0, -1.41]}
+    miner_responses = []
+    for uid, tags in enumerate(tag_sets):
+        response = MockMinerResponse(uid, num_tags=0)
+        response.cgp_output = [{"tags": tags, "vectors": {tag: {"vectors": possible[tag]} for tag in tags}, "uid": uid}]
+        miner_responses.append(response)
+
+    (serial_scores, serial_rank) = await el.evaluate_serial(full_convo_metadata, miner_responses)
+    (batch_scores, batch_rank) = await el.evaluate_batch(full_convo_metadata, miner_responses)
+    for serial, batch in zip(serial_scores, batch_scores):
+        assert np.allclose(serial['adjustedScore'], batch['adjustedScore'], equal_nan=True)
+        assert np.allclose(serial['final_miner_score'], batch['final_miner_score'], equal_nan=True)
+    assert np.allclose(serial_rank.cpu().numpy(), batch_rank.cpu().numpy(), equal_nan=True)
+
+    neighborhood = np.mean([item['vectors'] for item in full_convo_metadata['vectors'].values()], axis=0)
+    miner_results = [response.cgp_output[0] for response in miner_responses]
+    stats = await el.calc_scores_batch(full_convo_metadata, neighborhood, miner_results)
+    for idx in [0, 2]:
+        (scores, scores_both, scores_unique, diff) = await el.calc_scores(full_convo_metadata, neighborhood, miner_results[idx])
+        assert np.isclose(stats['max'][idx], np.max(scores))
+        assert np.isclose(stats['min'][idx], np.min(scores))
+    assert stats['max'][2] < 0
+    assert np.isnan(stats['max'][1])
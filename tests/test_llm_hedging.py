@@ -0,0 +1,87 @@
+import pytest
+import asyncio
+import time
+
+from conversationgenome.llm.LlmLib import LlmLib
+
+
+class MockLlm:
+    def __init__(self, name, delay, tags):
+        self.name = name
+        self.delay = delay
+        self.tags = tags
+        self.cancelled = False
+
+    async def conversation_to_metadata(self, convo):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.tags is None:
+            return {}
+        return {"tags": self.tags, "vectors": {}, "llm": self.name}
+
+
+def use_llms(monkeypatch, llms):
+    monkeypatch.setattr(LlmLib, "get_llm_instance", lambda self, llm_type=None: llms[llm_type])
+    monkeypatch.setattr(LlmLib, "latencies", {})
+    monkeypatch.setattr(LlmLib, "hedge_counts", {"calls":0, "hedged":0, "hedge_wins":0, "fallbacks":0})
+
+
+@pytest.mark.asyncio
+async def test_hedge_fires_secondary_when_primary_is_slow(monkeypatch):
+    llms = {"groq": MockLlm("groq", 1.0, ["slow"]), "openai": MockLlm("openai", 0.01, ["fast"])}
+    use_llms(monkeypatch, llms)
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "0.05")
+    ll = LlmLib()
+    result = await ll.hedged_conversation_to_metadata({"lines": []}, ["groq", "openai"])
+    assert result['llm'] == "openai"
+    await asyncio.sleep(0)
+    assert llms["groq"].cancelled
+    assert LlmLib.hedge_counts['hedged'] == 1
+    assert LlmLib.hedge_counts['hedge_wins'] == 1
+
+@pytest.mark.asyncio
+async def test_hedge_falls_back_on_empty_result(monkeypatch):
+    llms = {"groq": MockLlm("groq", 0.01, []), "spacy": MockLlm("spacy", 0.01, ["music"])}
+    use_llms(monkeypatch, llms)
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "5")
+    result = await LlmLib().hedged_conversation_to_metadata({"lines": []}, ["groq", "spacy"])
+    assert result['llm'] == "spacy"
+    assert LlmLib.hedge_counts['fallbacks'] == 1
+
+@pytest.mark.asyncio
+async def test_hedge_three_adapters_empty_primary(monkeypatch):
+    llms = {"groq": MockLlm("groq", 0.01, None), "openai": MockLlm("openai", 1.0, ["slow"]), "spacy": MockLlm("spacy", 0.01, ["music"])}
+    use_llms(monkeypatch, llms)
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "0.05")
+    result = await LlmLib().hedged_conversation_to_metadata({"lines": []}, ["groq", "openai", "spacy"])
+    assert result['llm'] == "spacy"
+    await asyncio.sleep(0)
+    assert llms["openai"].cancelled
+    assert LlmLib.hedge_counts['fallbacks'] == 1
+    assert LlmLib.hedge_counts['hedged'] == 1
+
+@pytest.mark.asyncio
+async def test_hedge_empty_result_starts_next_while_others_run(monkeypatch):
+    llms = {"groq": MockLlm("groq", 1.0, ["slow"]), "openai": MockLlm("openai", 0.01, None), "spacy": MockLlm("spacy", 0.01, ["music"])}
+    use_llms(monkeypatch, llms)
+    monkeypatch.setenv("LLM_HEDGE_DELAY", "0.05")
+    # openai's own hedge delay is long, so only its empty result can start spacy early
+    for idx in range(LlmLib.hedge_min_samples):
+        LlmLib.record_latency("openai", 5.0)
+    start = time.time()
+    result = await LlmLib().hedged_conversation_to_metadata({"lines": []}, ["groq", "openai", "spacy"])
+    assert result['llm'] == "spacy"
+    assert time.time() - start < 0.5
+    assert LlmLib.hedge_counts['hedged'] == 1
+    assert LlmLib.hedge_counts['fallbacks'] == 1
+
+@pytest.mark.asyncio
+async def test_hedge_delay_uses_p95(monkeypatch):
+    use_llms(monkeypatch, {})
+    ll = LlmLib()
+    for idx in range(100):
+        LlmLib.record_latency("groq", idx / 100.0)
+    assert ll.get_hedge_delay("groq") == pytest.approx(0.94)
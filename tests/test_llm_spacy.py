@@ -0,0 +1,64 @@
+import pytest
+
+spacy = pytest.importorskip("spacy")
+from spacy.language import Language
+
+from conversationgenome.llm.llm_spacy import llm_spacy
+
+
+TOY_POS = {
+    "big": "ADJ", "loud": "ADJ", "quiet": "ADJ", "favorite": "ADJ",
+    "guitar": "NOUN", "concert": "NOUN", "garden": "NOUN", "tomatoes": "NOUN", "weekend": "NOUN",
+    "playing": "VERB", "planted": "VERB", "listening": "VERB",
+    "i": "PRON", "we": "PRON", "they": "PRON",
+}
+
+
+@Language.component("toy_tagger")
+def toy_tagger(doc):
+    # A blank pipeline has no tagger or lemmatizer, so set just enough for the matcher patterns
+    for token in doc:
+        token.pos_ = TOY_POS.get(token.lower_, "X")
+        token.lemma_ = token.lower_
+    return doc
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    nlp = spacy.blank("en")
+    nlp.add_pipe("toy_tagger")
+    monkeypatch.setattr(llm_spacy, "nlp", nlp)
+    monkeypatch.setattr(llm_spacy, "matcher", None)
+    llm = llm_spacy()
+    # Small batches so the texts span several nlp.pipe batches
+    llm.batch_size = 2
+    return llm
+
+
+def make_convos():
+    return [
+        {"guid": 1, "lines": [[0, "I love playing loud guitar at the concert"], [1, "We went to a big concert last weekend"]]},
+        {"guid": 2, "lines": [[0, "They planted tomatoes in the quiet garden"]]},
+        {"guid": 3, "lines": []},
+        {"guid": 4, "lines": [[1, "My favorite weekend is spent listening to guitar"], [0, "I agree"]]},
+        {"guid": 5, "lines": [[0, "ok"]]},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_batch_text_to_tags_matches_serial(llm):
+    bodies = ["I love playing loud guitar", "They planted tomatoes in the quiet garden", "", "ok", "We went to a big concert"]
+    batched = await llm.batch_text_to_tags(bodies)
+    serial = [await llm.simple_text_to_tags(body) for body in bodies]
+    assert batched == serial
+    assert any(batched)
+
+
+@pytest.mark.asyncio
+async def test_conversations_to_metadata_matches_serial(llm):
+    convos = make_convos()
+    batched = await llm.conversations_to_metadata(convos)
+    serial = [await llm.conversation_to_metadata(convo) for convo in convos]
+    assert batched == serial
+    assert "playing" in batched[0]['tags'] and "tomatoes" in batched[1]['tags']
+    assert batched[0]['vectors']['concert']['count'] == 2
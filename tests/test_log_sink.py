@@ -0,0 +1,31 @@
+import json
+import os
+
+from conversationgenome.utils.LogSink import LogSink
+
+
+def test_log_sink_buffers_until_flush(tmp_path):
+    path = str(tmp_path / "scoring_debug.log")
+    sink = LogSink(path, flush_interval=60)
+    for idx in range(100):
+        sink.write(f"line {idx}")
+    assert sink.stats()['buffered'] == 100
+    sink.flush()
+    with open(path) as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 100
+    assert lines[-1].endswith(" | line 99")
+
+
+def test_log_sink_jsonl_and_rotation(tmp_path):
+    path = str(tmp_path / "scoring_debug.log")
+    sink = LogSink(path, flush_interval=60, max_bytes=1000, backups=2, jsonl=True)
+    for batch in range(5):
+        for idx in range(10):
+            sink.write("Evaluator Score", tag=f"tag{idx}", score=0.5)
+        sink.flush()
+    record = json.loads(open(path).readline())
+    assert record['msg'] == "Evaluator Score" and record['score'] == 0.5
+    assert os.path.exists(path + ".1") and os.path.exists(path + ".2")
+    assert not os.path.exists(path + ".3")
+    assert sink.stats()['rotations'] >= 2
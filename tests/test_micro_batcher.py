@@ -0,0 +1,45 @@
+import pytest
+import asyncio
+
+from conversationgenome.llm.LlmLib import LlmLib
+from conversationgenome.miner.MicroBatcher import MicroBatcher
+
+
+class MockBatchLlm:
+    def __init__(self):
+        self.batches = []
+
+    async def conversations_to_metadata(self, convos):
+        self.batches.append(len(convos))
+        return [{"tags": [convo['lines'][0]], "vectors": {}} for convo in convos]
+
+
+class MockLlm:
+    calls = 0
+
+    async def conversation_to_metadata(self, convo):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return {"tags": [convo['lines'][0]], "vectors": {}}
+
+
+@pytest.mark.asyncio
+async def test_micro_batcher_groups_windows(monkeypatch):
+    llm = MockBatchLlm()
+    monkeypatch.setattr(LlmLib, "get_llm_instance", lambda self, llm_type=None: llm)
+    mb = MicroBatcher(window=0.02, max_batch=4)
+    results = await asyncio.gather(*[mb.conversation_to_metadata({"lines": [f"w{idx}"]}) for idx in range(6)])
+    assert [result['tags'][0] for result in results] == [f"w{idx}" for idx in range(6)]
+    # 4 dispatched when full, the other 2 when the window closed
+    assert llm.batches == [4, 2]
+    assert mb.stats()['avg_batch'] == 3
+
+@pytest.mark.asyncio
+async def test_micro_batcher_parallel_dispatch(monkeypatch):
+    llm = MockLlm()
+    monkeypatch.setattr(LlmLib, "get_llm_instance", lambda self, llm_type=None: llm)
+    mb = MicroBatcher(window=0.01)
+    results = await asyncio.gather(*[mb.conversation_to_metadata({"lines": [f"w{idx}"]}) for idx in range(3)])
+    assert llm.calls == 3
+    assert results[2]['tags'] == ["w2"]
+    assert mb.stats()['batches'] == 1
@@ -0,0 +1,74 @@
+import pytest
+import asyncio
+import time
+
+import numpy as np
+
+from conversationgenome.miner.MinerCache import MinerCache
+
+
+@pytest.mark.asyncio
+async def test_miner_cache_dedups_concurrent_windows():
+    cache = MinerCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"tags": ["music"], "vectors": {"music": {"vectors": [0.5]}}}
+
+    key = MinerCache.make_key([[0, "hello"]], "openai", "gpt-4o")
+    results = await asyncio.gather(*[cache.get_or_compute(key, compute) for i in range(5)])
+    assert len(calls) == 1
+    assert all([result['tags'] == ["music"] for result in results])
+    assert cache.stats()['shared'] == 4
+
+    # Later repeats come from memory
+    await cache.get_or_compute(key, compute)
+    assert len(calls) == 1
+    assert cache.stats()['memory_hits'] == 1
+
+def test_miner_cache_key_includes_model():
+    lines = [[0, "hello"]]
+    assert MinerCache.make_key(lines, "openai", "gpt-4o") != MinerCache.make_key(lines, "openai", "gpt-4o-mini")
+
+def test_miner_cache_ttl_and_persistence(tmp_path):
+    db_path = str(tmp_path / "miner_cache.sqlite")
+    cache = MinerCache(db_path=db_path, ttl=60)
+    cache.set("abc", {"tags": ["travel"]})
+
+    cache2 = MinerCache(db_path=db_path, ttl=60)
+    assert cache2.get("abc") == {"tags": ["travel"]}
+    assert cache2.stats()['disk_hits'] == 1
+
+    cache2.ttl = 0.01
+    time.sleep(0.02)
+    assert cache2.get("abc") is None
+    assert cache2.stats()['expired'] == 1
+
+@pytest.mark.asyncio
+async def test_miner_cache_skips_empty_results():
+    cache = MinerCache()
+
+    async def compute():
+        return {"tags": []}
+
+    await cache.get_or_compute("empty", compute, should_store=lambda result: bool(result['tags']))
+    assert cache.get("empty") is None
+
+def test_miner_cache_stores_float32_and_bounds_bytes(tmp_path):
+    vectors = {f"tag{idx}": {"vectors": [0.5] * 1536} for idx in range(20)}
+    result = {"tags": list(vectors.keys()), "vectors": vectors}
+    # Each entry holds 20 x 1536 float32 values, about 120 KB
+    cache = MinerCache(db_path=str(tmp_path / "miner_cache.sqlite"), max_bytes=500 * 1024)
+    for idx in range(10):
+        cache.set(f"key{idx}", result)
+    stats = cache.stats()
+    assert stats['memory_items'] == 4
+    assert stats['memory_bytes'] <= 500 * 1024
+    (created_at, rest, rows, size) = cache.lru["key9"]
+    assert rows[0][1].dtype == np.float32
+
+    # Evicted entries are read back from SQLite in the same form
+    assert cache.get("key0") == result
+    assert cache.stats()['disk_hits'] == 1
@@ -0,0 +1,87 @@
+import pytest
+import asyncio
+import time
+
+from conversationgenome.llm.RateLimiter import RateLimiter, TokenBucket
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_honors_retry_after():
+    rl = RateLimiter("test", max_retries=3)
+    responses = [
+        {"success": False, "code": 429, "headers": {"Retry-After": "0.05"}},
+        {"success": True, "code": 200, "headers": {}, "json": {"usage": {"total_tokens": 10}}},
+    ]
+
+    async def call():
+        return responses.pop(0)
+
+    start = time.time()
+    response = await rl.call(call, tokens=5)
+    assert response['code'] == 200
+    assert time.time() - start >= 0.05
+    stats = rl.stats()
+    assert stats['rate_limited'] == 1
+    assert stats['retries'] == 1
+
+@pytest.mark.asyncio
+async def test_rate_limiter_gives_up_after_retries():
+    rl = RateLimiter("test", max_retries=1)
+    rl.backoff_base = 0.01
+
+    async def call():
+        return {"success": False, "code": 429, "headers": {}}
+
+    response = await rl.call(call)
+    assert response['code'] == 429
+    assert rl.stats()['failed'] == 1
+
+@pytest.mark.asyncio
+async def test_rate_limiter_caps_concurrency():
+    rl = RateLimiter("test", max_concurrent=2)
+    running = []
+    peak = []
+
+    async def call():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return {"success": True, "code": 200}
+
+    await asyncio.gather(*[rl.call(call) for i in range(6)])
+    assert max(peak) == 2
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)
+    bucket.tokens = 0
+    waited = await bucket.acquire(1)
+    # 600 per minute refills one token every 0.1 seconds
+    assert 0.05 < waited <= 0.1
+
+@pytest.mark.asyncio
+async def test_rate_limiter_clamps_retry_after():
+    rl = RateLimiter("test", max_retries=1)
+    rl.backoff_max = 0.05
+    responses = [
+        {"success": False, "code": 429, "headers": {"Retry-After": "86400"}},
+        {"success": True, "code": 200, "headers": {}},
+    ]
+
+    async def call():
+        return responses.pop(0)
+
+    start = time.time()
+    response = await rl.call(call)
+    assert response['code'] == 200
+    assert time.time() - start < 1
+    assert rl.retry_delay(0, {"retry-after": "Wed, 21 Oct 2099 07:28:00 GMT"}) == 0.05
+    assert rl.retry_delay(0, {"Retry-After": "-5"}) == 0
+
+def test_token_bucket_debit_is_bounded():
+    bucket = TokenBucket(60)
+    bucket.debit(1000000)
+    assert bucket.tokens == -60
+    bucket.debit(-1000000)
+    assert bucket.tokens == 60
@@ -0,0 +1,159 @@
+import pytest
+import asyncio
+import time
+from types import SimpleNamespace
+
+import torch
+
+import neurons.validator as validator_module
+from neurons.validator import Validator
+from conversationgenome.protocol import CgSynapse
+
+
+class MockMetagraph:
+    def __init__(self, num_uids):
+        self.hotkeys = [f"hotkey-{uid}" for uid in range(num_uids)]
+        self.axons = [SimpleNamespace(is_serving=True, hotkey=hotkey) for hotkey in self.hotkeys]
+        self.n = torch.tensor(num_uids)
+        self.validator_permit = torch.zeros(num_uids, dtype=torch.bool)
+        self.S = torch.zeros(num_uids)
+
+
+class MockDendrite:
+    # Answers each query after delays[uid] seconds and records which uids are
+    # being queried at the same time
+    def __init__(self, metagraph, delays=None):
+        self.metagraph = metagraph
+        self.delays = delays or {}
+        self.active = set()
+        self.peak = 0
+        self.overlaps = []
+        self.calls = []
+        self.cancelled = []
+
+    async def call(self, target_axon, synapse, timeout, deserialize):
+        uid = self.metagraph.hotkeys.index(target_axon.hotkey)
+        if uid in self.active:
+            self.overlaps.append(uid)
+        self.active.add(uid)
+        self.peak = max(self.peak, len(self.active))
+        self.calls.append(uid)
+        try:
+            await asyncio.sleep(self.delays.get(uid, 0.01))
+        except asyncio.CancelledError:
+            self.cancelled.append(uid)
+            raise
+        finally:
+            self.active.discard(uid)
+        synapse.axon.hotkey = target_axon.hotkey
+        synapse.dendrite.status_code = 200
+        synapse.cgp_output = [{"tags": ["music"], "vectors": {"music": {"vectors": [0.5, 0.5]}}}]
+        return synapse
+
+
+def make_validator(num_uids=12, sample_size=3, max_inflight_windows=1, window_quorum=1.0, window_deadline=0, timeout=5, delays=None):
+    validator = Validator.__new__(Validator)
+    validator.config = SimpleNamespace(
+        mock=False,
+        netuid=1,
+        neuron=SimpleNamespace(
+            sample_size=sample_size,
+            max_inflight_windows=max_inflight_windows,
+            window_quorum=window_quorum,
+            window_deadline=window_deadline,
+            timeout=timeout,
+            vpermit_tao_limit=4096,
+            moving_average_alpha=0.1,
+        ),
+    )
+    validator.metagraph = MockMetagraph(num_uids)
+    validator.dendrite = MockDendrite(validator.metagraph, delays)
+    validator.scores = torch.zeros(num_uids)
+    validator.available_uids_mask = None
+    validator.prefetcher = None
+    return validator
+
+
+def patch_libs(monkeypatch, windows):
+    scored = []
+
+    class MockValidatorLib:
+        async def reserve_conversation(self, batch_num=None):
+            full_conversation = {"guid": "convo-1", "lines": [], "participants": []}
+            return (full_conversation, {"tags": ["music"], "vectors": {"music": {"vectors": [0.5, 0.5]}}}, windows)
+
+        async def put_convo(self, *args, **kwargs):
+            return True
+
+    class MockEvaluator:
+        async def evaluate(self, full_convo_metadata=None, miner_responses=None):
+            scored.append(miner_responses[0].cgp_input[0]['window_idx'])
+            final_scores = [{"hotkey": response.axon.hotkey, "adjustedScore": 0.5, "final_miner_score": 0.5} for response in miner_responses]
+            return (final_scores, torch.full((len(miner_responses),), 0.5))
+
+    class MockWandbLib:
+        def log(self, data):
+            pass
+
+    monkeypatch.setattr(validator_module, "ValidatorLib", MockValidatorLib)
+    monkeypatch.setattr(validator_module, "Evaluator", MockEvaluator)
+    monkeypatch.setattr(validator_module, "WandbLib", MockWandbLib)
+    return scored
+
+
+@pytest.mark.asyncio
+async def test_concurrent_windows_use_disjoint_miners(monkeypatch):
+    windows = [[[0, f"line {idx}"]] for idx in range(8)]
+    scored = patch_libs(monkeypatch, windows)
+    validator = make_validator(num_uids=12, sample_size=3, max_inflight_windows=3)
+
+    await validator.forward()
+    # Windows ran concurrently, but no miner was ever queried by two at once
+    assert len(validator.dendrite.calls) == 8 * 3
+    assert validator.dendrite.peak > 3
+    assert validator.dendrite.overlaps == []
+    assert sorted(scored) == list(range(8))
+    assert torch.all(validator.scores[validator.dendrite.calls] > 0)
+
+
+@pytest.mark.asyncio
+async def test_sequential_windows_scored_once(monkeypatch):
+    windows = [[[0, f"line {idx}"]] for idx in range(4)]
+    scored = patch_libs(monkeypatch, windows)
+    validator = make_validator(num_uids=6, sample_size=3, max_inflight_windows=1)
+
+    await validator.forward()
+    assert scored == [0, 1, 2, 3]
+    assert len(validator.dendrite.calls) == 4 * 3
+
+
+def make_synapse():
+    return CgSynapse(cgp_input=[{"guid": "convo-1", "window_idx": 0, "lines": [[0, "hello"]]}])
+
+
+@pytest.mark.asyncio
+async def test_query_miners_returns_at_quorum():
+    validator = make_validator(num_uids=4, window_quorum=0.5, delays={0: 0.01, 1: 0.02, 2: 5, 3: 5})
+    answered = []
+    start = time.time()
+    responses = await validator.query_miners([0, 1, 2, 3], make_synapse(), on_response=answered.append)
+    assert time.time() - start < 1
+    await asyncio.sleep(0)
+    # Stragglers were cancelled and come back as timeouts in their slots
+    assert sorted(validator.dendrite.cancelled) == [2, 3]
+    assert len(answered) == 2
+    assert [response.axon.hotkey for response in responses] == ["hotkey-0", "hotkey-1", "hotkey-2", "hotkey-3"]
+    assert [response.dendrite.status_code for response in responses] == [200, 200, 408, 408]
+    assert responses[2].cgp_output is None and responses[0].cgp_output
+
+
+@pytest.mark.asyncio
+async def test_query_miners_returns_at_deadline():
+    validator = make_validator(num_uids=3, window_quorum=1.0, window_deadline=0.2, delays={0: 0.01, 1: 5, 2: 0.05})
+    start = time.time()
+    responses = await validator.query_miners([2, 1, 0], make_synapse())
+    assert 0.2 <= time.time() - start < 1
+    await asyncio.sleep(0)
+    assert validator.dendrite.cancelled == [1]
+    assert [response.axon.hotkey for response in responses] == ["hotkey-2", "hotkey-1", "hotkey-0"]
+    assert [response.dendrite.status_code for response in responses] == [200, 408, 200]
@@ -0,0 +1,131 @@
+import pytest
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+pytest.importorskip("fastapi")
+from fastapi import HTTPException
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "web"))
+import app as web_app
+
+
+@pytest.fixture
+def conversations_db(tmp_path, monkeypatch):
+    # Conversation table as built by older importers, without the reservation columns
+    monkeypatch.chdir(tmp_path)
+    db_path = str(tmp_path / "conversations.sqlite")
+    monkeypatch.setattr(web_app.Db, "conversations_db", db_path)
+    monkeypatch.setattr(web_app.Db, "local", threading.local())
+    monkeypatch.setattr(web_app.Db, "migrated", set())
+    monkeypatch.setattr(web_app.Db, "rowid_range", None)
+    monkeypatch.setattr(web_app.ResultWriter, "writers", {})
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE conversations (id INTEGER PRIMARY KEY AUTOINCREMENT, source_id INTEGER, guid TEXT, idx INTEGER, topic TEXT, json JSON, created_at TEXT, updated_at TEXT)")
+    for idx in range(20):
+        convo = {"guid": 1000 + idx, "lines": [[0, "hello"], [1, "hi"]], "participant": {"0": {"idx": 0}, "1": {"idx": 1}}}
+        conn.execute("INSERT INTO conversations (source_id, guid, idx, json) VALUES (1, ?, ?, ?)", (str(1000 + idx), idx, json.dumps(convo)))
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def reserve_ids(count):
+    db = web_app.Db("conversations", "conversations")
+    return [db.get_random_conversation()['id'] for idx in range(count)]
+
+
+def test_concurrent_reservations_never_share_a_row(conversations_db):
+    results = []
+    def worker():
+        results.append(reserve_ids(5))
+    threads = [threading.Thread(target=worker) for idx in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = [row_id for worker_ids in results for row_id in worker_ids]
+    assert sorted(ids) == list(range(1, 21))
+
+    # Everything is reserved and nothing has expired
+    assert web_app.Db("conversations", "conversations").get_random_conversation() is None
+    with pytest.raises(HTTPException) as excinfo:
+        web_app.post_request()
+    assert excinfo.value.status_code == 503
+
+
+def test_expired_reservation_is_handed_out_again(conversations_db):
+    assert len(set(reserve_ids(20))) == 20
+    conn = sqlite3.connect(conversations_db)
+    conn.execute("UPDATE conversations SET reserved_at = reserved_at - ? WHERE id = 7", (web_app.Db.reservation_timeout + 1,))
+    conn.commit()
+    conn.close()
+    assert reserve_ids(1) == [7]
+    assert web_app.Db("conversations", "conversations").get_random_conversation() is None
+
+
+def test_completed_conversations_start_a_new_pass(conversations_db):
+    convo = web_app.post_request()
+    assert convo['participants'] == ["SPEAKER_0", "SPEAKER_1"]
+    reserve_ids(19)
+    # Completing a conversation on PUT makes it available for the next pass
+    result = web_app.put_record_request(str(convo['guid']), {"type": "validator", "hotkey": "validator-1"})
+    assert result['success'] == 1
+    conn = sqlite3.connect(conversations_db)
+    assert conn.execute("SELECT status FROM conversations WHERE guid = ?", (str(convo['guid']),)).fetchone()[0] == 2
+    conn.close()
+    assert web_app.post_request()['guid'] == convo['guid']
+
+
+class RecordingWriter(web_app.ResultWriter):
+    def __init__(self, *args, **kwargs):
+        self.batches = []
+        super().__init__(*args, **kwargs)
+
+    def write(self, rows):
+        super().write(rows)
+        # Recorded once the rows are committed, so waiting on batches is enough to read them back
+        self.batches.append(len(rows))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def count_results(db_name):
+    conn = sqlite3.connect(f"{db_name}_{web_app.Utils.get_time('%Y.%m.%d')}.sqlite")
+    try:
+        return conn.execute("SELECT COUNT(*) FROM cgp_results").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_result_writer_flushes_full_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_app.ResultWriter, "batch_size", 3)
+    # Long enough that only full batches can trigger a write
+    monkeypatch.setattr(web_app.ResultWriter, "flush_ms", 60000)
+    db = web_app.Db("cgp_tags", "tags")
+    db_name = str(tmp_path / "cgp_tags")
+    writer = RecordingWriter(db_name, web_app.Db.sql_create_results)
+    writer.put([db.build_result_row(f"guid-{idx}", {"hotkey": f"hotkey-{idx}", "tags": ["music"]}) for idx in range(6)])
+    assert wait_for(lambda: sum(writer.batches) == 6)
+    assert writer.batches == [3, 3]
+    assert count_results(db_name) == 6
+
+
+def test_result_writer_flushes_on_timer(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_app.ResultWriter, "batch_size", 500)
+    monkeypatch.setattr(web_app.ResultWriter, "flush_ms", 50)
+    db = web_app.Db("cgp_tags", "tags")
+    db_name = str(tmp_path / "cgp_tags")
+    writer = RecordingWriter(db_name, web_app.Db.sql_create_results)
+    writer.put([db.build_result_row(f"guid-{idx}", {"hotkey": f"hotkey-{idx}"}) for idx in range(2)])
+    assert wait_for(lambda: sum(writer.batches) == 2)
+    assert writer.batches == [2]
+    assert count_results(db_name) == 2
@@ -5,9 +5,13 @@ import time
 
 import hashlib
 import sqlite3
+import threading
+import queue
 
 from Utils import Utils
 
+verbose = False
+
 # Test convo read endpoint:
 # curl -XPOST https://api.conversations.xyz/api/v1/conversation/reserve | python -m json.tool
 # curl -XPOST http://localhost:8000/api/v1/conversation/reserve | python -m json.tool
@@ -16,7 +20,7 @@ from Utils import Utils
 # curl -XPOST http://localhost:8000/api/v1/conversation/reserve | python -m json.tool
 
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException
 
 app = FastAPI()
 
@@ -24,6 +28,16 @@ class Db:
     source_type = 2 # Non-CGP
     db_name = None
     table_name = None
+    conversations_db = "conversations.sqlite"
+    # Conversation status: 0 available, 1 reserved, 2 complete
+    # Seconds before a reservation that was never completed is handed out again
+    reservation_timeout = int(os.environ.get("CGP_RESERVATION_TIMEOUT", 600))
+    reserve_attempts = 10
+    # Long-lived connections, one per worker thread and database file
+    local = threading.local()
+    migrated = set()
+    migrate_lock = threading.Lock()
+    rowid_range = None
     sql_create_results = """CREATE TABLE IF NOT EXISTS cgp_results (
 	"id"	INTEGER UNIQUE,
 	"status"	INTEGER DEFAULT 1,
@@ -52,21 +66,64 @@ class Db:
         self.db_name = db_name
         self.table_name = table_name
 
+    def get_connection(self, db_name):
+        conns = getattr(Db.local, "conns", None)
+        if conns is None:
+            conns = {}
+            Db.local.conns = conns
+        conn = conns.get(db_name)
+        if not conn:
+            conn = sqlite3.connect(db_name, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conns[db_name] = conn
+        return conn
+
     def get_cursor(self):
-        db_name = "conversations.sqlite"
-        conn = sqlite3.connect(db_name)
-        conn.row_factory = Db.dict_factory
+        conn = self.get_connection(self.conversations_db)
+        self.migrate_conversations(conn)
         cursor = conn.cursor()
+        cursor.row_factory = Db.dict_factory
 
         return cursor
 
+    def migrate_conversations(self, conn):
+        # Adds the reservation columns to conversation tables built by older importers
+        if self.conversations_db in Db.migrated:
+            return
+        with Db.migrate_lock:
+            if self.conversations_db in Db.migrated:
+                return
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(conversations)")]
+            if "status" not in columns:
+                conn.execute("ALTER TABLE conversations ADD COLUMN status INTEGER DEFAULT 0")
+            if "reserved_at" not in columns:
+                conn.execute("ALTER TABLE conversations ADD COLUMN reserved_at INTEGER DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS conversations_guid ON conversations (guid)")
+            conn.commit()
+            Db.migrated.add(self.conversations_db)
+
+    def get_rowid_range(self, cursor, refresh=False):
+        if refresh or not Db.rowid_range:
+            row = cursor.execute("SELECT MIN(id) AS min_id, MAX(id) AS max_id FROM conversations").fetchone()
+            Db.rowid_range = (row['min_id'], row['max_id'])
+        return Db.rowid_range
+
 
     def insert_into_table(self, c_guid, content):
-        today = Utils.get_time("%Y.%m.%d")
-        db_name = f"{self.db_name}_{today}.sqlite"
-        conn = sqlite3.connect(db_name)
-        cursor = conn.cursor()
-        cursor.execute(self.sql_create_results)
+        self.insert_many_into_table([(c_guid, content)])
+
+    def insert_many_into_table(self, records):
+        # records is a list of (c_guid, content). Rows are queued for the
+        # writer thread, which commits them in batches.
+        writer = ResultWriter.get_writer(self.db_name, self.sql_create_results)
+        writer.put([self.build_result_row(c_guid, content) for c_guid, content in records])
+
+    def build_result_row(self, c_guid, content):
+        tags = Utils.get(content, "tags")
+        if isinstance(tags, (list, dict)):
+            # JSON column. A raw list can't be bound and would fail the whole batch.
+            tags = json.dumps(tags)
         updateRow = {
             "c_guid": c_guid,
             "mode": Utils.get(content, "mode"),
@@ -78,32 +135,50 @@ class Db:
             "hotkey": Utils.get(content, "hotkey"),
             "coldkey": Utils.get(content, "coldkey"),
             "batch_num": Utils.get(content, "batch_num"),
-            "tags": Utils.get(content, "tags"),
+            "tags": tags,
             "cgp_version": Utils.get(content, "cgp_version"),
             "json": json.dumps(content)
         }
-        fields = []
-        questions = []
-        values = []
-        for field, val in updateRow.items():
-            fields.append(field)
-            questions.append("?")
-            values.append(val)
-        fields_str = ",".join(fields)
-        questions_str = ",".join(questions)
-        cursor.execute(f"INSERT INTO cgp_results ({fields_str}) VALUES ({questions_str})", (values))
-        conn.commit()
-        conn.close()
+        return updateRow
 
     def get_random_conversation(self):
+        # Picks a random id in the rowid range and takes the first available
+        # conversation at or after it, wrapping around to the start of the
+        # table. The UPDATE re-checks availability, so two validators racing
+        # for the same row can't both reserve it.
         cursor = self.get_cursor()
-        sql = 'SELECT * FROM conversations ORDER BY RANDOM() LIMIT 1'
-        cursor.execute(sql)
-        rows = cursor.fetchall()
-        if rows and len(rows) == 1:
-            return rows[0]
-        else:
+        (min_id, max_id) = self.get_rowid_range(cursor)
+        if min_id is None:
             return None
+        available = "(status = 0 OR status IS NULL OR (status = 1 AND reserved_at < ?))"
+        for attempt in range(self.reserve_attempts):
+            now = int(time.time())
+            expired = now - self.reservation_timeout
+            start_id = random.randint(min_id, max_id)
+            row = cursor.execute(f"SELECT id FROM conversations WHERE id >= ? AND {available} ORDER BY id LIMIT 1", (start_id, expired)).fetchone()
+            if not row:
+                row = cursor.execute(f"SELECT id FROM conversations WHERE id < ? AND {available} ORDER BY id LIMIT 1", (start_id, expired)).fetchone()
+            if not row:
+                # Everything has been served. Start a new pass over the corpus.
+                cursor.execute("UPDATE conversations SET status = 0 WHERE status = 2")
+                recycled = cursor.rowcount
+                cursor.connection.commit()
+                if recycled == 0:
+                    # All conversations are reserved and none have expired
+                    return None
+                (min_id, max_id) = self.get_rowid_range(cursor, refresh=True)
+                continue
+            cursor.execute(f"UPDATE conversations SET status = 1, reserved_at = ? WHERE id = ? AND {available}", (now, row['id'], expired))
+            reserved = cursor.rowcount == 1
+            cursor.connection.commit()
+            if reserved:
+                return cursor.execute("SELECT * FROM conversations WHERE id = ?", (row['id'],)).fetchone()
+        return None
+
+    def complete_conversation(self, c_guid):
+        cursor = self.get_cursor()
+        cursor.execute("UPDATE conversations SET status = 2 WHERE guid = ? AND status != 2", (str(c_guid),))
+        cursor.connection.commit()
 
     @staticmethod
     def dict_factory(cursor, row):
@@ -119,6 +194,88 @@ class Db:
         return d
 
 
+class ResultWriter:
+    # Single writer thread per results database. PUT handlers only enqueue
+    # rows. The thread writes them with executemany in one transaction every
+    # batch_size rows or flush_ms milliseconds, on a long-lived WAL connection
+    # to the current daily file.
+    batch_size = int(os.environ.get("CGP_WRITE_BATCH_SIZE", 500))
+    flush_ms = int(os.environ.get("CGP_WRITE_FLUSH_MS", 200))
+    writers = {}
+    writers_lock = threading.Lock()
+
+    def __init__(self, db_name, sql_create):
+        self.db_name = db_name
+        self.sql_create = sql_create
+        self.queue = queue.Queue()
+        self.conn = None
+        self.conn_day = None
+        self.written = 0
+        self.report_at = time.time() + 1
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def get_writer(db_name, sql_create):
+        with ResultWriter.writers_lock:
+            writer = ResultWriter.writers.get(db_name)
+            if not writer:
+                writer = ResultWriter(db_name, sql_create)
+                ResultWriter.writers[db_name] = writer
+        return writer
+
+    def put(self, rows):
+        for row in rows:
+            self.queue.put(row)
+
+    def get_connection(self):
+        # Daily file, reopened only when the date changes
+        today = Utils.get_time("%Y.%m.%d")
+        if today != self.conn_day:
+            if self.conn:
+                self.conn.close()
+            self.conn = sqlite3.connect(f"{self.db_name}_{today}.sqlite")
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(self.sql_create)
+            self.conn.commit()
+            self.conn_day = today
+        return self.conn
+
+    def run(self):
+        while True:
+            rows = [self.queue.get()]
+            deadline = time.time() + self.flush_ms / 1000
+            while len(rows) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    rows.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.write(rows)
+            except Exception as e:
+                print(f"ERROR 3381920: Could not write {len(rows)} result rows: {e}")
+
+    def write(self, rows):
+        conn = self.get_connection()
+        fields = list(rows[0].keys())
+        fields_str = ",".join(fields)
+        questions_str = ",".join(["?"] * len(fields))
+        with conn:
+            conn.executemany(f"INSERT INTO cgp_results ({fields_str}) VALUES ({questions_str})", [[row[field] for field in fields] for row in rows])
+        if verbose:
+            self.written += len(rows)
+            now = time.time()
+            if now >= self.report_at:
+                elapsed = now - self.report_at + 1
+                print(f"{Utils.get_time()} {self.db_name}: wrote {int(self.written / elapsed)} rows/sec, {self.queue.qsize()} queued")
+                self.written = 0
+                self.report_at = now + 1
+
+
 @app.get("/")
 def get_request():
     return {"message": "Forbidden"}
@@ -132,6 +289,8 @@ def post_request():
 
     db = Db("conversations", "conversations")
     conversation = db.get_random_conversation()
+    if not conversation:
+        raise HTTPException(status_code=503, detail="No conversations available to reserve")
 
     convo = {
         "guid": Utils.get(conversation, "data.guid"),
@@ -168,9 +327,34 @@ def put_record_request(c_guid, data: dict):
     if data:
         db = Db("cgp_tags", "tags")
         db.insert_into_table(c_guid, data)
+        if Utils.get(data, "type") == "validator":
+            Db("conversations", "conversations").complete_conversation(c_guid)
         out['data']['msg'] = {"message": f"Stored tag data for {c_guid}"}
         out['success'] = 1
     else:
         out['errors'].append([9893843, "Missing hotkey",])
     return out
 
+@app.put("/api/v1/conversation/records")
+def put_records_request(data: dict):
+    out = {"success": 0, "errors":[], "data":{}}
+    records = Utils.get(data, "records", [])
+    rows = []
+    for record in records:
+        c_guid = Utils.get(record, "c_guid")
+        content = Utils.get(record, "data")
+        if c_guid and content:
+            rows.append((c_guid, content))
+    if rows:
+        db = Db("cgp_tags", "tags")
+        db.insert_many_into_table(rows)
+        conversations_db = Db("conversations", "conversations")
+        for c_guid, content in rows:
+            if Utils.get(content, "type") == "validator":
+                conversations_db.complete_conversation(c_guid)
+        out['data']['msg'] = {"message": f"Stored tag data for {len(rows)} records"}
+        out['data']['count'] = len(rows)
+        out['success'] = 1
+    else:
+        out['errors'].append([9893844, "No records",])
+    return out
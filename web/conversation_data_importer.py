@@ -1,13 +1,58 @@
+import argparse
 import csv
 import json
+import random
 import time
 import uuid
 from faker import Faker
 import sqlite3
 import datetime
+from multiprocessing import Pool
 
 from Utils import Utils
 
+# Worker state for bulk mode. Each process builds its Faker name pool once.
+# Faker.name() costs ~0.1ms, more than the rest of a row, so names are drawn
+# from a pool generated up front.
+name_pool_size = 5000
+worker_names = None
+worker_random = None
+
+def convert_rows(rows, source_id, created_at):
+    # Turns raw CSV rows into conversation insert tuples. Runs in the main
+    # process or in a pool worker.
+    global worker_names, worker_random
+    if not worker_names:
+        fake = Faker()
+        worker_names = [fake.name() for i in range(name_pool_size)]
+        worker_random = random.Random(uuid.uuid4().int)
+    out = []
+    for row in rows:
+        guid = Utils.guid()
+        id = row[0]
+        topic = row[1].strip()
+        chat = row[2]
+
+        lines = []
+        # Data doesn't have participant names, so generate fake ones
+        participantGuids = {
+            "0": {"idx": 0, "guid":Utils.guid(), "title":worker_random.choice(worker_names)},
+            "1": {"idx": 1, "guid":Utils.guid(), "title":worker_random.choice(worker_names)},
+        }
+        numParticipant = len(participantGuids)
+        cycle = 0
+        for line in chat.split('\n'):
+            lines.append([ cycle, line.strip() ])
+            cycle = (cycle + 1) % numParticipant
+
+        row_dict = {"id": id, "guid": guid, "topic": topic, "lines": lines, "participant": participantGuids, }
+        out.append((source_id, json.dumps(row_dict), id, topic, str(guid), created_at, created_at))
+    return out
+
+def convert_chunk(args):
+    return convert_rows(*args)
+
+
 class ConversationDbProcessor:
     db_name = 'conversations.sqlite'
     table_name = 'conversations'
@@ -16,11 +61,17 @@ class ConversationDbProcessor:
     raw_data_path = 'facebook-chat-data_2000rows.csv'
     source_id = 1
     max_rows = 1200
+    # Bulk mode settings
+    chunk_size = 5000
+    workers = 1
 
-    def __init__(self):
+    def __init__(self, db_name=None):
+        if db_name:
+            self.db_name = db_name
         self.conn = sqlite3.connect(self.db_name)
         self.cursor = self.conn.cursor()
-        sql_create = f"CREATE TABLE IF NOT EXISTS {self.table_name} (id INTEGER PRIMARY KEY AUTOINCREMENT, source_id INTEGER, guid TEXT, idx INTEGER, topic TEXT, json JSON, created_at TEXT, updated_at TEXT )"
+        # status/reserved_at are used by the conversation server's reservations
+        sql_create = f"CREATE TABLE IF NOT EXISTS {self.table_name} (id INTEGER PRIMARY KEY AUTOINCREMENT, source_id INTEGER, guid TEXT, idx INTEGER, topic TEXT, json JSON, created_at TEXT, updated_at TEXT, status INTEGER DEFAULT 0, reserved_at INTEGER DEFAULT 0 )"
         self.cursor.execute(sql_create)
 
     def process_conversation_csv(self):
@@ -86,5 +137,79 @@ class ConversationDbProcessor:
         self.conn.close()
         print(Utils.get_time() + " Insert complete. Total count: "+str(row_count-1))
 
-cdp = ConversationDbProcessor()
-cdp.process_conversation_csv()
+    def read_chunks(self, max_rows=None):
+        with open(self.raw_data_path, 'r', newline='') as csv_file:
+            csv_reader = csv.reader(csv_file, delimiter=',')
+            # skip the header row
+            next(csv_reader)
+            chunk = []
+            total = 0
+            for row in csv_reader:
+                chunk.append(row)
+                total += 1
+                if len(chunk) >= self.chunk_size:
+                    yield chunk
+                    chunk = []
+                if max_rows and total >= max_rows:
+                    break
+            if chunk:
+                yield chunk
+
+    def process_conversation_csv_bulk(self, max_rows=None):
+        # Streams the CSV in chunks. Rows are converted in a process pool when
+        # workers > 1 and written with executemany, one transaction per chunk.
+        start = time.time()
+        print(Utils.get_time() + f" Starting bulk insert from {self.raw_data_path} chunk_size={self.chunk_size} workers={self.workers}...")
+        # Durability isn't needed while building the corpus; a failed import is simply rerun
+        self.cursor.execute("PRAGMA journal_mode=MEMORY")
+        self.cursor.execute("PRAGMA synchronous=OFF")
+        self.cursor.execute("PRAGMA temp_store=MEMORY")
+        self.cursor.execute("PRAGMA cache_size=-200000")
+
+        created_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        sql_insert = f"INSERT INTO {self.table_name} (source_id, json, idx, topic, guid, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)"
+        row_count = 0
+        pool = Pool(self.workers) if self.workers > 1 else None
+        try:
+            if pool:
+                converted = pool.imap(convert_chunk, ((chunk, self.source_id, created_at) for chunk in self.read_chunks(max_rows)))
+            else:
+                converted = (convert_rows(chunk, self.source_id, created_at) for chunk in self.read_chunks(max_rows))
+            for rows in converted:
+                self.cursor.executemany(sql_insert, rows)
+                self.conn.commit()
+                row_count += len(rows)
+                elapsed = time.time() - start
+                print(Utils.get_time() + f" Inserted {row_count} rows. {int(row_count / elapsed)} rows/sec")
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table_name}_guid ON {self.table_name} (guid)")
+        self.conn.commit()
+        self.conn.close()
+        elapsed = time.time() - start
+        print(Utils.get_time() + f" Bulk insert complete. Total count: {row_count} in {elapsed:.1f} seconds ({int(row_count / max(elapsed, 0.001))} rows/sec)")
+        return row_count
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import Facebook/PersonaChat CSV conversations into the conversation server database.")
+    parser.add_argument("--csv", default=ConversationDbProcessor.raw_data_path, help="Source CSV with id, Persona and chat columns.")
+    parser.add_argument("--db", default=ConversationDbProcessor.db_name, help="SQLite database to write.")
+    parser.add_argument("--bulk", action="store_true", help="Streaming bulk import for the full dataset.")
+    parser.add_argument("--max_rows", type=int, default=None, help="Stop after this many rows. Defaults to 1200 for the row-by-row import and all rows for --bulk.")
+    parser.add_argument("--chunk_size", type=int, default=ConversationDbProcessor.chunk_size, help="Rows per executemany transaction in --bulk mode.")
+    parser.add_argument("--workers", type=int, default=ConversationDbProcessor.workers, help="Processes used to convert rows in --bulk mode.")
+    args = parser.parse_args()
+
+    cdp = ConversationDbProcessor(db_name=args.db)
+    cdp.raw_data_path = args.csv
+    if args.bulk:
+        cdp.chunk_size = args.chunk_size
+        cdp.workers = args.workers
+        cdp.process_conversation_csv_bulk(max_rows=args.max_rows)
+    else:
+        if args.max_rows is not None:
+            cdp.max_rows = args.max_rows
+        cdp.process_conversation_csv()